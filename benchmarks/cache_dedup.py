@@ -0,0 +1,83 @@
+'''Storage footprint of the LLM cache: legacy pickled dict vs. deduplicated SQLite backend.
+
+Builds a synthetic cache that looks like many BuilderBot runs (system prompt + WRITE_CODE prompts embedding an
+evolving code base), then measures file size and the RSS of a fresh process that opens the cache and serves lookups.
+
+    python benchmarks/cache_dedup.py --runs 50
+'''
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from builderbot.cache import SQLiteBackend, prompt_digest  # noqa: E402
+
+SYSTEM = "You are an expert software architect and engineer.\n" * 10
+
+
+def synthetic_prompts(runs: int, files: int, iterations: int, seed: int = 0):
+    rnd = random.Random(seed)
+    for run in range(runs):
+        code_base = {f"src/module_{i}.js": "".join(f"const v{run}_{i}_{j} = {rnd.random()};\n" for j in range(60))
+                     for i in range(files)}
+        for iteration in range(iterations):
+            changed = rnd.choice(list(code_base))
+            code_base[changed] += f"// iteration {iteration}\n"
+            code_str = "".join(f"File: {name}\n{content}\n--\n" for name, content in code_base.items())
+            human = f"Your task is: task {run}\n\nHere's the current code base:\n{code_str}"
+            yield (("system", SYSTEM), ("human", human)), code_base[changed]
+
+def rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1])
+    return 0
+
+def measure(mode: str, path: str) -> dict:
+    before = rss_kb()
+    if mode == "pickle":
+        with open(path, "rb") as f: cache = pickle.load(f)
+        hits = sum(1 for k in list(cache)[:100] if cache.get(k) is not None)
+    else:
+        backend = SQLiteBackend(path)
+        hits = sum(1 for k in list(backend.keys())[:100] if backend.get(k) is not None)
+    return {"rss_kb": rss_kb(), "rss_delta_kb": rss_kb() - before, "hits": hits}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path, sqlite_path = os.path.join(tmp, "cache.pkl"), os.path.join(tmp, "cache.sqlite")
+        legacy, backend = {}, SQLiteBackend(sqlite_path)
+        items = []
+        for prompt, value in synthetic_prompts(args.runs, args.files, args.iterations):
+            legacy[tuple(content for _, content in prompt)] = value
+            items.append((prompt_digest(prompt), prompt, value))
+        with open(pickle_path, "wb") as f: pickle.dump(legacy, f)
+        backend.set_many(items)
+        stats = backend.stats()
+        backend.close()
+
+        result = {"entries": stats.entries, "logical_prompt_bytes": stats.logical_bytes,
+                  "stored_prompt_bytes": stats.stored_bytes, "dedup_ratio": round(stats.dedup_ratio, 2)}
+        for mode, path in [("pickle", pickle_path), ("sqlite", sqlite_path)]:
+            out = subprocess.run([sys.executable, __file__, "--measure", mode, path], capture_output=True, text=True, check=True)
+            result[mode] = {"file_bytes": os.path.getsize(path), **json.loads(out.stdout)}
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+'''Import time of the builderbot package, measured with `python -X importtime` in fresh interpreters.
+Exits with status 1 if the median over `--repeat` runs exceeds `--budget-ms`, or if `import builderbot` imports one of
+the heavy dependencies, so it can guard against regressions in CI.
+
+    python benchmarks/import_time.py --budget-ms 100
+    python benchmarks/import_time.py --module builderbot.builderbot --budget-ms 5000 --top 10
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules which are slow to import and mustn't be imported by `import builderbot`
+HEAVY_MODULES = ["langchain", "black", "pandas", "pkg_resources", "openai"]
+
+
+def measure(module: str) -> Tuple[Dict[str, int], List[str]]:
+    '''Cumulative import time of every imported module in microseconds, and the heavy modules which were imported'''
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    heavy = [m for m in result.stdout.strip().split(",") if m]
+    return times, heavy
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="builderbot")
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest imports of the last run")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    median_ms = statistics.median(times[args.module] for times, _ in runs) / 1000
+    times, heavy = runs[-1]
+    for name, us in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{us / 1000:>10.1f}ms  {name}")
+    print(f"import {args.module}: {median_ms:.1f}ms (median of {args.repeat}), budget {args.budget_ms:.0f}ms")
+    # the package itself must stay light, its submodules may need heavy dependencies
+    heavy = heavy if args.module == "builderbot" else []
+    if heavy: print(f"Heavy modules imported: {', '.join(heavy)}")
+    if median_ms > args.budget_ms: print("Over budget")
+    if heavy or median_ms > args.budget_ms: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
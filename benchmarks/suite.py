@@ -0,0 +1,231 @@
+'''Offline benchmark suite: microbenchmarks of the LLM cache, code base (de)serialization, prompt rendering, syntax
+validation and saving, and whole builds against a replayed model. Doesn't need an API key or network access.
+
+Results are written as JSON, and can be compared with the results of another commit:
+
+    python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/suite.py --output after.json --compare before.json
+    python benchmarks/suite.py --only build --latency 0.3 --tokens-per-second 50
+
+Builds replay a cassette which is recorded once per code base size from a scripted model, so their time is the
+simulated latency of the model plus BuilderBot's own overhead. Pass `--cassette` to replay a recording of a real
+model instead, together with the `--task` it was recorded for.
+'''
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import HumanMessage, SystemMessage  # noqa: E402
+from builderbot.builderbot import WRITE_MODES, BuilderBot, codebase_to_str  # noqa: E402
+from builderbot.cache import llm_namespace, prompt_digest  # noqa: E402
+from builderbot.inference import LLMCache  # noqa: E402
+from builderbot.output_writer import OutputWriter  # noqa: E402
+from builderbot.parser import str_to_codebase  # noqa: E402
+from builderbot.prompts import PromptRegistry, Template, template_paths  # noqa: E402
+from builderbot.replay import Cassette, ReplayLLM  # noqa: E402
+from builderbot.run_manager import RunManager  # noqa: E402
+from builderbot.stages import DevPhase, InferenceStep  # noqa: E402
+from builderbot.validation.engine import ValidationEngine  # noqa: E402
+from synthetic import REQUIREMENTS, TASK, ScriptedLLM, synthetic_codebase  # noqa: E402
+
+RESULTS_FORMAT = 1
+SYSTEM = "You are an expert software architect and engineer.\n" * 10
+
+
+def measure(function: Callable[[], Any], repeat: int, number: int = 1, setup: Optional[Callable[[], Any]] = None) -> Dict:
+    '''Seconds per call of `function`, over `repeat` rounds of `number` calls. `setup` runs untimed before each round.'''
+    times = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        for _ in range(number): function()
+        times.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "repeat": repeat, "number": number}
+
+def cache_prompt(i: int):
+    return (("system", SYSTEM), ("human", f"Your task is: task {i}\n\nHere's the current code base:\nFile: app_{i}.py\nprint({i})\n--\n"))
+
+def bench_cache(args, directory: str) -> List[Dict]:
+    results = []
+    llm = ScriptedLLM()
+    namespace = llm_namespace(llm)
+    rnd = random.Random(0)
+    for entries in args.cache_entries:
+        cache = LLMCache(llm, os.path.join(directory, f"cache_{entries}.sqlite"))
+        batch = 10_000
+        for start in range(0, entries, batch):
+            prompts = [cache_prompt(i) for i in range(start, min(start + batch, entries))]
+            cache.backend.set_many((prompt_digest(p, namespace), p, p[1][1][-20:], None) for p in prompts)
+        lookups = itertools.cycle([prompt_digest(cache_prompt(rnd.randrange(entries)), namespace) for _ in range(1000)])
+        results.append({"name": "cache.lookup", "params": {"entries": entries},
+            **measure(lambda: cache.lookup(next(lookups)), args.repeat, 1000)})
+        new = itertools.count(entries)
+        def update():
+            i = next(new)
+            cache.update([SystemMessage(content=SYSTEM), HumanMessage(content=cache_prompt(i)[1][1])], f"print({i})")
+        results.append({"name": "cache.update", "params": {"entries": entries}, **measure(update, args.repeat, 100)})
+        cache.backend.close()
+    return results
+
+def bench_codebase(args, directory: str) -> List[Dict]:
+    results = []
+    for files in args.files:
+        codebase = synthetic_codebase(files)
+        string = codebase_to_str(codebase)
+        params = {"files": files, "bytes": len(string)}
+        results.append({"name": "codebase_to_str", "params": params, **measure(lambda: codebase_to_str(codebase), args.repeat, 10)})
+        results.append({"name": "str_to_codebase", "params": params, **measure(lambda: str_to_codebase(string), args.repeat, 10)})
+    return results
+
+def bench_prompts(args, directory: str) -> List[Dict]:
+    results = []
+    registry = PromptRegistry()
+    path = template_paths(DevPhase.WRITE_CODE, InferenceStep.SIMPLE)[-1]
+    for files in args.files:
+        prompt_vars = {"task": TASK, "reqs": "\n".join(REQUIREMENTS), "code_base": codebase_to_str(synthetic_codebase(files))}
+        text = registry.template(path).text
+        results.append({"name": "prompt.parse_and_render", "params": {"files": files},
+            **measure(lambda: Template.parse(path, text).render(prompt_vars), args.repeat, 10)})
+        results.append({"name": "prompt.render_memoized", "params": {"files": files},
+            **measure(lambda: registry.render(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, **prompt_vars), args.repeat, 10)})
+    return results
+
+def bench_validation(args, directory: str) -> List[Dict]:
+    results = []
+    for files in args.files:
+        codebase = synthetic_codebase(files)
+        engine = ValidationEngine()
+        results.append({"name": "validate.cold", "params": {"files": files},
+            **measure(lambda: engine.validate(codebase), args.repeat, setup=engine.cache.clear)})
+        results.append({"name": "validate.cached", "params": {"files": files}, **measure(lambda: engine.validate(codebase), args.repeat)})
+        engine.close()
+    return results
+
+def bench_save(args, directory: str) -> List[Dict]:
+    results = []
+    for files in args.files:
+        bot = BuilderBot.__new__(BuilderBot)
+        bot.run_manager, bot.writer, bot.codebase = RunManager(), OutputWriter(), synthetic_codebase(files)
+        def fresh_output():
+            bot.writer.close()
+            bot.writer = OutputWriter()  # forgets what it wrote
+            os.chdir(tempfile.mkdtemp(dir=directory))
+        def save():
+            bot.save_codebase()
+            bot.writer.flush()
+        results.append({"name": "save_codebase.new", "params": {"files": files}, **measure(save, args.repeat, setup=fresh_output)})
+        results.append({"name": "save_codebase.unchanged", "params": {"files": files}, **measure(save, args.repeat)})
+        bot.writer.close()
+        os.chdir(directory)
+    return results
+
+def record_cassette(files: int, directory: str) -> Cassette:
+    '''Responses of the scripted model for builds of a synthetic code base in every write mode'''
+    cassette = Cassette(model_name="gpt-3.5-turbo")
+    llm = ReplayLLM(cassette=cassette, fallback=ScriptedLLM(files=files))
+    for mode in WRITE_MODES:
+        os.chdir(tempfile.mkdtemp(dir=directory))
+        BuilderBot(llm=llm, write_mode=mode).build(TASK)
+    os.chdir(directory)
+    return cassette
+
+def bench_build(args, directory: str) -> List[Dict]:
+    results = []
+    cassettes = {"recorded": Cassette(args.cassette)} if args.cassette else {}
+    for files in ([None] if args.cassette else args.build_files):
+        cassette = cassettes.get("recorded") or record_cassette(files, directory)
+        task = args.task or TASK
+        for mode in args.write_modes:
+            llm = ReplayLLM(cassette=cassette, first_token_latency=args.latency, tokens_per_second=args.tokens_per_second)
+            telemetry = []
+            def build():
+                bot = BuilderBot(llm=llm, write_mode=mode)
+                bot.build(task)
+                telemetry.append(bot.inferer.telemetry)
+            def chdir():
+                os.chdir(tempfile.mkdtemp(dir=directory))  # fresh LLM cache, run registry and output
+            timing = measure(build, args.build_repeat, setup=chdir)
+            total, = telemetry[-1].summary(group_by=())
+            results.append({"name": "build", "params": {"files": files, "write_mode": mode, "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second}, **timing, "requests": total["requests"],
+                "prompt_tokens": total["prompt_tokens"], "completion_tokens": total["completion_tokens"]})
+            os.chdir(directory)
+    return results
+
+BENCHMARKS = {"cache": bench_cache, "codebase": bench_codebase, "prompts": bench_prompts, "validation": bench_validation,
+    "save": bench_save, "build": bench_build}
+
+def metadata() -> Dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"format": RESULTS_FORMAT, "commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+        "timestamp": time.time()}
+
+def result_id(result: Dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in result["params"].items() if k != "bytes")
+    return f"{result['name']}[{params}]"
+
+def compare(results: List[Dict], baseline: List[Dict]) -> None:
+    before = {result_id(r): r["median"] for r in baseline}
+    print(f"\n{'benchmark':<72}{'before':>12}{'after':>12}{'change':>9}")
+    for result in results:
+        name = result_id(result)
+        if name not in before: continue
+        print(f"{name:<72}{before[name] * 1000:>10.3f}ms{result['median'] * 1000:>10.3f}ms{result['median'] / before[name] - 1:>+9.1%}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--files", type=int, nargs="+", default=[5, 50, 200], help="code base sizes of the microbenchmarks")
+    parser.add_argument("--cache-entries", type=int, nargs="+", default=[10_000, 100_000], help="eg 10000 100000 1000000")
+    parser.add_argument("--build-files", type=int, nargs="+", default=[5, 50], help="code base sizes of the builds")
+    parser.add_argument("--build-repeat", type=int, default=3)
+    parser.add_argument("--write-modes", nargs="+", choices=WRITE_MODES, default=WRITE_MODES)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated time to first token of the model, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="simulated token rate of the model")
+    parser.add_argument("--cassette", help="replay this recording in the builds instead of the scripted model's")
+    parser.add_argument("--task", help="task the cassette was recorded for")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)  # RunManager and the LLM cache write to the working directory
+        try:
+            for name in args.only:
+                print(f"Running {name} benchmarks", file=sys.stderr)
+                with contextlib.redirect_stdout(io.StringIO()):  # builds print their progress
+                    results += BENCHMARKS[name](args, directory)
+        finally:
+            os.chdir(cwd)
+
+    for result in results:
+        print(f"{result_id(result):<72}{result['median'] * 1000:>10.3f}ms")
+    if args.compare:
+        with open(args.compare) as f: compare(results, json.load(f)["results"])
+    if args.output:
+        with open(args.output, "w") as f: json.dump({**metadata(), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+'''Synthetic projects for the benchmarks: code bases of a realistic mix of files, and a scripted model which plays
+through a whole build of one deterministically, so its responses can be recorded on a cassette.'''
+import random
+import re
+from typing import Dict, List, Optional
+
+from langchain.chat_models.base import SimpleChatModel
+from langchain.schema import BaseMessage
+
+CodeBase = Dict[str, str]
+
+TASK = "Build a web app to manage a team's tasks, with a REST API, a database and a dashboard"
+REQUIREMENTS = ["tasks can be created, edited and deleted", "tasks have an assignee and a due date",
+    "the dashboard lists overdue tasks", "the REST API is documented"]
+# comment syntax used to mark a file as worked on, by extension
+COMMENTS = {"py": "# {}", "js": "// {}", "css": "/* {} */", "html": "<!-- {} -->", "md": "<!-- {} -->"}
+MARKER = "finished step"
+
+
+def python_module(i: int, rnd: random.Random) -> str:
+    functions = "".join(
+        f"def handle_{i}_{j}(request, limit={rnd.randint(1, 100)}):\n"
+        f"    '''Handle request {j} of resource {i}'''\n"
+        f"    items = [item for item in request.get('items', []) if item.get('id') != {j}]\n"
+        f"    return {{'status': 'ok', 'items': items[:limit]}}\n\n"
+        for j in range(rnd.randint(3, 12))
+    )
+    return f"import json\nimport os\n\nRESOURCE = 'resource_{i}'\n\n\n{functions}"
+
+def javascript_module(i: int, rnd: random.Random) -> str:
+    functions = "".join(
+        f"export async function load{i}_{j}(api) {{\n"
+        f"  const response = await api.get('/resource_{i}/{j}?limit={rnd.randint(1, 100)}');\n"
+        f"  return response.items.filter((item) => item.done !== true);\n"
+        f"}}\n\n"
+        for j in range(rnd.randint(3, 12))
+    )
+    return f"import {{ api }} from './api.js';\n\n{functions}"
+
+def stylesheet(i: int, rnd: random.Random) -> str:
+    return "".join(
+        f".widget-{i}-{j} {{\n  margin: {rnd.randint(0, 16)}px;\n  color: #{rnd.randrange(16 ** 6):06x};\n}}\n\n"
+        for j in range(rnd.randint(3, 12))
+    )
+
+def page(i: int, rnd: random.Random) -> str:
+    rows = "".join(f"      <tr><td>Task {j}</td><td>{rnd.randint(1, 28)}.06.</td></tr>\n" for j in range(rnd.randint(3, 12)))
+    return (f"<!DOCTYPE html>\n<html>\n  <head>\n    <title>Page {i}</title>\n    <link rel=\"stylesheet\" href=\"style.css\">\n"
+        f"  </head>\n  <body>\n    <table>\n{rows}    </table>\n  </body>\n</html>\n")
+
+FILE_KINDS = [("backend/resource_{}.py", python_module), ("frontend/view_{}.js", javascript_module),
+    ("frontend/styles/widget_{}.css", stylesheet), ("frontend/pages/page_{}.html", page)]
+
+def synthetic_codebase(files: int, seed: int = 0) -> CodeBase:
+    '''A code base of `files` files: a README and Python, JavaScript, CSS and HTML files of 10 to 60 lines'''
+    rnd = random.Random(seed)
+    codebase = {"README.md": f"# Tasks\n\n{TASK}.\n"}
+    for i in range(files - 1):
+        name, make = FILE_KINDS[i % len(FILE_KINDS)]
+        codebase[name.format(i)] = make(i, rnd)
+    return codebase
+
+def codebase_str(codebase: CodeBase) -> str:
+    return "".join(f"File: {name}\n{content}\n--\n" for name, content in codebase.items())
+
+def marker(file_name: str, step: int) -> str:
+    return COMMENTS.get(file_name.rsplit(".", 1)[-1], "# {}").format(f"{MARKER} {step}")
+
+def shown_files(code_base: str, file_names: List[str], numbered: bool) -> CodeBase:
+    '''Files of `file_names` which a code base summary shows in full, by name'''
+    files = {}
+    for match in re.finditer(r"^File: ([^\n]+)\n(.*?)^--$", code_base, re.MULTILINE | re.DOTALL):
+        name, body = match.group(1), match.group(2).rstrip("\n")
+        if name not in file_names or re.fullmatch(r"\(\d+ lines, not shown\)", body): continue
+        line_numbers = [int(m) for m in re.findall(r"^(\d+) ", body, re.MULTILINE)]
+        full = line_numbers == list(range(1, len(body.splitlines()) + 1)) if numbered else not line_numbers
+        if body and full: files[name] = body
+    return files
+
+
+class ScriptedLLM(SimpleChatModel):
+    '''Plays through a build of a synthetic code base of `files` files. WRITE_CODE marks every file it's shown as
+    worked on, and answers "Done" once all files were marked in `steps` iterations.'''
+    files: int = 20
+    steps: int = 2
+    seed: int = 0
+    model_name: str = "scripted"
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None) -> str:
+        prompt = messages[-1].content
+        if "translate the task into a list of requirements" in prompt:
+            return ("Requirements:\n" + "".join(f"- {r}\n" for r in REQUIREMENTS)
+                + "\nAssumptions:\n- a single team\n\nQuestions:\nno questions")
+        if "Write the test code" in prompt:
+            return codebase_str({f"tests/test_resource_{i}.py": f"def test_resource_{i}():\n    assert True\n" for i in range(3)})
+        if "Write the code" in prompt:
+            return codebase_str(synthetic_codebase(self.files, self.seed))
+        if "You're working on a single file" in prompt:
+            file_name = prompt.split("Here's its current content:\nFile: ", 1)[1].split("\n", 1)[0]
+            content = prompt.split("Here's its current content:\n", 1)[1].split("\n", 1)[1].split("\n\nFinish this file", 1)[0]
+            step = self.next_step(content)
+            return "Done" if step is None else content + "\n" + marker(file_name, step)
+        numbered = "with line numbers" in prompt
+        code_base = prompt.split("listed by name:\n", 1)[1].split("\n\nFinish the code", 1)[0]
+        response = ""
+        file_names = list(synthetic_codebase(self.files, self.seed))
+        for name, body in shown_files(code_base, file_names, numbered).items():
+            step = self.next_step(body)
+            if step is None: continue
+            if numbered:
+                last_line = int(body.splitlines()[-1].split()[0])
+                response += f"File: {name}\n@@ insert after line {last_line}\n{marker(name, step)}\n--\n"
+            else:
+                response += f"File: {name}\n{body}\n{marker(name, step)}\n--\n"
+        return response or "Done"
+
+    def next_step(self, content: str) -> Optional[int]:
+        step = content.count(MARKER) + 1
+        return step if step <= self.steps else None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
@@ -0,0 +1,63 @@
+'''Wall-clock time and tokens of the WRITE_CODE phase in each write mode: whole files in one request,
+line edits in one request, or one request per file.
+
+Uses the scripted model of the benchmark suite behind a replay model whose latency grows with the number of output
+tokens, like a real one (time to first token plus a fixed time per generated token), on a synthetic project.
+Each mode runs until the model answers "Done".
+
+    python benchmarks/write_code_fanout.py --files 24
+'''
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from builderbot.builderbot import WRITE_MODES, BuilderBot  # noqa: E402
+from builderbot.replay import Cassette, ReplayLLM  # noqa: E402
+from synthetic import MARKER, REQUIREMENTS, TASK, ScriptedLLM, synthetic_codebase  # noqa: E402
+
+
+def run(mode: str, args, directory: str) -> dict:
+    # the scripted model marks every file it's shown as finished, and answers "Done" once all files are
+    llm = ReplayLLM(cassette=Cassette(), fallback=ScriptedLLM(files=args.files, steps=1),
+        first_token_latency=args.first_token_latency, tokens_per_second=1 / args.seconds_per_token)
+    bot = BuilderBot(llm=llm, cache_filename=os.path.join(directory, f"{mode}.sqlite"), write_mode=mode,
+        context_budget=args.budget)
+    bot.inferer.max_concurrency = args.concurrency
+    codebase = synthetic_codebase(args.files)
+    reqs_str = "".join(f"- {r}\n" for r in REQUIREMENTS)
+    start = time.monotonic()
+    result = asyncio.run(bot.write_code(TASK, reqs_str, codebase))["written_codebase"]
+    seconds = time.monotonic() - start
+    bot.writer.flush()
+    totals = bot.inferer.telemetry.summary(())[0]
+    finished = sum(MARKER in content for content in result.values())
+    return {"seconds": seconds, "requests": totals["requests"], "finished": f"{finished}/{len(result)}",
+            "input_tokens": totals["prompt_tokens"], "output_tokens": totals["completion_tokens"]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=100_000, help="context budget for the code base, in tokens")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--seconds-per-token", type=float, default=0.002)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # RunManager and save_codebase write to the working directory
+        results = {mode: run(mode, args, directory) for mode in WRITE_MODES}
+
+    print(f"{'mode':<10}{'seconds':>10}{'requests':>10}{'input tokens':>14}{'output tokens':>15}{'finished files':>16}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['seconds']:>10.2f}{r['requests']:>10}{r['input_tokens']:>14}{r['output_tokens']:>15}{r['finished']:>16}")
+    for mode in ["edits", "per_file"]:
+        print(f"{mode} is {results['whole']['seconds'] / results[mode]['seconds']:.1f}x faster than whole")
+
+
+if __name__ == "__main__":
+    main()
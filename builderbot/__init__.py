@@ -1,5 +1,15 @@
-from .builderbot import BuilderBot
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .builderbot import BuilderBot
 
 __all__ = [
     "BuilderBot"
 ]
+
+def __getattr__(name: str):
+    # importing BuilderBot imports langchain, which takes seconds, so only do it when it's used
+    if name == "BuilderBot":
+        from .builderbot import BuilderBot
+        return BuilderBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,111 +1,347 @@
+import asyncio
+import copy
 import os
-import re
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, MutableMapping, Optional
 
 from dotenv import load_dotenv
 from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.base import BaseChatModel
 
+from .cache import CachePolicy, llm_namespace
+from .checkpoint import CheckpointStore
+from .code_base_summarizer import BudgetSummarizer, DetailLevel
+from .convergence import ConvergencePolicy, ConvergenceTracker
 from .inference import LLMInferer
-from .parser import str_to_codebase, str_to_project_description
+from . import models
+from .output_writer import OutputWriter
+from .parser import str_to_code_change, str_to_project_description
+from .pipeline import PhaseGraph, PhaseNode, Scheduler, memo_key
+from .prompts import phase_version
 from .run_manager import RunManager
 from .stages import DevPhase
+from .streaming import CodeBaseStreamParser
+from .telemetry import tagged
+from .tokens import context_window
+from .utils import run_sync
+from .validation.engine import ValidationEngine, validator_for
+from .validation.format import FormatError
 
 Requirements = List[str]
 CodeBase = Dict[str, str]
 
+WRITE_MODES = ["edits", "whole", "per_file"]
+
+@dataclass
+class BuildResult:
+    '''Outcome of one build of `build_many`'''
+    task: str
+    run_no: Optional[int]
+    codebase: Optional[CodeBase] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
 class BuilderBot:
 
-    def __init__(self, model_name: str ="gpt-3.5-turbo", cache_filename: Optional[str] = None) -> None:
-        load_dotenv()
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(openai_api_key=openai_api_key, model_name=model_name)
+    def __init__(self, model_name: str ="gpt-3.5-turbo", cache_filename: Optional[str] = None,
+        cache_policy: Optional[CachePolicy] = None, write_mode: str = "edits", context_budget: Optional[int] = None,
+        metrics_file: Optional[str] = None, llm: Optional[BaseChatModel] = None,
+        convergence_policy: Optional[ConvergencePolicy] = None, candidates: int = 1) -> None:
+        '''`write_mode` is "edits" to ask for line edits to the code base in each iteration, "whole" to ask for
+        all new or changed files in full, or "per_file" to rewrite each file in its own concurrent request.
+        `context_budget` is the number of tokens the code base may take up in a prompt, by default half the context window.
+        If `metrics_file` is given, the LLM call metrics are written to it in the Prometheus text format after each build.
+        `llm` is a chat model to use instead of OpenAI's `model_name`, e.g. a ReplayLLM to build offline.
+        `convergence_policy` decides how many iterations WRITE_CODE runs, see ConvergencePolicy.
+        With `candidates` > 1, STRUCTURE_CODE samples that many candidate code bases at once, critiques them together
+        and resolves them into one.'''
+        if write_mode not in WRITE_MODES: raise ValueError(f"write_mode must be one of {', '.join(WRITE_MODES)}")
+        self.write_mode = write_mode
+        self.verbose = False  # set by each build
+        self.metrics_file = metrics_file
+        self.convergence_policy = convergence_policy or ConvergencePolicy()
+        self.candidates = candidates
+        if llm is None:
+            load_dotenv()
+            llm = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model_name=model_name, streaming=True)
+        self.llm = llm
         self.run_manager = RunManager()
         self.cache_filename = cache_filename
-        self.inferer = LLMInferer(self.llm, self.run_manager, self.cache_filename)
+        # cache entries are namespaced by the model name and sampling parameters of self.llm
+        self.writer = OutputWriter()
+        self.inferer = LLMInferer(self.llm, self.run_manager, self.cache_filename, cache_policy, writer=self.writer)
+        model = getattr(self.llm, "model_name", model_name)  # budget and tokenizer of the model actually in use
+        self.summarizer = BudgetSummarizer(context_budget or context_window(model) // 2, model=model)
+        self.phase_memo: Dict = {}  # phase outputs by phase inputs, shared between builds
+        self.checkpoints: MutableMapping = {}  # saved in the run directory once a build starts
+        self.run_checkpoints: MutableMapping = {}  # the build's own state, like its task, which isn't shared
+        self.validator = ValidationEngine()
+        self.forked = False
 
     def build(self, task: str, verbose=False) -> None:
+        run_sync(self.abuild(task, verbose))
+
+    def resume(self, run_no: int, verbose=False) -> None:
+        '''Continue an interrupted build from its last checkpoint. Phases whose prompts, model and inputs didn't change
+        since they were checkpointed aren't run again, and WRITE_CODE continues after its last finished iteration.'''
+        self.run_manager.resume_run(run_no)
+        task = CheckpointStore(self.run_manager.checkpoint_dir).get("task")
+        if task is None: raise ValueError(f"Run {run_no} has no checkpoints to resume from")
+        run_sync(self.abuild(task, verbose, resume=True))
+
+    async def abuild(self, task: str, verbose=False, resume=False) -> None:
         self.task = task
         self.verbose = verbose
-        self.run_manager.start_run()
-
-        common_kwargs = {
-            "llm": self.llm,
-            "run_manager": self.run_manager,
-            "verbose": self.verbose,
-        }
-
-        # Step 1: Understand
-        project_description = self.inferer.get_simple_response(
-            DevPhase.UNDERSTAND,
-            **common_kwargs,
-            task=self.task
-        )
-        self.save_project_description(project_description)
-        self.reqs, self.assumptions, self.questions = str_to_project_description(project_description)
-        self.reqs_str = reqs_to_str(self.reqs)
+        if not resume: self.run_manager.start_run()
+        with self.run_manager.activated():
+            # phase outputs are shared with other builds through the phase memo, the build's own state is not
+            self.checkpoints = CheckpointStore(self.run_manager.checkpoint_dir, memory=self.phase_memo)
+            self.run_checkpoints = CheckpointStore(self.run_manager.checkpoint_dir)
+            self.run_checkpoints["task"] = task
+            telemetry = self.inferer.telemetry
+            telemetry.run_paths[self.run_manager.run_no] = os.path.join(self.run_manager.cache_dir, "telemetry.jsonl")
+            self.scheduler = Scheduler(self.phase_graph(), self.checkpoints)
+            status = "failed"
+            try:
+                await self.scheduler.run(task=task)
+                status = "finished"
+            finally:
+                self.writer.flush()
+                telemetry.flush()
+                if self.metrics_file: telemetry.write_prometheus(self.metrics_file)
+                for timing in self.scheduler.timings.values():
+                    self.run_manager.record_phase(timing.name, timing.started_at, timing.finished_at, timing.cached)
+                self.run_manager.finish_run(status)
+                # forks share the engine with the other builds, abuild_many closes it once they are all done
+                if not self.forked: self.validator.close()
+            print(self.scheduler.report())
+            print(telemetry.table(self.run_manager.run_no))
 
-        # Step 2.5: Setup project
+    def build_many(self, tasks: List[str], max_concurrency: int = 4, verbose=False) -> List["BuildResult"]:
+        return run_sync(self.abuild_many(tasks, max_concurrency, verbose))
 
+    async def abuild_many(self, tasks: List[str], max_concurrency: int = 4, verbose=False) -> List["BuildResult"]:
+        '''Build each task in its own run, up to `max_concurrency` at a time. The builds share the LLM, its cache and
+        the phase memo, so identical prompts in flight at the same time (eg for duplicate tasks) are sent only once.
+        A failed build doesn't stop the others; the results are in the order of `tasks`.'''
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async def build(task: str) -> BuildResult:
+            async with semaphore:
+                bot = self.fork()
+                try:
+                    await bot.abuild(task, verbose)
+                except Exception as e:
+                    print(f"Build of {task!r} failed: {type(e).__name__}: {e}")
+                    return BuildResult(task, bot.run_manager.current_run, error=e)
+                return BuildResult(task, bot.run_manager.run_no, bot.codebase)
+        try:
+            return list(await asyncio.gather(*[build(task) for task in tasks]))
+        finally:
+            self.validator.close()
 
-        # Step 3: Structure Code
-        codebase = self.inferer.get_simple_response(
-            DevPhase.STRUCTURE_CODE,
-            **common_kwargs,
-            task=self.task,
-            reqs=self.reqs
-        )
-        self.codebase = str_to_codebase(codebase)
-        self.save_codebase()
+    def fork(self) -> "BuilderBot":
+        '''A bot for another build at the same time, with its own run and build state. It shares everything else with
+        this one, like the LLM, the inferer and its cache, the phase memo, the output writer and the run database.'''
+        bot = copy.copy(self)
+        bot.run_manager = self.run_manager.fork()
+        bot.checkpoints = {}
+        bot.run_checkpoints = {}
+        bot.forked = True
+        return bot
 
-        # Step 3: Structure Tests
-        code_base_test = self.inferer.get_simple_response(
-            DevPhase.STRUCTURE_TESTS,
-            **common_kwargs,
-            task=self.task,
-            reqs=self.reqs
-        )
-        self.code_base_test = str_to_codebase(code_base_test)
+    def phase_graph(self) -> PhaseGraph:
+        '''The build pipeline. Phases run as soon as their inputs are available, so eg the code and the tests are structured in parallel'''
+        return PhaseGraph([
+            PhaseNode(DevPhase.UNDERSTAND, ["task"], ["project_description", "reqs", "reqs_str", "assumptions", "questions"],
+                self.understand, self.understood, version=self.phase_version(DevPhase.UNDERSTAND)),
+            # Step 2.5: Setup project
+            PhaseNode(DevPhase.STRUCTURE_CODE, ["task", "reqs"], ["codebase"], self.structure_code, self.structured_code,
+                version=self.phase_version(DevPhase.STRUCTURE_CODE)),
+            PhaseNode(DevPhase.STRUCTURE_TESTS, ["task", "reqs"], ["code_base_test"], self.structure_tests, self.structured_tests,
+                version=self.phase_version(DevPhase.STRUCTURE_TESTS)),
+            PhaseNode(DevPhase.WRITE_CODE, ["task", "reqs_str", "codebase"], ["written_codebase"], self.write_code, self.written_code,
+                version=self.phase_version(DevPhase.WRITE_CODE)),
+            # Step 5: Write tests
+        ])
+
+    def phase_version(self, phase: DevPhase) -> str:
+        '''Everything besides its inputs that a phase's output depends on, so that changing it invalidates checkpoints'''
+        version = f"{llm_namespace(self.llm)}/{phase_version(phase)}"
+        if phase == DevPhase.WRITE_CODE: version += f"/{self.write_mode}/{self.convergence_policy.version()}"
+        if phase == DevPhase.STRUCTURE_CODE and self.candidates > 1: version += f"/candidates={self.candidates}"
+        return version
+
+    async def understand(self, task: str) -> Dict:
+        project_description = await self.inferer.aget_streamed_response(DevPhase.UNDERSTAND, verbose=self.verbose, task=task)
+        reqs, assumptions, questions = str_to_project_description(project_description)
+        return {"project_description": project_description, "reqs": reqs, "reqs_str": reqs_to_str(reqs),
+            "assumptions": assumptions, "questions": questions}
+
+    def understood(self, outputs: Dict) -> None:
+        self.save_project_description(outputs["project_description"])
+        self.reqs, self.assumptions, self.questions = outputs["reqs"], outputs["assumptions"], outputs["questions"]
+        self.reqs_str = outputs["reqs_str"]
+
+    async def structure_code(self, task: str, reqs: Requirements) -> Dict:
+        parser = self.file_streamer()
+        if self.candidates > 1:
+            response = await self.inferer.aget_candidates_response(DevPhase.STRUCTURE_CODE, self.candidates,
+                verbose=self.verbose, task=task, reqs=reqs)
+            parser.finish(response)
+        else:
+            await self.inferer.aget_streamed_response(DevPhase.STRUCTURE_CODE, parser, verbose=self.verbose, task=task, reqs=reqs)
+        return {"codebase": parser.files}
+
+    def structured_code(self, outputs: Dict) -> None:
+        self.codebase = outputs["codebase"]
         self.save_codebase()
 
-        # Step 4: Write code
-        for i in range(10):
+    async def structure_tests(self, task: str, reqs: Requirements) -> Dict:
+        parser = CodeBaseStreamParser()
+        await self.inferer.aget_streamed_response(DevPhase.STRUCTURE_TESTS, parser, verbose=self.verbose, task=task, reqs=reqs)
+        return {"code_base_test": parser.files}
+
+    def structured_tests(self, outputs: Dict) -> None:
+        self.code_base_test = outputs["code_base_test"]
+
+    async def write_code(self, task: str, reqs_str: str, codebase: CodeBase) -> Dict:
+        # the code base is checkpointed after each iteration, so a resumed build continues where it stopped
+        key = memo_key("WRITE_CODE/iteration", {"task": task, "reqs_str": reqs_str, "codebase": codebase},
+            self.phase_version(DevPhase.WRITE_CODE))
+        checkpoint = self.run_checkpoints.get(key) or {"iteration": 0, "codebase": codebase, "previous_context": None}
+        if checkpoint["iteration"]: print(f"Resuming after iteration {checkpoint['iteration']}")
+        self.codebase = checkpoint["codebase"]
+        self.previous_context: Optional[str] = checkpoint["previous_context"]
+        # the build keeps changing its tracker, so the checkpoints get copies of it
+        convergence = copy.deepcopy(checkpoint.get("convergence")) or \
+            ConvergenceTracker(self.convergence_policy, iteration=checkpoint["iteration"])
+        convergence.start(self.codebase)
+        write_iteration = {"edits": self.write_edits, "whole": self.write_codebase, "per_file": self.write_files}[self.write_mode]
+        while not convergence.done:
+            i = convergence.iteration
             print(f"Starting iteration {i+1} " + "🫡"*(i+1))
-            codebase_str = codebase_to_str(self.codebase)
+            with tagged(iteration=i + 1):
+                new_codebase = await write_iteration(task, reqs_str, self.codebase)
+            if new_codebase is None:
+                print("We're done!")
+                break
+            merged_codebase = merge_codebases(self.codebase, new_codebase)
+            report = self.validator.validate(merged_codebase)
+            stats = convergence.observe(self.codebase, merged_codebase, len(report.failed))
+            self.codebase = merged_codebase
+            self.save_codebase()
+            print(report)
+            print(stats)
+            if stats.stop_reason: print(f"Stopping early, {stats.stop_reason}")
+            self.run_checkpoints[key] = {"iteration": convergence.iteration, "codebase": self.codebase,
+                "previous_context": self.previous_context, "convergence": copy.deepcopy(convergence)}
+        self.iteration_stats = convergence.history
+        self.writer.write(os.path.join(self.run_manager.cache_dir, "iterations.jsonl"), convergence.to_jsonl())
+        return {"written_codebase": self.codebase}
+
+    async def write_codebase(self, task: str, reqs_str: str, codebase: CodeBase) -> Optional[CodeBase]:
+        '''Ask for all new or changed files in a single request. Returns None if the code base is done.'''
+        parser = self.file_streamer()
+        new_codebase_str = await self.inferer.aget_streamed_response(
+            DevPhase.WRITE_CODE,
+            parser,
+            verbose=self.verbose,
+            task=task,
+            reqs=reqs_str,
+            code_base=self.summarize(models.CodeBase.from_dict(codebase), task, reqs_str, DetailLevel.FULL)
+        )
+        if new_codebase_str == "Done": return None
+        return parser.files
+
+    def summarize(self, codebase: models.CodeBase, task: str, reqs_str: str, max_level: DetailLevel) -> str:
+        '''Code base for a prompt: as much of it as fits into the context budget, the parts relevant to the task first'''
+        return self.summarizer.summarize(codebase, query=task + "\n" + reqs_str, max_level=max_level)
 
-            new_codebase_str = self.inferer.get_simple_response(
+    async def write_edits(self, task: str, reqs_str: str, codebase: CodeBase) -> Optional[CodeBase]:
+        '''Ask for line edits to the code base, and apply them. Returns None if the code base is done.'''
+        numbered_codebase = models.CodeBase.from_dict(codebase)
+        context = self.summarize(numbered_codebase, task, reqs_str, DetailLevel.NUMBERED)
+        # edits don't have to change the summarized code base, but repeating a prompt would apply the same edits again
+        if context == self.previous_context: return None
+        self.previous_context = context
+        try:
+            response = await self.inferer.aget_streamed_response(
                 DevPhase.WRITE_CODE,
-                **common_kwargs,
-                task=self.task,
-                reqs=self.reqs_str,
-                code_base=codebase_str
+                variant="edits",
+                verbose=self.verbose,
+                task=task,
+                reqs=reqs_str,
+                code_base=context
             )
+            if response.strip() == "Done": return None
+            change = str_to_code_change(response)
+            changed_files = numbered_codebase.with_change(change).to_dict()
+        except (FormatError, models.CodeChangeError) as e:
+            print(f"Couldn't apply edits ({e}), asking for whole files instead")
+            return await self.write_codebase(task, reqs_str, codebase)
+        return {file.name: changed_files[file.name] for file in change.files}
 
-            if new_codebase_str == "Done":
-                print("We're done!")
-                break
+    async def write_files(self, task: str, reqs_str: str, codebase: CodeBase) -> Optional[CodeBase]:
+        '''Ask for each file in its own request, with a summary of the code base as context. Returns None if all files are done.'''
+        summary = self.summarize(models.CodeBase.from_dict(codebase), task, reqs_str, DetailLevel.SIGNATURES)
+        file_names = list(codebase)
+        responses = await asyncio.gather(*[
+            self.inferer.aget_streamed_response(
+                DevPhase.WRITE_CODE,
+                variant="file",
+                verbose=self.verbose,
+                save=False,  # concurrent responses would overwrite each other's log
+                task=task,
+                reqs=reqs_str,
+                summary=summary,
+                file_name=file_name,
+                file_content=codebase[file_name]
+            )
+            for file_name in file_names
+        ])
+        # gather keeps the order of the requests, so the merge doesn't depend on which request finished first
+        new_codebase = {name: response for name, response in zip(file_names, responses) if response.strip() != "Done"}
+        return new_codebase or None
 
-            new_codebase = str_to_codebase(new_codebase_str)
-            self.codebase = merge_codebases(self.codebase, new_codebase)
-            self.save_codebase()
-  
-        # Step 5: Write tests
-        pass
+    def written_code(self, outputs: Dict) -> None:
+        self.codebase = outputs["written_codebase"]
+        self.save_codebase()
 
     def save_project_description(self, project_description: str) -> None:
-        directory = self.run_manager.output_dir
-        os.makedirs(directory, exist_ok=True)    
-        file_name = "project_description.txt"
-        file_path = os.path.join(directory, file_name)        
-        with open(file_path, 'w') as file:
-            file.write(project_description)
+        self.writer.write(os.path.join(self.run_manager.output_dir, "project_description.txt"), project_description)
 
     def save_codebase(self) -> None:
-        directory = self.run_manager.output_dir
-        os.makedirs(directory, exist_ok=True)    
+        '''Queue the code base to be written. Only files which changed since they were last saved are written again.'''
         for file_name, file_content in self.codebase.items():
-            file_path = os.path.join(directory, file_name)        
-            with open(file_path, 'w') as file:
-                file.write(file_content.strip())
+            if is_safe_path(file_name): self.save_file(file_name, file_content)
+
+    def save_file(self, file_name: str, file_content: str) -> None:
+        self.writer.write(os.path.join(self.run_manager.output_dir, file_name), file_content.strip())
+
+    def file_streamer(self) -> CodeBaseStreamParser:
+        '''Parser for a streamed code base, which checks each file as soon as it's complete. The files are only saved
+        once the response is accepted, since an attempt may still be aborted as malformed and retried.'''
+        return CodeBaseStreamParser(on_file=self.on_streamed_file)
+
+    def on_streamed_file(self, file_name: str, file_content: str) -> None:
+        problem = check_file(file_name, file_content)
+        if problem: print(f"Problem in {file_name}: {problem}")
+
+def is_safe_path(file_name: str) -> bool:
+    '''Whether a file name stays inside the output directory'''
+    normalized = os.path.normpath(file_name)
+    return bool(file_name) and not os.path.isabs(normalized) and normalized.split(os.sep)[0] != ".."
+
+def check_file(file_name: str, file_content: str) -> Optional[str]:
+    '''Quick check of a generated file. Returns a description of the problem, if any.'''
+    if not is_safe_path(file_name): return "file name points outside of the output directory"
+    validator = validator_for(file_name)
+    if validator is None: return None
+    ok, error = validator.check_syntax(file_content)
+    return None if ok else f"syntax error: {error.strip()}"
 
 def merge_codebases(old_codebase: CodeBase, new_codebase: CodeBase) -> CodeBase:
     merged_codebase = {**old_codebase, **new_codebase}
@@ -121,24 +357,3 @@ def codebase_to_str(codebase: Dict[str, str]) -> str:
 
 def reqs_to_str(reqs: List[str]) -> str:
     return "\n".join(["- " + req for req in reqs])
-
-def str_to_project_description(text: str) -> Tuple[List[str], List[str], Optional[List[str]]]:
-    sections = re.split(r'\n\n', text)
-    requirements = re.findall(r'- (.*)', sections[0])
-    assumptions = re.findall(r'- (.*)', sections[1])
-    
-    if 'no questions' in sections[2]:
-        questions = None
-    else:
-        questions = re.findall(r'- (.*)', sections[2])
-    
-    return requirements, assumptions, questions
-
-def str_to_codebase(string: str) -> Dict[str, str]:
-    files_str = string.split("--\n")
-    codebase = {}
-    for file_str in files_str:
-        if file_str:  # Skip empty strings that might result from split
-            split_file_str = file_str.split("\n", 1)
-            codebase[split_file_str[0][6:]] = split_file_str[1]
-    return codebase
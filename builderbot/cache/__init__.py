@@ -0,0 +1,45 @@
+import os
+from .base import CacheBackend, CachePolicy, StorageStats, Tags
+from .hot import CacheCounters, HotTier
+from .keys import Message, Prompt, canonicalize, llm_namespace, prompt_digest
+from .memory import MemoryBackend
+from .migration import migrate_pickle
+from .server import CacheServer, RemoteBackend
+from .sqlite import SQLiteBackend
+
+LEGACY_EXTENSIONS = (".pkl", ".pickle")
+SERVER_PREFIX = "unix:"
+
+
+def backend_from_filename(filename: str, **kwargs) -> CacheBackend:
+    '''SQLite backend stored at `filename`. Legacy pickle filenames are mapped to a sibling `.sqlite` file,
+    into which the pickle's entries are imported once. `unix:<path>` connects to a cache server on that socket.'''
+    if filename.startswith(SERVER_PREFIX):
+        return RemoteBackend(filename[len(SERVER_PREFIX):])
+    root, ext = os.path.splitext(filename)
+    if ext not in LEGACY_EXTENSIONS:
+        return SQLiteBackend(filename, **kwargs)
+    backend = SQLiteBackend(root + ".sqlite", **kwargs)
+    n = migrate_pickle(filename, backend)
+    if n: print(f"Migrated {n} entries from {filename} to {backend.filename}")
+    return backend
+
+__all__ = [
+    "backend_from_filename",
+    "canonicalize",
+    "llm_namespace",
+    "migrate_pickle",
+    "prompt_digest",
+    "CacheBackend",
+    "CacheServer",
+    "CacheCounters",
+    "CachePolicy",
+    "HotTier",
+    "MemoryBackend",
+    "Message",
+    "Prompt",
+    "RemoteBackend",
+    "SQLiteBackend",
+    "StorageStats",
+    "Tags",
+]
@@ -0,0 +1,154 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .keys import Prompt
+
+Tags = Dict[str, str]
+DELETION_LOG = 10_000  # deleted keys remembered for `deleted_since`
+
+
+@dataclass
+class CachePolicy:
+    '''Bounds of a cache. Once a bound is exceeded, entries are evicted until it holds again.
+    `eviction` decides which entries go first: "lru" (least recently used) or "ttl" (oldest, i.e. closest to expiry).
+    Entries older than `ttl` seconds are never returned.'''
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None  # prompt size + value size, before deduplication
+    ttl: Optional[float] = None
+    eviction: str = "lru"
+
+    def __post_init__(self):
+        if self.eviction not in ("lru", "ttl"):
+            raise ValueError(f"Unknown eviction strategy: {self.eviction}")
+
+    def expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and created_at + self.ttl < now
+
+    def exceeded(self, entries: int, size: int) -> bool:
+        return (self.max_entries is not None and entries > self.max_entries) \
+            or (self.max_bytes is not None and size > self.max_bytes)
+
+
+def entry_size(prompt: Prompt, value: str) -> int:
+    return sum(len(content.encode("utf-8")) for _, content in prompt) + len(value.encode("utf-8"))
+
+
+@dataclass
+class StorageStats:
+    entries: int
+    unique_messages: int
+    logical_bytes: int  # size of all prompts as if stored per entry
+    stored_bytes: int  # size of the deduplicated message store
+
+    @property
+    def dedup_ratio(self) -> float:
+        return self.logical_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+
+class CacheBackend(ABC):
+    '''Durable key-value store behind LLMCache.
+    Keys are prompt digests (see `keys.prompt_digest`), values are LLM outputs. The prompts themselves are kept
+    in a content-addressed message store, so they can be searched without being part of the key.
+    Entries can carry indexed tags (e.g. phase, inference step, prompt template and its version),
+    which make invalidating a group of entries a lookup instead of a scan.
+    Backends enforce their `policy` on write, and count evicted and expired entries in `evicted`.'''
+
+    policy: CachePolicy
+    evicted: int
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    @abstractmethod
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        '''Value of `key` and the time it was created at'''
+        pass
+
+    @abstractmethod
+    def set(self, key: str, prompt: Prompt, value: str, tags: Optional[Tags] = None) -> None:
+        pass
+
+    def set_many(self, items: Iterable[Tuple[str, Prompt, str, Optional[Tags]]]) -> int:
+        n = 0
+        for key, prompt, value, tags in items:
+            self.set(key, prompt, value, tags)
+            n += 1
+        return n
+
+    @abstractmethod
+    def prompt(self, key: str) -> Optional[Prompt]:
+        pass
+
+    @abstractmethod
+    def tags(self, key: str) -> Tags:
+        pass
+
+    @abstractmethod
+    def find(self, tags: Optional[Tags] = None, exclude: Optional[Tags] = None) -> List[str]:
+        '''Keys of entries which have all of `tags`, and which have each tag in `exclude` but with a different value'''
+        pass
+
+    def delete_tagged(self, tags: Optional[Tags] = None, exclude: Optional[Tags] = None) -> int:
+        return self.delete(self.find(tags, exclude))
+
+    @abstractmethod
+    def delete(self, keys: Iterable[str]) -> int:
+        pass
+
+    @abstractmethod
+    def keys(self) -> Iterator[str]:
+        pass
+
+    def delete_containing(self, text: str) -> int:
+        '''Delete all entries where one of the messages contains given text'''
+        return self.delete([k for k in self.keys() if any(text in content for _, content in self.prompt(k) or ())])
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def stats(self) -> StorageStats:
+        pass
+
+    @abstractmethod
+    def get_meta(self, name: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set_meta(self, name: str, value: str) -> None:
+        pass
+
+    @abstractmethod
+    def deleted_since(self, cursor: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        '''Keys deleted after `cursor`, possibly by another process, and the cursor to pass next time. The keys are
+        None if they aren't known anymore, or the cache was cleared. With no cursor, returns the current one.
+        Used to invalidate in-process copies of entries.'''
+        pass
+
+    def touch(self, keys: Iterable[str]) -> None:
+        '''Mark entries as used now, eg because they were served from an in-process copy. Their access time
+        decides which entries the "lru" policy evicts first.'''
+        pass
+
+    def acquire(self, key: str, token: str, timeout: float) -> bool:
+        '''Try to take the lease for computing the value of `key`, for at most `timeout` seconds.
+        While the lease is held, others wait for the value instead of computing it too.'''
+        return True
+
+    def release(self, key: str, token: str) -> None:
+        pass
+
+    def leased(self, key: str) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.keys())
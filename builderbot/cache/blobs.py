@@ -0,0 +1,29 @@
+import zlib
+from typing import List
+
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 16 * 1024
+BOUNDARY_MASK = 0xF
+
+
+def split_chunks(text: str) -> List[str]:
+    '''Content-defined chunking on line boundaries: a chunk ends after a line whose hash matches BOUNDARY_MASK.
+    Boundaries only depend on the lines themselves, so a large substring (e.g. a file of the code base) yields
+    the same chunks wherever it is embedded, and is stored only once.'''
+    if len(text) <= MIN_CHUNK_SIZE: return [text]
+    chunks = []
+    start = size = 0
+    for line in text.splitlines(keepends=True):
+        size += len(line)
+        if (size >= MIN_CHUNK_SIZE and zlib.crc32(line.encode("utf-8")) & BOUNDARY_MASK == 0) or size >= MAX_CHUNK_SIZE:
+            chunks.append(text[start:start + size])
+            start += size
+            size = 0
+    if size: chunks.append(text[start:])
+    return chunks
+
+def compress(data: bytes) -> bytes:
+    return zlib.compress(data)
+
+def decompress(data: bytes) -> bytes:
+    return zlib.decompress(data)
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+
+@dataclass
+class CacheCounters:
+    hits: int = 0  # including hot hits
+    hot_hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # from the backend, because of size bounds or ttl
+    hot_evictions: int = 0
+    coalesced: int = 0  # hits which waited for an identical request in flight in this process
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class HotTier:
+    '''Small in-process LRU of recently used values, in front of a backend.
+    With a `ttl`, values are served from here until `ttl` seconds after their entry was created in the backend.'''
+
+    def __init__(self, max_entries: int = 256, max_bytes: Optional[int] = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.values: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.size = 0
+        self.evicted = 0
+
+    def get(self, key: str) -> Optional[str]:
+        item = self.values.get(key)
+        if item is None: return None
+        value, created_at = item
+        if self.ttl is not None and created_at + self.ttl < time.time():
+            self.discard([key])
+            return None
+        self.values.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        if self.max_entries <= 0: return
+        self.discard([key])
+        self.values[key] = (value, time.time() if created_at is None else created_at)
+        self.size += len(value)
+        while len(self.values) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            self.discard([next(iter(self.values))])
+            self.evicted += 1
+
+    def discard(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            item = self.values.pop(key, None)
+            if item is not None: self.size -= len(item[0])
+
+    def clear(self) -> None:
+        self.values = OrderedDict()
+        self.size = 0
@@ -0,0 +1,60 @@
+import ast
+import hashlib
+import json
+import re
+from typing import Any, Iterable, Optional, Sequence, Tuple
+
+Message = Tuple[str, str]  # (role, content)
+Prompt = Tuple[Message, ...]
+
+PLAIN_TEXT_ROLE = "text"
+SAMPLING_PARAMS = ["model_name", "temperature", "max_tokens", "n", "top_p", "frequency_penalty", "presence_penalty", "stop"]
+LEGACY_MESSAGE = re.compile(r"^content=(?P<content>.*) additional_kwargs=\{.*\}(?: example=(?:True|False))?$", re.DOTALL)
+
+
+def canonical_message(msg: Any) -> Message:
+    '''(role, content) of a langchain message. Plain strings are accepted as role-less text.'''
+    if isinstance(msg, str): return (PLAIN_TEXT_ROLE, msg)
+    return (msg.type, msg.content)
+
+def canonicalize(prompt: Iterable[Any]) -> Prompt:
+    return tuple(canonical_message(msg) for msg in prompt)
+
+def digest(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def message_digest(message: Message) -> str:
+    return digest(json.dumps(message, ensure_ascii=False))
+
+def prompt_digest(prompt: Prompt, namespace: str = "") -> str:
+    '''Fixed-size cache key of a canonical prompt. The namespace separates results of different models / sampling
+    parameters; the empty namespace is used for entries of unknown origin (e.g. migrated legacy caches).'''
+    message_digests = [message_digest(m) for m in prompt]
+    if not namespace: return digest(json.dumps(message_digests))
+    return digest(json.dumps([namespace, message_digests]))
+
+def llm_namespace(llm: Any) -> str:
+    '''Model name and sampling parameters of a langchain model, e.g. `openai-chat/gpt-4/temperature=0.7`'''
+    params = {name: getattr(llm, name) for name in SAMPLING_PARAMS if getattr(llm, name, None) is not None}
+    params.update({k: v for k, v in (getattr(llm, "model_kwargs", None) or {}).items() if k in SAMPLING_PARAMS})
+    model = params.pop("model_name", None) or getattr(llm, "model", None)
+    llm_type = getattr(llm, "_llm_type", type(llm).__name__)
+    parts = [str(llm_type)] + ([str(model)] if model else [])
+    parts += [f"{k}={json.dumps(v, sort_keys=True)}" for k, v in sorted(params.items())]
+    return "/".join(parts)
+
+def parse_legacy_message(text: str, position: int) -> Message:
+    '''Legacy caches keyed prompts by `str(msg)`, which drops the message type.
+    BuilderBot prompts are always a system message followed by human messages, so the role is inferred from the position.'''
+    match = LEGACY_MESSAGE.match(text)
+    content: Optional[str] = None
+    if match:
+        try:
+            content = ast.literal_eval(match.group("content"))
+        except (ValueError, SyntaxError):
+            content = None
+    if not isinstance(content, str): return (PLAIN_TEXT_ROLE, text)
+    return ("system" if position == 0 else "human", content)
+
+def parse_legacy_key(key: Sequence[str]) -> Prompt:
+    return tuple(parse_legacy_message(text, i) for i, text in enumerate(key))
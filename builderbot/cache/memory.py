@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from typing_extensions import override
+from .base import DELETION_LOG, CacheBackend, CachePolicy, StorageStats, Tags, entry_size
+from .blobs import split_chunks
+from .keys import Message, Prompt, digest, message_digest
+
+
+class MemoryBackend(CacheBackend):
+    '''Non-persistent backend, mostly useful for tests and one-off runs.
+    Uses the same message and chunk sharing as the SQLite backend, without compression.
+    Messages and chunks are reference counted, so evicting an entry frees the parts only it used.'''
+
+    def __init__(self, policy: Optional[CachePolicy] = None):
+        self.policy = policy or CachePolicy()
+        self.evicted = 0
+        self.entries: "OrderedDict[str, Tuple[Tuple[str, ...], str]]" = OrderedDict()  # in LRU order
+        self.created: "OrderedDict[str, float]" = OrderedDict()  # in creation order
+        self.sizes: Dict[str, int] = {}
+        self.total_size = 0
+        self.messages: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        self.chunks: Dict[str, str] = {}
+        self.refs: Dict[str, int] = {}  # references to messages and chunks
+        self.entry_tags: Dict[str, Tags] = {}
+        self.tag_index: Dict[Tuple[str, str], Set[str]] = {}
+        self.meta: Dict[str, str] = {}
+        self.leases: Dict[str, Tuple[str, float]] = {}
+        self.deletions: List[Optional[str]] = []  # the latest deleted keys, None for a clear
+        self.deletions_offset = 0  # number of deletions which were dropped from `deletions`
+        self.lease_lock = threading.Lock()
+
+    @override
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        entry = self.entries.get(key)
+        if entry is None: return None
+        if self.policy.expired(self.created[key], time.time()):
+            self.evicted += self.delete([key])
+            return None
+        self.entries.move_to_end(key)
+        return entry[1], self.created[key]
+
+    @override
+    def set(self, key: str, prompt: Prompt, value: str, tags: Optional[Tags] = None) -> None:
+        self.delete([key])
+        digests = []
+        for message in prompt:
+            message_key = message_digest(message)
+            if message_key not in self.messages:
+                chunk_keys = []
+                for chunk in split_chunks(message[1]):
+                    chunk_key = digest(chunk)
+                    self.chunks.setdefault(chunk_key, chunk)
+                    self.refs[chunk_key] = self.refs.get(chunk_key, 0) + 1
+                    chunk_keys.append(chunk_key)
+                self.messages[message_key] = (message[0], tuple(chunk_keys))
+            self.refs[message_key] = self.refs.get(message_key, 0) + 1
+            digests.append(message_key)
+        self.entries[key] = (tuple(digests), value)
+        self.created[key] = time.time()
+        self.sizes[key] = entry_size(prompt, value)
+        self.total_size += self.sizes[key]
+        self.entry_tags[key] = dict(tags or {})
+        for tag in self.entry_tags[key].items():
+            self.tag_index.setdefault(tag, set()).add(key)
+        self.enforce_policy()
+
+    def enforce_policy(self) -> None:
+        if self.policy.ttl is not None:
+            now = time.time()
+            self.evicted += self.delete([k for k, created in self.created.items() if self.policy.expired(created, now)])
+        while self.entries and self.policy.exceeded(len(self.entries), self.total_size):
+            order = self.entries if self.policy.eviction == "lru" else self.created
+            self.evicted += self.delete([next(iter(order))])
+
+    @override
+    def acquire(self, key: str, token: str, timeout: float) -> bool:
+        now = time.time()
+        with self.lease_lock:
+            lease = self.leases.get(key)
+            if lease and lease[0] != token and lease[1] > now: return False
+            self.leases[key] = (token, now + timeout)
+            return True
+
+    @override
+    def release(self, key: str, token: str) -> None:
+        with self.lease_lock:
+            if self.leases.get(key, ("",))[0] == token: del self.leases[key]
+
+    @override
+    def leased(self, key: str) -> bool:
+        lease = self.leases.get(key)
+        return lease is not None and lease[1] > time.time()
+
+    def _load_message(self, message_key: str) -> Message:
+        role, chunk_keys = self.messages[message_key]
+        return (role, "".join(self.chunks[c] for c in chunk_keys))
+
+    @override
+    def prompt(self, key: str) -> Optional[Prompt]:
+        entry = self.entries.get(key)
+        return tuple(self._load_message(d) for d in entry[0]) if entry else None
+
+    @override
+    def tags(self, key: str) -> Tags:
+        return dict(self.entry_tags.get(key, {}))
+
+    @override
+    def find(self, tags: Optional[Tags] = None, exclude: Optional[Tags] = None) -> List[str]:
+        keys = set(self.entries)
+        for tag in (tags or {}).items():
+            keys &= self.tag_index.get(tag, set())
+        for name, value in (exclude or {}).items():
+            keys = {k for k in keys if self.entry_tags[k].get(name, value) != value}
+        return list(keys)
+
+    @override
+    def delete(self, keys: Iterable[str]) -> int:
+        n = 0
+        for key in list(keys):
+            entry = self.entries.pop(key, None)
+            if entry is None: continue
+            self.log_deletion(key)
+            self.total_size -= self.sizes.pop(key)
+            del self.created[key]
+            for tag in self.entry_tags.pop(key, {}).items():
+                self.tag_index[tag].discard(key)
+            for message_key in entry[0]:
+                if self._release(message_key):
+                    for chunk_key in self.messages.pop(message_key)[1]:
+                        if self._release(chunk_key): del self.chunks[chunk_key]
+            n += 1
+        return n
+
+    def _release(self, key: str) -> bool:
+        '''Drop a reference to a message or chunk. Returns whether it is unreferenced now.'''
+        self.refs[key] -= 1
+        if self.refs[key]: return False
+        del self.refs[key]
+        return True
+
+    @override
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.entries.keys()))
+
+    def log_deletion(self, key: Optional[str]) -> None:
+        self.deletions.append(key)
+        if len(self.deletions) > 2 * DELETION_LOG:
+            self.deletions_offset += len(self.deletions) - DELETION_LOG
+            self.deletions = self.deletions[-DELETION_LOG:]
+
+    @override
+    def touch(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            if key in self.entries: self.entries.move_to_end(key)
+
+    @override
+    def deleted_since(self, cursor: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        end = self.deletions_offset + len(self.deletions)
+        if cursor is None: return end, []
+        if cursor < self.deletions_offset: return end, None
+        keys = self.deletions[cursor - self.deletions_offset:]
+        return end, None if None in keys else keys
+
+    @override
+    def clear(self) -> None:
+        self.log_deletion(None)
+        self.entries = OrderedDict()
+        self.created = OrderedDict()
+        self.sizes = {}
+        self.total_size = 0
+        self.messages = {}
+        self.chunks = {}
+        self.refs = {}
+        self.entry_tags = {}
+        self.tag_index = {}
+
+    @override
+    def stats(self) -> StorageStats:
+        chunk_size = {c: len(chunk.encode("utf-8")) for c, chunk in self.chunks.items()}
+        message_size = {m: sum(chunk_size[c] for c in chunk_keys) for m, (_, chunk_keys) in self.messages.items()}
+        return StorageStats(
+            entries=len(self.entries),
+            unique_messages=len(self.messages),
+            logical_bytes=sum(message_size[d] for digests, _ in self.entries.values() for d in digests),
+            stored_bytes=sum(chunk_size.values()),
+        )
+
+    @override
+    def get_meta(self, name: str) -> Optional[str]:
+        return self.meta.get(name)
+
+    @override
+    def set_meta(self, name: str, value: str) -> None:
+        self.meta[name] = value
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,17 @@
+import os
+import pickle
+from .base import CacheBackend
+from .keys import parse_legacy_key, prompt_digest
+
+
+def migrate_pickle(pickle_file: str, backend: CacheBackend, force: bool = False) -> int:
+    '''Copy the entries of a legacy pickled cache dict into `backend`. Returns the number of imported entries.
+    Each pickle file is only imported once per backend, unless `force` is set.'''
+    if not os.path.exists(pickle_file): return 0
+    marker = "migrated:" + os.path.abspath(pickle_file)
+    if backend.get_meta(marker) is not None and not force: return 0
+    with open(pickle_file, 'rb') as f: legacy_cache = pickle.load(f)
+    prompts = ((parse_legacy_key(key), value) for key, value in legacy_cache.items())
+    n = backend.set_many((prompt_digest(prompt), prompt, value, None) for prompt, value in prompts)
+    backend.set_meta(marker, str(n))
+    return n
@@ -0,0 +1,188 @@
+'''Optional cache server, sharing one backend between processes over a Unix socket.
+
+    python -m builderbot.cache.server --socket /tmp/builderbot-cache.sock --cache cache/cache.sqlite
+
+Clients use `RemoteBackend`, or `LLMCache(llm, "unix:/tmp/builderbot-cache.sock")`.
+The protocol is one JSON object per line in both directions: `{"op": ..., "args": {...}}` and `{"result": ...}`
+or `{"error": ...}`.'''
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from typing_extensions import override
+from .base import CacheBackend, CachePolicy, StorageStats, Tags
+from .keys import Prompt
+
+OPS = {
+    "get", "get_entry", "set", "prompt", "tags", "find", "delete", "delete_containing", "keys", "clear", "stats",
+    "get_meta", "set_meta", "deleted_since", "touch", "acquire", "release", "leased", "len", "evicted", "policy",
+}
+
+
+class CacheServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, backend: CacheBackend):
+        if os.path.exists(path): os.remove(path)
+        self.backend = backend
+        self.lock = threading.Lock()
+        super().__init__(path, CacheRequestHandler)
+
+    def dispatch(self, op: str, args: Dict[str, Any]) -> Any:
+        if op not in OPS: raise ValueError(f"Unknown operation: {op}")
+        with self.lock:
+            if op == "len": return len(self.backend)
+            if op == "evicted": return self.backend.evicted
+            if op == "policy": return asdict(self.backend.policy)
+            if op == "keys": return list(self.backend.keys())
+            if op == "stats": return asdict(self.backend.stats())
+            if "prompt" in args: args["prompt"] = to_prompt(args["prompt"])
+            return getattr(self.backend, op)(**args)
+
+
+class CacheRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = {"result": self.server.dispatch(request["op"], request.get("args", {}))}
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def to_prompt(messages: Optional[List[List[str]]]) -> Optional[Prompt]:
+    return None if messages is None else tuple((role, content) for role, content in messages)
+
+
+class RemoteBackend(CacheBackend):
+    '''Client of a `CacheServer`. Each thread keeps its own connection.'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.policy = CachePolicy(**self.call("policy"))
+
+    def call(self, op: str, **args) -> Any:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            conn = self.local.conn = (sock, sock.makefile("rb"))
+        sock, reader = conn
+        sock.sendall(json.dumps({"op": op, "args": args}).encode("utf-8") + b"\n")
+        line = reader.readline()
+        if not line:
+            self.local.conn = None
+            raise ConnectionError(f"Cache server at {self.path} closed the connection")
+        response = json.loads(line)
+        if "error" in response: raise RuntimeError(response["error"])
+        return response["result"]
+
+    @property
+    def evicted(self) -> int:
+        return self.call("evicted")
+
+    @override
+    def get(self, key: str) -> Optional[str]:
+        return self.call("get", key=key)
+
+    @override
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        entry = self.call("get_entry", key=key)
+        return None if entry is None else (entry[0], entry[1])
+
+    @override
+    def set(self, key: str, prompt: Prompt, value: str, tags: Optional[Tags] = None) -> None:
+        self.call("set", key=key, prompt=prompt, value=value, tags=tags)
+
+    @override
+    def prompt(self, key: str) -> Optional[Prompt]:
+        return to_prompt(self.call("prompt", key=key))
+
+    @override
+    def tags(self, key: str) -> Tags:
+        return self.call("tags", key=key)
+
+    @override
+    def find(self, tags: Optional[Tags] = None, exclude: Optional[Tags] = None) -> List[str]:
+        return self.call("find", tags=tags, exclude=exclude)
+
+    @override
+    def delete(self, keys: Iterable[str]) -> int:
+        return self.call("delete", keys=list(keys))
+
+    @override
+    def delete_containing(self, text: str) -> int:
+        return self.call("delete_containing", text=text)
+
+    @override
+    def keys(self) -> Iterator[str]:
+        return iter(self.call("keys"))
+
+    @override
+    def clear(self) -> None:
+        self.call("clear")
+
+    @override
+    def stats(self) -> StorageStats:
+        return StorageStats(**self.call("stats"))
+
+    @override
+    def get_meta(self, name: str) -> Optional[str]:
+        return self.call("get_meta", name=name)
+
+    @override
+    def set_meta(self, name: str, value: str) -> None:
+        self.call("set_meta", name=name, value=value)
+
+    @override
+    def deleted_since(self, cursor: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        new_cursor, keys = self.call("deleted_since", cursor=cursor)
+        return new_cursor, keys
+
+    @override
+    def touch(self, keys: Iterable[str]) -> None:
+        self.call("touch", keys=list(keys))
+
+    @override
+    def acquire(self, key: str, token: str, timeout: float) -> bool:
+        return self.call("acquire", key=key, token=token, timeout=timeout)
+
+    @override
+    def release(self, key: str, token: str) -> None:
+        self.call("release", key=key, token=token)
+
+    @override
+    def leased(self, key: str) -> bool:
+        return self.call("leased", key=key)
+
+    @override
+    def close(self) -> None:
+        conn: Optional[Tuple[socket.socket, Any]] = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self.local.conn = None
+
+    def __len__(self) -> int:
+        return self.call("len")
+
+
+def main():
+    from . import backend_from_filename
+    parser = argparse.ArgumentParser(description="Share an LLM cache between processes over a Unix socket")
+    parser.add_argument("--socket", default="/tmp/builderbot-cache.sock")
+    parser.add_argument("--cache", default="cache/cache.sqlite")
+    args = parser.parse_args()
+    with CacheServer(args.socket, backend_from_filename(args.cache)) as server:
+        print(f"Serving {args.cache} on {args.socket}")
+        server.serve_forever()
+
+if __name__ == "__main__":
+    main()
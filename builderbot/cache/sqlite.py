@@ -0,0 +1,434 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from typing_extensions import override
+from .base import DELETION_LOG, CacheBackend, CachePolicy, StorageStats, Tags, entry_size
+from .blobs import compress, decompress, split_chunks
+from .keys import Prompt, message_digest, parse_legacy_key, prompt_digest
+
+SCHEMA_VERSION = 3
+DIGEST_SIZE = 32
+NGRAM_SIZE = 3
+EVICTION_BATCH = 64
+ACCESS_FLUSH_SIZE = 256
+BUSY_TIMEOUT = 60.0
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        prompt_size INTEGER NOT NULL,
+        size INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL DEFAULT 0,
+        accessed_at REAL NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS entries_by_access ON entries (accessed_at)",
+    "CREATE INDEX IF NOT EXISTS entries_by_creation ON entries (created_at)",
+    """CREATE TABLE IF NOT EXISTS entry_messages (
+        key TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        PRIMARY KEY (key, position)
+    )""",
+    "CREATE INDEX IF NOT EXISTS entry_messages_by_message ON entry_messages (message)",
+    """CREATE TABLE IF NOT EXISTS entry_tags (
+        key TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (key, name)
+    )""",
+    "CREATE INDEX IF NOT EXISTS entry_tags_by_tag ON entry_tags (name, value)",
+    # `chunks` is the concatenation of the raw sha256 digests of the message's chunks
+    """CREATE TABLE IF NOT EXISTS messages (
+        digest TEXT PRIMARY KEY,
+        role TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        chunks BLOB NOT NULL,
+        refs INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS chunks (
+        digest BLOB PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        refs INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    # the latest deleted keys, NULL for a clear, so other processes can drop their copies of them
+    "CREATE TABLE IF NOT EXISTS deletions (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT)",
+    # single-flight: a process computing the value of `key` holds its lease until it stored the value
+    "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)",
+    # running totals, so checking the size bounds doesn't need a scan
+    "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, size INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO totals (id, entries, size) SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries",
+    """CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+        UPDATE totals SET entries = entries + 1, size = size + NEW.size;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+        UPDATE totals SET entries = entries - 1, size = size - OLD.size;
+    END""",
+]
+
+# schema 2 had neither size bounds nor reference counts
+SCHEMA_2_UPGRADE = [
+    "ALTER TABLE entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE entries ADD COLUMN created_at REAL NOT NULL DEFAULT 0",
+    "ALTER TABLE entries ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0",
+    "UPDATE entries SET size = prompt_size + length(CAST(value AS BLOB))",
+    "ALTER TABLE messages ADD COLUMN refs INTEGER NOT NULL DEFAULT 0",
+    "UPDATE messages SET refs = (SELECT COUNT(*) FROM entry_messages WHERE message = messages.digest)",
+    "ALTER TABLE chunks ADD COLUMN refs INTEGER NOT NULL DEFAULT 0",
+]
+
+# contentless full-text index of message contents, rowid = messages.rowid
+NGRAM_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS message_ngrams USING fts5(content, tokenize='trigram', content='')"
+
+
+def split_digests(data: bytes) -> List[bytes]:
+    return [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+
+
+class SQLiteBackend(CacheBackend):
+    '''Stores one row per cache entry, so an update is a few single-row inserts instead of a rewrite of the whole cache.
+    Values are only read from disk when requested.
+    Messages are content-addressed and split into content-defined chunks, so the system prompt and the files of a
+    code base embedded in many prompts are stored once. Both are reference counted and dropped with their last entry.
+    With `ngram_index`, message contents are indexed by trigrams, so `delete_containing` only has to check
+    messages which contain all trigrams of the searched text. Once a file has the index, every connection keeps it
+    up to date, whether it asked for it or not.
+    Access times are buffered in memory and written with the next update, so cache hits don't cause writes.
+    Several processes can share one file: it uses WAL journaling, so readers never block, and writers serialize on
+    BEGIN IMMEDIATE transactions.'''
+
+    def __init__(self, filename: str, ngram_index: bool = False, policy: Optional[CachePolicy] = None):
+        self.filename = filename
+        self.policy = policy or CachePolicy()
+        self.evicted = 0
+        directory = os.path.dirname(filename)
+        if directory: os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.depth = 0
+        # autocommit mode, transactions are managed by `transaction`
+        self.conn = sqlite3.connect(filename, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        if filename != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.accessed: Dict[str, float] = {}
+        self.ngram_index = False
+        self.create_schema()
+        self.ngram_index = self.create_ngram_index() if ngram_index else self.has_ngram_index()
+        if self.policy.ttl is not None or self.policy.max_entries is not None or self.policy.max_bytes is not None:
+            with self.transaction(): self.enforce_policy()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        '''Write transaction. BEGIN IMMEDIATE takes the database write lock up front, so concurrent writers
+        wait for each other (up to BUSY_TIMEOUT) instead of failing when upgrading a read to a write.'''
+        with self.lock:
+            if self.depth:
+                yield
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.depth += 1
+            try:
+                # another connection may have created the index, which all writers have to keep up to date
+                if not self.ngram_index: self.ngram_index = self.has_ngram_index()
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+            finally:
+                self.depth -= 1
+
+    def create_schema(self) -> None:
+        with self.transaction():
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+            legacy_rows: List[Tuple[str, str]] = []
+            if version < 2 and "messages" in columns:
+                # schema 1 keyed entries by a hash of the json-encoded `str(msg)` list
+                legacy_rows = self.conn.execute("SELECT messages, value FROM entries").fetchall()
+                self.conn.execute("DROP TABLE entries")
+            elif version == 2:
+                now = time.time()
+                for statement in SCHEMA_2_UPGRADE:
+                    self.conn.execute(statement)
+                self.conn.execute("UPDATE entries SET created_at = ?, accessed_at = ?", (now, now))
+                refs: Dict[bytes, int] = {}
+                for (chunk_digests,) in self.conn.execute("SELECT chunks FROM messages"):
+                    for d in split_digests(chunk_digests): refs[d] = refs.get(d, 0) + 1
+                self.conn.executemany("UPDATE chunks SET refs = ? WHERE digest = ?", [(n, d) for d, n in refs.items()])
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if legacy_rows:
+            prompts = [parse_legacy_key(json.loads(messages)) for messages, _ in legacy_rows]
+            self.set_many((prompt_digest(p), p, value, None) for p, (_, value) in zip(prompts, legacy_rows))
+
+    def has_ngram_index(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'message_ngrams'").fetchone() is not None
+
+    def create_ngram_index(self) -> bool:
+        '''Create and fill the trigram index, if this SQLite build supports it'''
+        with self.lock:
+            if self.has_ngram_index(): return True
+            try:
+                with self.transaction():
+                    self.conn.execute(NGRAM_SCHEMA)
+                    for rowid, message in self.conn.execute("SELECT rowid, digest FROM messages").fetchall():
+                        self.conn.execute("INSERT INTO message_ngrams (rowid, content) VALUES (?, ?)",
+                                          (rowid, self._load_message(message)[1]))
+            except sqlite3.OperationalError:
+                return False
+        return True
+
+    @override
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None: return None
+            if self.policy.expired(row[1], now):
+                self.evicted += self.delete([key])
+                return None
+            self.accessed[key] = now
+            if len(self.accessed) >= ACCESS_FLUSH_SIZE:
+                with self.transaction(): self.flush_access_times()
+        return row[0], row[1]
+
+    @override
+    def touch(self, keys: Iterable[str]) -> None:
+        now = time.time()
+        with self.lock:
+            for key in keys: self.accessed[key] = now
+            if len(self.accessed) >= ACCESS_FLUSH_SIZE:
+                with self.transaction(): self.flush_access_times()
+
+    def flush_access_times(self) -> None:
+        self.conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(t, k) for k, t in self.accessed.items()])
+        self.accessed = {}
+
+    @override
+    def set(self, key: str, prompt: Prompt, value: str, tags: Optional[Tags] = None) -> None:
+        self.set_many([(key, prompt, value, tags)])
+
+    @override
+    def set_many(self, items: Iterable[Tuple[str, Prompt, str, Optional[Tags]]]) -> int:
+        n = 0
+        now = time.time()
+        with self.transaction():
+            for key, prompt, value, tags in items:
+                self._delete_entry(key)
+                digests = [self._store_message(role, content) for role, content in prompt]
+                self.conn.executemany(
+                    "INSERT INTO entry_messages (key, position, message) VALUES (?, ?, ?)",
+                    [(key, i, d) for i, d in enumerate(digests)],
+                )
+                self.conn.executemany(
+                    "INSERT INTO entry_tags (key, name, value) VALUES (?, ?, ?)",
+                    [(key, name, tag_value) for name, tag_value in (tags or {}).items()],
+                )
+                self.conn.execute(
+                    "INSERT INTO entries (key, value, prompt_size, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, sum(len(c.encode("utf-8")) for _, c in prompt), entry_size(prompt, value), now, now),
+                )
+                n += 1
+            self.flush_access_times()
+            self.enforce_policy()
+        return n
+
+    def enforce_policy(self) -> None:
+        if self.policy.ttl is not None:
+            expired = self.conn.execute("SELECT key FROM entries WHERE created_at < ?", (time.time() - self.policy.ttl,))
+            self.evicted += sum(self._delete_entry(key) for (key,) in expired.fetchall())
+        order = "accessed_at" if self.policy.eviction == "lru" else "created_at"
+        while self.policy.exceeded(*self.conn.execute("SELECT entries, size FROM totals").fetchone()):
+            victims = self.conn.execute(f"SELECT key FROM entries ORDER BY {order} LIMIT ?", (EVICTION_BATCH,)).fetchall()
+            if not victims: break
+            for (key,) in victims:
+                self.evicted += self._delete_entry(key)
+                if not self.policy.exceeded(*self.conn.execute("SELECT entries, size FROM totals").fetchone()): break
+
+    def _store_message(self, role: str, content: str) -> str:
+        message = message_digest((role, content))
+        if self.conn.execute("UPDATE messages SET refs = refs + 1 WHERE digest = ?", (message,)).rowcount:
+            return message
+        chunks = [chunk.encode("utf-8") for chunk in split_chunks(content)]
+        chunk_digests = [hashlib.sha256(chunk).digest() for chunk in chunks]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO chunks (digest, data, size) VALUES (?, ?, ?)",
+            [(d, compress(chunk), len(chunk)) for d, chunk in zip(chunk_digests, chunks)],
+        )
+        self.conn.executemany("UPDATE chunks SET refs = refs + 1 WHERE digest = ?", [(d,) for d in chunk_digests])
+        rowid = self.conn.execute(
+            "INSERT INTO messages (digest, role, size, chunks, refs) VALUES (?, ?, ?, ?, 1)",
+            (message, role, sum(len(chunk) for chunk in chunks), b"".join(chunk_digests)),
+        ).lastrowid
+        if self.ngram_index:
+            self.conn.execute("INSERT INTO message_ngrams (rowid, content) VALUES (?, ?)", (rowid, content))
+        return message
+
+    def _load_message(self, message: str) -> Tuple[str, str]:
+        role, chunk_digests = self.conn.execute("SELECT role, chunks FROM messages WHERE digest = ?", (message,)).fetchone()
+        content = b""
+        for d in split_digests(chunk_digests):
+            content += decompress(self.conn.execute("SELECT data FROM chunks WHERE digest = ?", (d,)).fetchone()[0])
+        return (role, content.decode("utf-8"))
+
+    def _delete_entry(self, key: str) -> int:
+        '''Delete an entry and release its messages. Must be called inside a transaction.'''
+        self.accessed.pop(key, None)
+        if not self.conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount: return 0
+        self._log_deletion(key)
+        messages = self.conn.execute("SELECT message FROM entry_messages WHERE key = ?", (key,)).fetchall()
+        self.conn.execute("DELETE FROM entry_messages WHERE key = ?", (key,))
+        self.conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+        for (message,) in messages:
+            self.conn.execute("UPDATE messages SET refs = refs - 1 WHERE digest = ?", (message,))
+            rowid, refs, chunk_digests = self.conn.execute(
+                "SELECT rowid, refs, chunks FROM messages WHERE digest = ?", (message,)
+            ).fetchone()
+            if refs > 0: continue
+            if self.ngram_index:
+                self.conn.execute("INSERT INTO message_ngrams (message_ngrams, rowid, content) VALUES ('delete', ?, ?)",
+                                  (rowid, self._load_message(message)[1]))
+            self.conn.execute("DELETE FROM messages WHERE rowid = ?", (rowid,))
+            for d in split_digests(chunk_digests):
+                self.conn.execute("UPDATE chunks SET refs = refs - 1 WHERE digest = ?", (d,))
+                self.conn.execute("DELETE FROM chunks WHERE digest = ? AND refs <= 0", (d,))
+        return 1
+
+    def _log_deletion(self, key: Optional[str]) -> None:
+        seq = self.conn.execute("INSERT INTO deletions (key) VALUES (?)", (key,)).lastrowid
+        if seq % DELETION_LOG == 0: self.conn.execute("DELETE FROM deletions WHERE seq <= ?", (seq - DELETION_LOG,))
+
+    @override
+    def deleted_since(self, cursor: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        with self.lock:
+            if cursor is None:
+                return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM deletions").fetchone()[0], []
+            rows = self.conn.execute("SELECT seq, key FROM deletions WHERE seq > ? ORDER BY seq", (cursor,)).fetchall()
+        if not rows: return cursor, []
+        keys = [key for _, key in rows]
+        complete = rows[0][0] == cursor + 1 and None not in keys  # older deletions may have been dropped
+        return rows[-1][0], keys if complete else None
+
+    @override
+    def acquire(self, key: str, token: str, timeout: float) -> bool:
+        now = time.time()
+        with self.transaction():
+            row = self.conn.execute("SELECT token, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != token and row[1] > now: return False
+            self.conn.execute("INSERT OR REPLACE INTO leases (key, token, expires_at) VALUES (?, ?, ?)", (key, token, now + timeout))
+            return True
+
+    @override
+    def release(self, key: str, token: str) -> None:
+        with self.transaction():
+            self.conn.execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    @override
+    def leased(self, key: str) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone() is not None
+
+    @override
+    def prompt(self, key: str) -> Optional[Prompt]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT message FROM entry_messages WHERE key = ? ORDER BY position", (key,)
+            ).fetchall()
+            if not rows and self.get(key) is None: return None
+            return tuple(self._load_message(message) for (message,) in rows)
+
+    @override
+    def tags(self, key: str) -> Tags:
+        with self.lock:
+            return dict(self.conn.execute("SELECT name, value FROM entry_tags WHERE key = ?", (key,)).fetchall())
+
+    @override
+    def find(self, tags: Optional[Tags] = None, exclude: Optional[Tags] = None) -> List[str]:
+        # the first condition selects rows by the tag index, the others are checked per key by primary key
+        conditions = [(name, "=", value) for name, value in (tags or {}).items()]
+        conditions += [(name, "!=", value) for name, value in (exclude or {}).items()]
+        if not conditions: return list(self.keys())
+        joins = "".join(f" JOIN entry_tags t{i} ON t{i}.key = t0.key AND t{i}.name = ? AND t{i}.value {op} ?"
+                        for i, (_, op, _) in enumerate(conditions[1:], start=1))
+        query = f"SELECT t0.key FROM entry_tags t0{joins} WHERE t0.name = ? AND t0.value {conditions[0][1]} ?"
+        params = [p for name, _, value in conditions[1:] + conditions[:1] for p in (name, value)]
+        with self.lock:
+            return [key for (key,) in self.conn.execute(query, params)]
+
+    @override
+    def delete(self, keys: Iterable[str]) -> int:
+        with self.transaction():
+            return sum(self._delete_entry(key) for key in keys)
+
+    @override
+    def delete_containing(self, text: str) -> int:
+        with self.lock:
+            if self.ngram_index and len(text) >= NGRAM_SIZE:
+                candidates = self.conn.execute("""
+                    SELECT messages.digest FROM message_ngrams JOIN messages ON messages.rowid = message_ngrams.rowid
+                    WHERE message_ngrams MATCH ?
+                """, ('"' + text.replace('"', '""') + '"',)).fetchall()
+            else:
+                candidates = self.conn.execute("SELECT digest FROM messages").fetchall()
+            messages = [m for (m,) in candidates if text in self._load_message(m)[1]]
+            keys = [key for m in messages
+                    for (key,) in self.conn.execute("SELECT key FROM entry_messages WHERE message = ?", (m,))]
+            return self.delete(set(keys))
+
+    @override
+    def keys(self) -> Iterator[str]:
+        with self.lock:
+            rows = self.conn.execute("SELECT key FROM entries").fetchall()
+        return (key for (key,) in rows)
+
+    @override
+    def clear(self) -> None:
+        with self.transaction():
+            for table in ["entries", "entry_messages", "entry_tags", "messages", "chunks"]:
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("UPDATE totals SET entries = 0, size = 0")
+            self._log_deletion(None)
+            if self.ngram_index:
+                self.conn.execute("INSERT INTO message_ngrams (message_ngrams) VALUES ('delete-all')")
+            self.accessed = {}
+
+    @override
+    def stats(self) -> StorageStats:
+        with self.lock:
+            entries, logical_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(prompt_size), 0) FROM entries").fetchone()
+            unique_messages = self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            stored_bytes = self.conn.execute("SELECT COALESCE(SUM(length(data)), 0) FROM chunks").fetchone()[0]
+        return StorageStats(entries, unique_messages, logical_bytes, stored_bytes)
+
+    @override
+    def get_meta(self, name: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    @override
+    def set_meta(self, name: str, value: str) -> None:
+        with self.transaction():
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    @override
+    def close(self) -> None:
+        with self.lock:
+            if self.accessed:
+                with self.transaction(): self.flush_access_times()
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT entries FROM totals").fetchone()[0]
@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from typing import List
+
+from .stages import DevPhase
+from .streaming import CodeBaseStreamParser
+from .validation.engine import validator_for
+from .validation.format import CodeBaseValidator, FormatError, format_validator
+
+
+@dataclass
+class Candidate:
+    '''One sampled response, with a score from cheap local checks: 0 if it isn't in the output format of its prompt,
+    otherwise 1 plus the fraction of its files which pass the syntax check (if it's a code base)'''
+    text: str
+    score: float = 0.0
+    problems: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        if not self.problems: return "passes all local checks"
+        return "; ".join(self.problems)
+
+
+def score_candidate(phase: DevPhase, text: str, variant: str = "") -> Candidate:
+    candidate = Candidate(text)
+    validator = format_validator(phase, variant)
+    if validator is not None:
+        try:
+            validator.validate(text)
+        except FormatError as e:
+            candidate.problems.append(f"malformed: {e}")
+            return candidate
+    candidate.score = 1.0
+    if not isinstance(validator, CodeBaseValidator) or text.strip() == "Done": return candidate
+    parser = CodeBaseStreamParser()
+    parser.finish(text)
+    checked = passed = 0
+    for file_name, content in parser.files.items():
+        syntax_validator = validator_for(file_name)
+        if syntax_validator is None: continue
+        checked += 1
+        ok, error = syntax_validator.check_syntax(content)
+        if ok:
+            passed += 1
+        else:
+            first_line = (error or "").strip().split("\n")[0]
+            candidate.problems.append(f"syntax error in {file_name}: {first_line}")
+    if checked: candidate.score += passed / checked
+    return candidate
+
+def rank_candidates(phase: DevPhase, texts: List[str], variant: str = "") -> List[Candidate]:
+    '''Distinct candidates, best first. Candidates with the same score keep their order.'''
+    distinct = list(dict.fromkeys(texts))
+    return sorted((score_candidate(phase, text, variant) for text in distinct), key=lambda c: -c.score)
+
+def candidates_to_str(candidates: List[Candidate]) -> str:
+    return "\n".join(
+        f"Candidate {i} ({candidate.summary()}):\n{candidate.text}\n" for i, candidate in enumerate(candidates, start=1)
+    )
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Any, Dict, Iterator, MutableMapping, Optional
+
+# bump when the layout of checkpointed values changes, so old checkpoints are ignored instead of misread
+CHECKPOINT_FORMAT = 1
+SUFFIX = ".ckpt"
+
+
+class CheckpointStore(MutableMapping):
+    '''Phase outputs of one run, saved in the run's directory so that an interrupted build can be resumed.
+
+    Used as the memo of the build's `Scheduler`: keys already encode the phase's inputs, prompt templates and model,
+    so a checkpoint only matches if none of them changed. Each value is pickled into its own file, which is
+    replaced atomically. `memory` is an optional in-memory layer in front of the files, eg shared between builds.'''
+
+    def __init__(self, directory: str, memory: Optional[Dict[str, Any]] = None):
+        self.directory = directory
+        self.memory = memory if memory is not None else {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest()[:32] + SUFFIX)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.memory:
+            # the value may come from another build, so make sure this run has it too
+            if not os.path.exists(self.path(key)): self.save(key, self.memory[key])
+            return self.memory[key]
+        checkpoint = self.load(self.path(key))
+        if checkpoint is None or checkpoint["key"] != key: raise KeyError(key)
+        self.memory[key] = checkpoint["value"]
+        return checkpoint["value"]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.save(key, value)
+        self.memory[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        self.memory.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith(SUFFIX): continue
+            checkpoint = self.load(os.path.join(self.directory, file_name))
+            if checkpoint is not None: yield checkpoint["key"]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def save(self, key: str, value: Any) -> None:
+        data = pickle.dumps({"format": CHECKPOINT_FORMAT, "key": key, "value": value})
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file: file.write(data)
+        os.replace(temp_path, self.path(key))
+
+    @staticmethod
+    def load(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "rb") as file: checkpoint = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if not isinstance(checkpoint, dict) or checkpoint.get("format") != CHECKPOINT_FORMAT: return None
+        return checkpoint
@@ -0,0 +1,211 @@
+'''Summaries of a code base for prompt context, at several levels of detail'''
+import ast
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import IntEnum
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .models import CodeBase, CodeFile
+from .tokens import count_tokens
+
+
+class DetailLevel(IntEnum):
+    '''How much of a file a summary shows, from least to most'''
+    FILE_NAME = 0
+    SIGNATURES = 1  # imports, definitions and docstrings, with their line numbers
+    NUMBERED = 2  # full text with line numbers
+    FULL = 3  # full text
+
+
+class CodeBaseSummarizer(ABC):
+    @abstractmethod
+    def summarize(self, code_base: CodeBase) -> str:
+        pass
+
+
+class SimpleSummarizer(CodeBaseSummarizer):
+    '''Every file in full, with line numbers'''
+
+    def summarize(self, code_base: CodeBase) -> str:
+        return "".join(f"{file.name}:\n{file.content.numbered()}\n" for file in code_base.files)
+
+
+class BudgetSummarizer(CodeBaseSummarizer):
+    '''Fits a code base into `budget` tokens. Every file is listed; relevant files get as much detail as fits; the
+    most relevant other files get full detail within `focus_share` of the budget; then the remaining files get
+    more detail one level at a time, most relevant first. Summaries are cached by file content.'''
+
+    def __init__(self, budget: int, max_level: DetailLevel = DetailLevel.NUMBERED, model: Optional[str] = None,
+        focus_share: float = 0.5, cache_size: int = 4096):
+        self.budget = budget
+        self.focus_share = focus_share
+        self.max_level = max_level
+        self.model = model
+        self.cache_size = cache_size
+        self.cache: OrderedDict[Tuple[str, DetailLevel], Tuple[str, int]] = OrderedDict()
+        self.words_cache: OrderedDict[str, Set[str]] = OrderedDict()
+
+    def summarize(self, code_base: CodeBase, query: str = "", relevant: Iterable[str] = (),
+        max_level: Optional[DetailLevel] = None) -> str:
+        '''`query` (eg the task) and the names of `relevant` files decide which files are shown in more detail'''
+        max_level = self.max_level if max_level is None else max_level
+        relevant = set(relevant)
+        files = self.rank(code_base.files, query, relevant)
+        levels: Dict[str, DetailLevel] = {}
+        used = 0
+        for file in files:  # list as many files as fit
+            tokens = self.summary(file, DetailLevel.FILE_NAME)[1]
+            if used + tokens > self.budget: break
+            levels[file.name], used = DetailLevel.FILE_NAME, used + tokens
+
+        def upgrade(file: CodeFile, level: DetailLevel, budget: float = self.budget) -> bool:
+            nonlocal used
+            if file.name not in levels or levels[file.name] >= level: return False
+            extra = self.summary(file, level)[1] - self.summary(file, levels[file.name])[1]
+            if used + extra > budget: return False
+            levels[file.name], used = level, used + extra
+            return True
+
+        for file in files:
+            if file.name not in relevant: continue
+            any(upgrade(file, level) for level in reversed(range(DetailLevel.SIGNATURES, max_level + 1)))
+        for file in files:
+            upgrade(file, max_level, self.budget * self.focus_share)
+        for level in range(DetailLevel.SIGNATURES, max_level + 1):
+            for file in files: upgrade(file, DetailLevel(level))
+
+        summary = "".join(self.summary(file, levels[file.name])[0] for file in code_base.files if file.name in levels)
+        if len(levels) < len(code_base.files): summary += f"... and {len(code_base.files) - len(levels)} more files\n"
+        return summary
+
+    def rank(self, files: List[CodeFile], query: str, relevant: Set[str]) -> List[CodeFile]:
+        '''Files by relevance: explicitly relevant files first, then by the words they share with the query'''
+        query_words = words(query)
+        def score(item: Tuple[int, CodeFile]):
+            i, file = item
+            return (file.name not in relevant, -len(query_words & self.words(file)), i)
+        return [file for _, file in sorted(enumerate(files), key=score)]
+
+    def summary(self, file: CodeFile, level: DetailLevel) -> Tuple[str, int]:
+        '''Summary of a file and its number of tokens'''
+        key = (digest(file), level)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        text = summarize_file(file, level)
+        self.cache[key] = result = (text, count_tokens(text, self.model))
+        if len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+        return result
+
+    def words(self, file: CodeFile) -> Set[str]:
+        key = digest(file)
+        if key not in self.words_cache:
+            self.words_cache[key] = words(file.name + "\n" + str(file.content))
+            if len(self.words_cache) > self.cache_size: self.words_cache.popitem(last=False)
+        return self.words_cache[key]
+
+
+def digest(file: CodeFile) -> str:
+    return hashlib.sha256(f"{file.name}\0{file.content}".encode("utf-8")).hexdigest()
+
+def words(text: str) -> Set[str]:
+    '''Lower-case words, also split at camelCase and snake_case boundaries'''
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return {word for word in re.findall(r"[a-z][a-z0-9]{2,}", text.lower())}
+
+def summarize_file(file: CodeFile, level: DetailLevel) -> str:
+    '''The file as a "File: <name>" block closed by "--", like the code bases in the prompts'''
+    lines = [line.content for line in file.content.lines()]
+    if level == DetailLevel.FILE_NAME: body = f"({len(lines)} lines, not shown)\n"
+    elif level == DetailLevel.FULL: body = "".join(line + "\n" for line in lines)
+    elif level == DetailLevel.NUMBERED: body = file.content.numbered()
+    else: body = "".join(str(n).ljust(4) + lines[n - 1] + "\n" for n in signature_lines(file.name, lines))
+    return f"File: {file.name}\n{body}--\n"
+
+def signature_lines(file_name: str, lines: List[str]) -> List[int]:
+    '''Line numbers (1-based) of the lines which outline a file: imports, definitions, docstrings, ...'''
+    extension = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+    if extension == "py":
+        try:
+            return python_signature_lines("\n".join(lines))
+        except SyntaxError:
+            pass
+    elif extension in ("js", "mjs", "cjs", "jsx", "ts", "tsx"):
+        return block_signature_lines(lines, max_depth=1)
+    elif extension in ("css", "scss", "less"):
+        return block_signature_lines(lines, max_depth=1)
+    elif extension in ("html", "htm", "vue"):
+        return markup_signature_lines(lines)
+    return [i for i, line in enumerate(lines, 1) if re.match(r"\S.*\w", line)]  # top-level lines
+
+def python_signature_lines(code: str) -> List[int]:
+    tree = ast.parse(code)
+    result: Set[int] = set()
+    def docstring(node):
+        if ast.get_docstring(node, clean=False) is not None: result.add(node.body[0].lineno)
+    def visit(body: List[ast.stmt], depth: int):
+        for node in body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)) and depth == 0:
+                result.update(range(node.lineno, node.end_lineno + 1))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                result.update(range(start, max(node.body[0].lineno, node.lineno + 1)))  # decorators and signature
+                docstring(node)
+                if isinstance(node, ast.ClassDef): visit(node.body, depth + 1)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and depth <= 1:
+                result.add(node.lineno)  # module constants, class attributes
+    docstring(tree)
+    visit(tree.body, 0)
+    return sorted(result)
+
+def block_depths(lines: List[str]) -> List[int]:
+    '''Nesting depth of {} blocks at the start of each line, ignoring strings and comments'''
+    depths, depth, quote, in_comment = [], 0, None, False
+    for line in lines:
+        depths.append(depth)
+        i = 0
+        while i < len(line):
+            char, pair = line[i], line[i:i + 2]
+            if in_comment:
+                if pair == "*/": in_comment, i = False, i + 1
+            elif quote:
+                if char == "\\": i += 1
+                elif char == quote: quote = None
+            elif pair == "/*": in_comment, i = True, i + 1
+            elif pair == "//": break
+            elif char in "'\"`": quote = char
+            elif char == "{": depth += 1
+            elif char == "}": depth = max(depth - 1, 0)
+            i += 1
+        if quote != "`": quote = None  # only template literals span lines
+    return depths
+
+def block_signature_lines(lines: List[str], max_depth: int, offset: int = 0) -> List[int]:
+    '''Top-level lines, plus nested lines which open a block (functions, methods, rules) or a doc comment'''
+    result = []
+    for i, (line, depth) in enumerate(zip(lines, block_depths(lines)), 1):
+        stripped = line.strip()
+        if not re.search(r"\w", stripped): continue
+        if depth == 0 and not stripped.startswith(("}", "*")) or \
+            depth <= max_depth and (stripped.endswith("{") or stripped.startswith("/**")):
+            result.append(i + offset)
+    return result
+
+STRUCTURAL_TAG = re.compile(r"<(/?)(html|head|body|title|main|header|footer|nav|section|article|form|template|script|style|link|meta|h[1-6])\b"
+    r"|<\w[^>]*\b(id|src|href)=", re.IGNORECASE)
+
+def markup_signature_lines(lines: List[str]) -> List[int]:
+    '''Structural tags, plus the outline of inline scripts and styles (as in Vue single file components)'''
+    result, block_start, block_kind = [], None, None
+    for i, line in enumerate(lines):
+        match = STRUCTURAL_TAG.search(line)
+        if match: result.append(i + 1)
+        tag = match.group(2).lower() if match and match.group(2) else None
+        if block_kind is None and tag in ("script", "style") and not match.group(1) and "</" + tag not in line.lower():
+            block_start, block_kind = i + 1, tag
+        elif block_kind is not None and tag == block_kind and match.group(1):
+            # Vue components nest their methods one level deeper, inside `export default {`
+            result += block_signature_lines(lines[block_start:i], 2 if block_kind == "script" else 1, block_start)
+            block_kind = None
+    return sorted(set(result))
@@ -0,0 +1,137 @@
+import difflib
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+CodeBase = Dict[str, str]
+
+
+@dataclass
+class ConvergencePolicy:
+    '''How many WRITE_CODE iterations to run. Starts with a budget of `max_iterations`. An iteration which changes less
+    than `min_change_ratio` of the lines, with no files failing validation, leaves only `grace_iterations` more. Files
+    failing validation extend the budget by one iteration, up to `max_iterations + max_extra_iterations` in total.
+    The loop also stops at a fixpoint, when the changes are whitespace only, or when it returns to an earlier state.'''
+    max_iterations: int = 10
+    max_extra_iterations: int = 3
+    min_change_ratio: float = 0.02
+    grace_iterations: int = 1
+
+    @property
+    def limit(self) -> int:
+        return self.max_iterations + self.max_extra_iterations
+
+    def version(self) -> str:
+        return ",".join(f"{k}={v}" for k, v in asdict(self).items())
+
+
+@dataclass
+class IterationStats:
+    '''How much an iteration changed the code base'''
+    iteration: int
+    files: int
+    changed: int
+    added: int
+    whitespace_only: int  # changed files whose changes are whitespace only
+    lines: int  # of the new code base
+    lines_changed: int  # line-level edit distance to the previous code base
+    errors: Optional[int] = None  # files failing validation
+    budget: int = 0  # iterations allowed after this one
+    stop_reason: Optional[str] = None
+
+    @property
+    def change_ratio(self) -> float:
+        return self.lines_changed / max(self.lines, 1)
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "change_ratio": self.change_ratio}
+
+    def __str__(self) -> str:
+        errors = "" if self.errors is None else f", {self.errors} with errors"
+        return (f"Iteration {self.iteration}: {self.changed}/{self.files} files changed ({self.added} new, "
+            f"{self.whitespace_only} whitespace only), {self.lines_changed} lines ({self.change_ratio:.1%}){errors}, "
+            f"budget {self.budget}")
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def normalized_hash(content: str) -> str:
+    '''Hash which ignores all whitespace changes'''
+    return content_hash(" ".join(content.split()))
+
+def state_hash(codebase: CodeBase) -> str:
+    return content_hash("\0".join(f"{name}\0{normalized_hash(content)}" for name, content in sorted(codebase.items())))
+
+def lines_changed(old: str, new: str) -> int:
+    '''Line-level edit distance: lines inserted, deleted or replaced'''
+    matcher = difflib.SequenceMatcher(None, old.splitlines(), new.splitlines(), autojunk=False)
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+
+
+@dataclass
+class ConvergenceTracker:
+    '''Follows the code base through the WRITE_CODE iterations and decides when to stop. It's checkpointed with the
+    code base, so a resumed build continues with the same budget.'''
+    policy: ConvergencePolicy = field(default_factory=ConvergencePolicy)
+    iteration: int = 0
+    budget: int = 0
+    history: List[IterationStats] = field(default_factory=list)
+    states: List[str] = field(default_factory=list)  # whitespace-insensitive hashes of the code bases so far
+    hashes: Dict[str, str] = field(default_factory=dict)  # of the files of the latest code base, by name
+
+    def __post_init__(self):
+        self.budget = self.budget or self.policy.max_iterations
+
+    def start(self, codebase: CodeBase) -> None:
+        '''Remember the code base the iterations start from'''
+        if not self.states: self.states.append(state_hash(codebase))
+        if not self.hashes: self.hashes = {name: content_hash(content) for name, content in codebase.items()}
+
+    @property
+    def done(self) -> bool:
+        return self.iteration >= self.budget or (bool(self.history) and self.history[-1].stop_reason is not None)
+
+    def observe(self, old: CodeBase, new: CodeBase, errors: Optional[int] = None) -> IterationStats:
+        '''Record an iteration which turned `old` into `new`, with `errors` files failing validation'''
+        self.start(old)
+        self.iteration += 1
+        hashes = {name: content_hash(content) for name, content in new.items()}
+        changed = [name for name in new if hashes[name] != self.hashes.get(name)]
+        whitespace_only = [name for name in changed if name in old and normalized_hash(old[name]) == normalized_hash(new[name])]
+        stats = IterationStats(
+            iteration=self.iteration,
+            files=len(new),
+            changed=len(changed),
+            added=sum(name not in old for name in changed),
+            whitespace_only=len(whitespace_only),
+            lines=sum(len(content.splitlines()) for content in new.values()),
+            lines_changed=sum(lines_changed(old.get(name, ""), new[name]) for name in changed if name not in whitespace_only),
+            errors=errors,
+        )
+        state = state_hash(new)
+        if not changed:
+            stats.stop_reason = "the code base didn't change"
+        elif len(whitespace_only) == len(changed):
+            stats.stop_reason = "only whitespace changed"
+        elif state in self.states[:-1]:
+            stats.stop_reason = "the code base is back to an earlier state"
+        self.adapt_budget(stats)
+        stats.budget = max(self.budget - self.iteration, 0)
+        self.hashes = hashes
+        self.states.append(state)
+        self.history.append(stats)
+        return stats
+
+    def adapt_budget(self, stats: IterationStats) -> None:
+        if stats.errors:
+            self.budget = min(self.budget + 1, self.policy.limit)
+        elif stats.change_ratio < self.policy.min_change_ratio:
+            self.budget = min(self.budget, self.iteration + self.policy.grace_iterations)
+
+    def report(self) -> str:
+        return "\n".join(map(str, self.history))
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(stats.to_dict()) + "\n" for stats in self.history)
@@ -0,0 +1,41 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+
+class LatencyHistogram:
+    '''Latencies of the last `window` requests'''
+
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        '''p in [0, 1], nearest-rank'''
+        if not self.samples: return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+@dataclass
+class HedgingPolicy:
+    '''Send a duplicate request if the first one is slower than the `percentile` of recent latencies of the same
+    phase, and take whichever answers first. At most `max_extra_fraction` of all requests may be duplicates.'''
+    percentile: float = 0.95
+    min_samples: int = 20
+    max_extra_fraction: float = 0.1
+    requests: int = field(default=0, init=False)
+    hedges: int = field(default=0, init=False)
+
+    def delay(self, histogram: LatencyHistogram) -> Optional[float]:
+        '''How long to wait before hedging, or None if there aren't enough samples yet'''
+        if len(histogram) < self.min_samples: return None
+        return histogram.percentile(self.percentile)
+
+    def allow(self) -> bool:
+        return self.hedges + 1 <= self.max_extra_fraction * self.requests
@@ -1,63 +1,262 @@
-import os
-import pickle
-from typing import List, Optional
+import asyncio
+import functools
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import BaseMessage
-from .prompts import get_prompt
-from .run_manager import RunManager
+from .cache import (CacheBackend, CacheCounters, CachePolicy, HotTier, StorageStats, Tags, backend_from_filename,
+    canonicalize, llm_namespace, prompt_digest)
+from .candidates import candidates_to_str, rank_candidates, score_candidate
+from .hedging import HedgingPolicy, LatencyHistogram
+from .output_writer import OutputWriter
+from .prompts import get_prompt, get_repair_prompt, prompt_file, template_version, template_versions
+from .rate_limit import RateLimiter, RetryPolicy, is_retryable
+from .run_manager import RunManager, active_run_manager
 from .stages import DevPhase, InferenceStep
+from .streaming import StreamConsumer, Tee
+from .telemetry import Telemetry, current_call
+from .validation.format import FormatError, format_validator
+from .tokens import count_tokens
 
 
+# the legacy pickle's name, so an existing pickle is migrated into the sibling cache/cache.sqlite
 DEFAULT_CACHE_FILE = "cache/cache.pkl"
+HOT_HIT_FLUSH_SIZE = 64
 
 class LLMCache:
-    def __init__(self, llm: BaseChatModel, filename: Optional[str] = None):
+    def __init__(self, llm: BaseChatModel, filename: Optional[str] = None, backend: Optional[CacheBackend] = None,
+        ngram_index: bool = False, policy: Optional[CachePolicy] = None, hot_entries: int = 256,
+        lease_timeout: float = 600.0):
         self.llm = llm
         self.filename = filename if filename is not None else DEFAULT_CACHE_FILE
-        if os.path.exists(self.filename):
-            with open(self.filename, 'rb') as f: self.cache = pickle.load(f)
-        else:
-            self.cache = {}
-
-    def update(self, prompt: List[BaseMessage], value: str):
-        prompt_key = self.to_hashable(prompt)
-        self.cache[prompt_key] = value
-        self.save_to_file()
-
-    def save_to_file(self):
-        with open(self.filename, 'wb') as f:
-            pickle.dump(self.cache, f)
-
-    def to_hashable(self, prompt: List[BaseMessage]):
-        return tuple([str(msg) for msg in prompt])
-
-    def get_llm_result(self, llm, prompt):
-        prompt_key = self.to_hashable(prompt)
-        if prompt_key in self.cache:
-            return self.cache[prompt_key]
-        else:
+        if backend is None:
+            backend = backend_from_filename(self.filename, ngram_index=ngram_index, policy=policy)
+        self.backend = backend
+        self.hot = HotTier(hot_entries, ttl=self.backend.policy.ttl)
+        self.hot_hit_keys: List[str] = []  # not yet passed on to the backend
+        self.deletion_cursor, _ = self.backend.deleted_since(None)
+        self.counters = CacheCounters()
+        self.lease_timeout = lease_timeout
+        self.poll_interval = 0.1
+        # results being generated by this process, by event loop and prompt key
+        self.inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+
+    def update(self, prompt: List[BaseMessage], value: str, tags: Optional[Tags] = None, llm: Optional[BaseChatModel] = None,
+        sample: int = 0):
+        namespace = self.namespace(llm, sample)
+        canonical_prompt = canonicalize(prompt)
+        prompt_key = prompt_digest(canonical_prompt, namespace)
+        self.flush_hot_hits()  # before the backend evicts anything
+        self.backend.set(prompt_key, canonical_prompt, value, {**(tags or {}), "namespace": namespace})
+        self.discard_deleted()  # including the overwritten value
+        self.hot.put(prompt_key, value)
+
+    def to_hashable(self, prompt: List[BaseMessage], llm: Optional[BaseChatModel] = None, sample: int = 0) -> str:
+        return prompt_digest(canonicalize(prompt), self.namespace(llm, sample))
+
+    def namespace(self, llm: Optional[BaseChatModel] = None, sample: int = 0) -> str:
+        '''Namespace of the results of `llm`. Sample i > 0 is the i-th extra sample of a prompt, so several samples of
+        the same prompt are cached side by side, and sample 0 is the plain result.'''
+        namespace = llm_namespace(llm if llm is not None else self.llm)
+        return f"{namespace}/sample={sample}" if sample else namespace
+
+    def discard_deleted(self) -> None:
+        '''Drop the hot copies of entries which were deleted or evicted, possibly by another process'''
+        self.deletion_cursor, deleted = self.backend.deleted_since(self.deletion_cursor)
+        if deleted is None: self.hot.clear()
+        else: self.hot.discard(deleted)
+
+    def flush_hot_hits(self) -> None:
+        '''Pass the hot hits on to the backend in one batch, so that its LRU order counts them too'''
+        if self.hot_hit_keys: self.backend.touch(self.hot_hit_keys)
+        self.hot_hit_keys = []
+
+    def lookup(self, prompt_key: str) -> Optional[str]:
+        self.discard_deleted()
+        result = self.hot.get(prompt_key)
+        if result is not None:
+            self.counters.hot_hits += 1
+            self.hot_hit_keys.append(prompt_key)
+            if len(self.hot_hit_keys) >= HOT_HIT_FLUSH_SIZE: self.flush_hot_hits()
+            return result
+        evicted_before = self.backend.evicted
+        entry = self.backend.get_entry(prompt_key)
+        self.counters.evictions += self.backend.evicted - evicted_before
+        if entry is None: return None
+        self.hot.put(prompt_key, *entry)
+        return entry[0]
+
+    def get_llm_result(self, llm, prompt, tags: Optional[Tags] = None):
+        prompt_key = self.to_hashable(prompt, llm)
+        result = self.cached_result(prompt_key, prompt, tags, llm)
+        if result is not None: return result
+        # single-flight: if another thread or process is already asking the LLM, wait for its answer
+        token = uuid.uuid4().hex
+        while not self.backend.acquire(prompt_key, token, self.lease_timeout):
+            result = self.wait_for(prompt_key)
+            if result is not None:
+                self.counters.hits += 1
+                return result
+        try:
             result = llm(prompt).content
-            self.update(prompt, result)
+            self.store(prompt, result, tags, llm)
+            return result
+        finally:
+            self.backend.release(prompt_key, token)
+
+    async def aget_llm_result(self, llm, prompt, tags: Optional[Tags] = None,
+        generate: Optional[Callable[[List[BaseMessage]], Awaitable[str]]] = None) -> str:
+        '''Async version of `get_llm_result`. `generate` replaces the plain `llm.agenerate` call on a miss,
+        e.g. to add rate limiting and retries.'''
+        prompt_key = self.to_hashable(prompt, llm)
+        result = self.cached_result(prompt_key, prompt, tags, llm)
+        if result is not None: return result
+        # coalesce: if a task of this process is generating the same prompt, share its result
+        # futures belong to their event loop, so tasks of other loops (eg other threads) don't share them
+        inflight_key = (asyncio.get_running_loop(), prompt_key)
+        while inflight_key in self.inflight:
+            result = await asyncio.shield(self.inflight[inflight_key])
+            if result is not None:
+                self.counters.hits += 1
+                self.counters.coalesced += 1
+                return result
+        future = self.inflight[inflight_key] = inflight_key[0].create_future()
+        try:
+            result = await self._agenerate_leased(llm, prompt, prompt_key, tags, generate)
             return result
+        finally:
+            del self.inflight[inflight_key]
+            future.set_result(result)  # None if generating failed, then the waiting tasks try themselves
+
+    async def _agenerate_leased(self, llm, prompt, prompt_key: str, tags: Optional[Tags],
+        generate: Optional[Callable[[List[BaseMessage]], Awaitable[str]]]) -> str:
+        # single-flight: if another process is already asking the LLM, wait for its answer
+        token = uuid.uuid4().hex
+        while not self.backend.acquire(prompt_key, token, self.lease_timeout):
+            result = await self.await_for(prompt_key)
+            if result is not None:
+                self.counters.hits += 1
+                return result
+        try:
+            if generate is not None:
+                result = await generate(prompt)
+            else:
+                result = (await llm.agenerate([prompt])).generations[0][0].text
+            self.store(prompt, result, tags, llm)
+            return result
+        finally:
+            self.backend.release(prompt_key, token)
+
+    def cached_result(self, prompt_key: str, prompt, tags: Optional[Tags], llm) -> Optional[str]:
+        result = self.lookup(prompt_key)
+        if result is None:
+            # entries migrated from legacy caches don't know which model produced them
+            result = self.backend.get(prompt_digest(canonicalize(prompt)))
+            if result is not None: self.update(prompt, result, tags, llm)
+        if result is not None: self.counters.hits += 1
+        return result
+
+    def store(self, prompt, result: str, tags: Optional[Tags], llm, sample: int = 0) -> None:
+        '''Store a freshly generated result'''
+        self.counters.misses += 1
+        evicted_before = self.backend.evicted
+        self.update(prompt, result, tags, llm, sample)
+        self.counters.evictions += self.backend.evicted - evicted_before
+        self.counters.hot_evictions = self.hot.evicted
+
+    def wait_for(self, prompt_key: str) -> Optional[str]:
+        '''Wait until the value of `prompt_key` is stored, or nobody holds its lease anymore'''
+        while True:
+            time.sleep(self.poll_interval)
+            result = self.lookup(prompt_key)
+            if result is not None or not self.backend.leased(prompt_key): return result
+
+    async def await_for(self, prompt_key: str) -> Optional[str]:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            result = self.lookup(prompt_key)
+            if result is not None or not self.backend.leased(prompt_key): return result
 
     def clear(self):
-            self.cache = {}
-            if os.path.exists(self.filename):
-                os.remove(self.filename)
+        self.backend.clear()
+        self.hot.clear()
 
     def delete_containing(self, text: str):
         '''Delete all keys containing given text'''
-        keys_to_delete = [k for k in self.cache.keys() if text in str(k)]
-        for k in keys_to_delete:
-            del self.cache[k]
-        print(f"Deleted {len(keys_to_delete)} keys")
+        n_deleted = self.backend.delete_containing(text)
+        self.hot.clear()
+        print(f"Deleted {n_deleted} keys")
+
+    def invalidate(self, phase: Optional[DevPhase] = None, step: Optional[InferenceStep] = None,
+        template: Optional[str] = None, llm: Optional[BaseChatModel] = None) -> int:
+        '''Delete all entries produced in given phase / step / from given prompt template / by given model'''
+        tags = {}
+        if phase is not None: tags["phase"] = phase.value
+        if step is not None: tags["step"] = step.value
+        if template is not None: tags["template"] = template
+        if llm is not None: tags["namespace"] = llm_namespace(llm)
+        if not tags: raise ValueError("Specify at least one of phase, step, template or llm. Use `clear` to delete everything.")
+        keys = self.backend.find(tags)
+        self.hot.discard(keys)
+        return self.backend.delete(keys)
+
+    def invalidate_stale_templates(self, versions: Dict[str, str]) -> int:
+        '''Delete entries produced from an older version of a prompt template. The versions seen last time are kept
+        in the cache's meta table, so only templates which changed since then are looked up.'''
+        seen = json.loads(self.backend.get_meta("template_versions") or "{}")
+        changed = {template: version for template, version in versions.items() if seen.get(template) != version}
+        keys = [key for template, version in changed.items()
+                for key in self.backend.find({"template": template}, exclude={"template_version": version})]
+        self.hot.discard(keys)
+        n_deleted = self.backend.delete(keys)
+        if changed: self.backend.set_meta("template_versions", json.dumps({**seen, **versions}, sort_keys=True))
+        if n_deleted: print(f"Deleted {n_deleted} keys from outdated prompt templates")
+        return n_deleted
+
+    def stats(self) -> StorageStats:
+        return self.backend.stats()
+
+class TokenHandler(AsyncCallbackHandler):
+    '''Passes the tokens of a streaming model to a StreamConsumer, and signals `aborted` once it has an error'''
+
+    def __init__(self, consumer: StreamConsumer):
+        self.consumer = consumer
+        self.aborted = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.aborted.is_set(): return
+        call = current_call.get()
+        if call is not None: call.first_token()
+        self.consumer.feed(token)
+        if self.consumer.error is not None: self.aborted.set()
 
 # todo: better name
 class LLMInferer():
-    def __init__(self, llm: BaseChatModel, run_manager: RunManager, cache_filename: Optional[str] = None):
+    def __init__(self, llm: BaseChatModel, run_manager: RunManager, cache_filename: Optional[str] = None,
+        cache_policy: Optional[CachePolicy] = None, max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None, timeout: Optional[float] = 600.0,
+        hedging: Optional[HedgingPolicy] = None, writer: Optional[OutputWriter] = None):
         self.llm = llm
-        self.cache = LLMCache(llm, cache_filename)
+        self.cache = LLMCache(llm, cache_filename, policy=cache_policy)
+        self.cache.invalidate_stale_templates(template_versions())
         self.run_manager = run_manager
+        self.writer = writer or OutputWriter()  # responses are logged in the background
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.timeout = timeout
+        self.retries = 0
+        self.repairs = 0  # malformed responses
+        self.aborts = 0  # malformed responses which were aborted while being generated
+        self.hedging = hedging
+        self.latencies: Dict[DevPhase, LatencyHistogram] = {}
+        self.telemetry = Telemetry(model=getattr(llm, "model_name", None))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
 
     # short names for logging
     phase_for_logging = {
@@ -77,15 +276,19 @@ class LLMInferer():
         InferenceStep.RESOLVE: "__c_resolution"
     }
 
+    @property
+    def active_run_manager(self) -> Optional[RunManager]:
+        '''The run of the build making the current call. Builds sharing this inferer activate their own.'''
+        return active_run_manager(self.run_manager)
+
     def save_output(self, content: str, phase: DevPhase, stage: InferenceStep, try_no: Optional[int] = None):
-        dir_ = self.run_manager.cache_dir
-        os.makedirs(dir_, exist_ok=True)
+        dir_ = self.active_run_manager.cache_dir
         try_str = f"_try_{try_no}" if try_no else ""
         filename = f"{dir_}/{self.phase_for_logging[phase]}{self.step_for_logging[stage]}{try_str}.txt"
-        with open(filename, "w") as file: file.write(content)
+        self.writer.write(filename, content)
 
-    def llm_result(self, prompt: List[BaseMessage]):
-        return self.cache.get_llm_result(self.llm, prompt)
+    def llm_result(self, prompt: List[BaseMessage], tags: Optional[Tags] = None):
+        return self.cache.get_llm_result(self.llm, prompt, tags)
 
     def get_thoughtful_reponse(self, phase: DevPhase,
         verbose:bool=True, save:bool=True, format_instructions:Optional[str]=None,
@@ -112,19 +315,257 @@ class LLMInferer():
     
     def get_simple_response(self, phase: DevPhase,
         verbose:bool=True, save:bool=True, format_instructions:Optional[str]=None,
-        try_no:Optional[int]=None,
+        try_no:Optional[int]=None, variant:str="",
         **prompt_vars) -> str:
-        '''Get LLM response'''
+        '''Get LLM response. `variant` selects an alternative prompt for the phase'''
         try_no_str = f" (try no {try_no})" if try_no else ""
         print(f">>> {phase}{try_no_str}")
         if format_instructions: prompt_vars["format_instructions"] = format_instructions
-        return self._get_response(phase, InferenceStep.SIMPLE, "Response", verbose, save, try_no, **prompt_vars)
+        return self._get_response(phase, InferenceStep.SIMPLE, "Response", verbose, save, try_no, variant, **prompt_vars)
 
     def _get_response(self, phase: DevPhase, step: InferenceStep, response_prefix: str,
-        verbose:bool=True, save:bool=True, try_no:Optional[int]=None,
+        verbose:bool=True, save:bool=True, try_no:Optional[int]=None, variant:str="",
         **prompt_vars) -> str:
-        prompt = get_prompt(phase, step, **prompt_vars)
-        response = self.llm_result(prompt)
-        if verbose: print(f">  {response_prefix}:\n{response}\n")    
+        prompt, tags = self._prompt_and_tags(phase, step, variant, **prompt_vars)
+        with self.telemetry_call(phase, step, variant) as call:
+            misses = self.cache.counters.misses
+            response = self.llm_result(prompt, tags)
+            if self.cache.counters.misses > misses:
+                call.add_request(sum(count_tokens(msg.content) for msg in prompt), count_tokens(response))
+        return self._handle_response(response, phase, step, response_prefix, verbose, save, try_no)
+
+    def telemetry_call(self, phase: DevPhase, step: InferenceStep, variant: str = ""):
+        run_manager = self.active_run_manager
+        run_no = run_manager.run_no if run_manager else None
+        return self.telemetry.call(phase.name, step.name, variant, run_no)
+
+    def _prompt_and_tags(self, phase: DevPhase, step: InferenceStep, variant: str = "",
+        **prompt_vars) -> Tuple[List[BaseMessage], Tags]:
+        prompt = get_prompt(phase, step, variant, **prompt_vars)
+        tags = {
+            "phase": phase.value,
+            "step": step.value,
+            "template": prompt_file(phase, step, variant),
+            "template_version": template_version(phase, step, variant),
+        }
+        return prompt, tags
+
+    def _handle_response(self, response: str, phase: DevPhase, step: InferenceStep, response_prefix: str,
+        verbose:bool=True, save:bool=True, try_no:Optional[int]=None) -> str:
+        if verbose: print(f">  {response_prefix}:\n{response}\n")
         if save: self.save_output(response, phase, step, try_no)
-        return response
\ No newline at end of file
+        return response
+
+    # async API: many requests in flight, bounded by `max_concurrency` and the provider's rate limits
+
+    async def aget_thoughtful_response(self, phase: DevPhase,
+        verbose:bool=True, save:bool=True, format_instructions:Optional[str]=None,
+        try_no:Optional[int]=None,
+        **prompt_vars) -> str:
+        '''Async version of `get_thoughtful_reponse`'''
+        try_no_str = f" (try no {try_no})" if try_no else ""
+        print(f">>> {phase}{try_no_str}")
+        common_kwargs = {
+            "verbose": verbose,
+            "save": save,
+            "try_no": try_no,
+            **prompt_vars
+        }
+        initial_response = await self._aget_response(phase, InferenceStep.IDEATE, "Initial response", **common_kwargs)
+        common_kwargs["initial_response"] = initial_response
+        critique = await self._aget_response(phase, InferenceStep.CRITIQUE, "Self-critique", **common_kwargs)
+        common_kwargs["critique"] = critique
+        if format_instructions: common_kwargs["format_instructions"] = format_instructions
+        return await self._aget_response(phase, InferenceStep.RESOLVE, "Thoughtful response", **common_kwargs)
+
+    async def aget_candidates_response(self, phase: DevPhase, n: int = 3,
+        verbose:bool=True, save:bool=True, format_instructions:Optional[str]=None,
+        try_no:Optional[int]=None,
+        **prompt_vars) -> str:
+        '''SmartGPT workflow over `n` candidates: the ideations are sampled at once and ranked by cheap local checks,
+        then all of them are critiqued in one prompt and resolved once. So it takes about as long as a single chain.
+        If the resolution is malformed, the best candidate is returned instead.'''
+        try_no_str = f" (try no {try_no})" if try_no else ""
+        print(f">>> {phase}{try_no_str}, {n} candidates")
+        # the candidates are samples of the phase's plain prompt, so the first one is the plain response
+        candidates = rank_candidates(phase, await self.aget_samples(phase, n, **prompt_vars))
+        candidates_str = candidates_to_str(candidates)
+        self._handle_response(candidates_str, phase, InferenceStep.IDEATE, "Candidates", verbose, save, try_no)
+        common_kwargs = {
+            "verbose": verbose,
+            "save": save,
+            "try_no": try_no,
+            "variant": "candidates",
+            "candidates": candidates_str,
+            **prompt_vars
+        }
+        critique = await self._aget_response(phase, InferenceStep.CRITIQUE, "Critique of the candidates", **common_kwargs)
+        common_kwargs["critique"] = critique
+        if format_instructions: common_kwargs["format_instructions"] = format_instructions
+        response = await self._aget_response(phase, InferenceStep.RESOLVE, "Thoughtful response", **common_kwargs)
+        resolved = score_candidate(phase, response)
+        if resolved.score == 0 and candidates[0].score > 0:
+            print(f"The resolved response is {resolved.summary()}, using the best candidate instead")
+            return candidates[0].text
+        return response
+
+    async def aget_samples(self, phase: DevPhase, n: int, step: InferenceStep = InferenceStep.SIMPLE, variant: str = "",
+        **prompt_vars) -> List[str]:
+        '''`n` responses to the same prompt. Each is cached on its own, so asking for more samples later only requests
+        the missing ones. Missing samples are requested together, see `_agenerate_samples`.'''
+        prompt, tags = self._prompt_and_tags(phase, step, variant, **prompt_vars)
+        with self.telemetry_call(phase, step, variant):
+            samples = [self.cache.lookup(self.cache.to_hashable(prompt, self.llm, sample=i)) for i in range(n)]
+            missing = [i for i, sample in enumerate(samples) if sample is None]
+            self.cache.counters.hits += n - len(missing)
+            if missing:
+                for i, text in zip(missing, await self._agenerate_samples(prompt, len(missing), phase)):
+                    self.cache.store(prompt, text, tags, self.llm, sample=i)
+                    samples[i] = text
+        return samples
+
+    async def aget_simple_response(self, phase: DevPhase,
+        verbose:bool=True, save:bool=True, format_instructions:Optional[str]=None,
+        try_no:Optional[int]=None, variant:str="",
+        **prompt_vars) -> str:
+        '''Async version of `get_simple_response`'''
+        try_no_str = f" (try no {try_no})" if try_no else ""
+        print(f">>> {phase}{try_no_str}")
+        if format_instructions: prompt_vars["format_instructions"] = format_instructions
+        return await self._aget_response(phase, InferenceStep.SIMPLE, "Response", verbose, save, try_no, variant, **prompt_vars)
+
+    async def _aget_response(self, phase: DevPhase, step: InferenceStep, response_prefix: str,
+        verbose:bool=True, save:bool=True, try_no:Optional[int]=None, variant:str="",
+        **prompt_vars) -> str:
+        prompt, tags = self._prompt_and_tags(phase, step, variant, **prompt_vars)
+        generate = functools.partial(self._ahedged_generate, phase)
+        with self.telemetry_call(phase, step, variant):
+            response = await self.cache.aget_llm_result(self.llm, prompt, tags, generate=generate)
+        return self._handle_response(response, phase, step, response_prefix, verbose, save, try_no)
+
+    async def aget_streamed_response(self, phase: DevPhase, consumer: Optional[StreamConsumer] = None,
+        verbose:bool=True, save:bool=True, try_no:Optional[int]=None, variant:str="", max_repairs:int=2,
+        **prompt_vars) -> str:
+        '''Like `aget_simple_response`, but `consumer` gets the response while it is generated, and the response
+        is checked against the output format of the prompt meanwhile. A malformed response is aborted as soon as
+        it can't be valid anymore, and the model is asked to repair it, up to `max_repairs` times.
+        Streamed requests aren't hedged.'''
+        try_no_str = f" (try no {try_no})" if try_no else ""
+        print(f">>> {phase}{try_no_str}")
+        step = InferenceStep.SIMPLE
+        original_prompt, tags = self._prompt_and_tags(phase, step, variant, **prompt_vars)
+        prompt = original_prompt
+        stream = Tee(format_validator(phase, variant), consumer)
+        with self.telemetry_call(phase, step, variant) as call:
+            for repair in range(max_repairs + 1):
+                generate = functools.partial(self._agenerate, consumer=stream, phase=phase)
+                try:
+                    response = await self.cache.aget_llm_result(self.llm, prompt, tags, generate=generate)
+                    stream.finish(response)
+                    if stream.error is None: break
+                    error = stream.error
+                except FormatError as e:
+                    error = e
+                if repair == max_repairs: raise error
+                print(f"Malformed response ({error}), asking for a repair")
+                self.repairs += 1
+                call.repairs += 1
+                prompt = original_prompt + get_repair_prompt(stream.text, str(error))
+        return self._handle_response(response, phase, step, "Response", verbose, save, try_no)
+
+    async def _agenerate_samples(self, prompt: List[BaseMessage], n: int, phase: Optional[DevPhase] = None) -> List[str]:
+        '''`n` samples of `prompt`, in a single request with the provider's `n` parameter if the model has one (like
+        OpenAI's chat models), and in concurrent requests otherwise'''
+        texts: List[str] = []
+        if n > 1 and getattr(self.llm, "n", None) is not None:
+            # streaming only returns the first sample. `copy` leaves out the callbacks, which are excluded from dicts.
+            overrides = {"n": n, **({"streaming": False} if getattr(self.llm, "streaming", False) else {})}
+            llm = self.llm.copy(update={"callbacks": self.llm.callbacks, "callback_manager": self.llm.callback_manager, **overrides})
+            texts = await self._agenerate_texts(prompt, phase=phase, llm=llm)
+        texts += await asyncio.gather(*[self._agenerate(prompt, phase=phase) for _ in range(n - len(texts))])
+        return texts[:n]
+
+    async def _ahedged_generate(self, phase: DevPhase, prompt: List[BaseMessage]) -> str:
+        '''`_agenerate`, plus a duplicate request if the first one is slow compared to recent requests of this phase'''
+        histogram = self.latencies.setdefault(phase, LatencyHistogram())
+        delay = self.hedging.delay(histogram) if self.hedging else None
+        if self.hedging: self.hedging.requests += 1
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(self._agenerate(prompt, phase=phase))
+        requests = {primary}
+        if delay is not None:
+            await asyncio.wait(requests, timeout=delay)
+            if not primary.done() and self.hedging.allow():
+                self.hedging.hedges += 1
+                requests.add(asyncio.ensure_future(self._agenerate(prompt, phase=phase)))
+        try:
+            while True:
+                done, pending = await asyncio.wait(requests, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((r for r in done if r.exception() is None), None)
+                if winner is not None or not pending: break
+                requests = pending  # the other request may still succeed
+            response = (winner or done.pop()).result()
+            histogram.record(time.monotonic() - started_at)
+            return response
+        finally:
+            for request in requests:
+                if not request.done(): request.cancel()
+
+    async def _arequest(self, prompt: List[BaseMessage], handler: Optional[TokenHandler], llm: Optional[BaseChatModel] = None):
+        '''`llm.agenerate` with a timeout. Raises the consumer's error as soon as the handler is aborted.'''
+        callbacks = [handler] if handler else None
+        llm = llm or self.llm
+        request = asyncio.ensure_future(asyncio.wait_for(llm.agenerate([prompt], callbacks=callbacks), self.timeout))
+        if handler is None: return await request
+        aborted = asyncio.ensure_future(handler.aborted.wait())
+        try:
+            await asyncio.wait({request, aborted}, return_when=asyncio.FIRST_COMPLETED)
+            if request.done(): return request.result()
+            self.aborts += 1
+            raise handler.consumer.error
+        finally:
+            aborted.cancel()
+            request.cancel()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one event loop, so create one per loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore, self._semaphore_loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._semaphore
+
+    async def _agenerate(self, prompt: List[BaseMessage], consumer: Optional[StreamConsumer] = None,
+        phase: Optional[DevPhase] = None) -> str:
+        '''One LLM request, with rate limiting, a timeout and retries with exponential backoff. Its token counts are
+        added to the run's stats under `phase`.'''
+        return (await self._agenerate_texts(prompt, consumer, phase))[0]
+
+    async def _agenerate_texts(self, prompt: List[BaseMessage], consumer: Optional[StreamConsumer] = None,
+        phase: Optional[DevPhase] = None, llm: Optional[BaseChatModel] = None) -> List[str]:
+        '''`_agenerate`, returning all generations of the request, eg the samples of a model with `n` > 1'''
+        prompt_tokens = sum(count_tokens(msg.content) for msg in prompt)
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(prompt_tokens)
+            try:
+                if consumer: consumer.reset()
+                async with self.semaphore:
+                    result = await self._arequest(prompt, TokenHandler(consumer) if consumer else None, llm)
+                texts = [generation.text for generation in result.generations[0]]
+                completion_tokens = sum(count_tokens(text) for text in texts)
+                self.rate_limiter.record(completion_tokens)
+                run_manager = self.active_run_manager
+                if run_manager and phase is not None: run_manager.record_tokens(phase.name, prompt_tokens, completion_tokens)
+                call = current_call.get()
+                if call is not None: call.add_request(prompt_tokens, completion_tokens)
+                return texts
+            except Exception as e:
+                if attempt >= self.retry_policy.max_retries or not is_retryable(e): raise
+                delay = self.retry_policy.delay(attempt, e)
+                print(f"Retrying in {delay:.1f}s after {type(e).__name__}: {e}")
+                attempt += 1
+                self.retries += 1
+                call = current_call.get()
+                if call is not None: call.retries += 1
+                await asyncio.sleep(delay)
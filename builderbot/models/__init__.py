@@ -0,0 +1,16 @@
+from .code_base import CodeBase, CodeFile, CodeLine, Content
+from .code_change import CodeChange, CodeChangeError, CodeFileChange, Deletion, Insertion, Replacement, SingleChange
+
+__all__ = [
+    "CodeBase",
+    "CodeChange",
+    "CodeChangeError",
+    "CodeFile",
+    "CodeFileChange",
+    "CodeLine",
+    "Content",
+    "Deletion",
+    "Insertion",
+    "Replacement",
+    "SingleChange",
+]
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional
+from pydantic import BaseModel
+from .code_change import CodeChange, CodeChangeError, Deletion, Insertion, SingleChange
+
+
+class CodeLine(BaseModel):
+    line_number: int  # 1-based
+    content: str
+
+
+class Content:
+    '''Text of a file, indexed by line. Accepts a str wherever a model expects Content.'''
+
+    def __init__(self, lines: Iterable[str] = (), trailing_newline: bool = False):
+        self._lines = list(lines)
+        self.trailing_newline = trailing_newline
+
+    @classmethod
+    def from_str(cls, text: str) -> Content:
+        if not text: return cls()
+        trailing_newline = text.endswith("\n")
+        return cls((text[:-1] if trailing_newline else text).split("\n"), trailing_newline)
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value) -> Content:
+        if isinstance(value, Content): return value
+        if isinstance(value, str): return cls.from_str(value)
+        raise TypeError(f"Expected str or Content, got {type(value).__name__}")
+
+    def lines(self) -> List[CodeLine]:
+        return [CodeLine(line_number=i, content=line) for i, line in enumerate(self._lines, 1)]
+
+    def numbered(self) -> str:
+        '''Content with line numbers, the way edits refer to lines'''
+        return "".join(str(i).ljust(4) + line + "\n" for i, line in enumerate(self._lines, 1))
+
+    def with_changes(self, changes: List[SingleChange]) -> Content:
+        '''Apply all changes in one pass. Line numbers of all changes refer to the original content.'''
+        n = len(self._lines)
+        edits = []  # (start, end, new lines): replace self._lines[start:end]
+        for change in changes:
+            if isinstance(change, Insertion):
+                start = end = change.line_number_start
+            else:
+                start, end = change.line_number_start - 1, change.line_number_end
+                if start < 0 or end <= start: raise CodeChangeError(f"Invalid line range in {change!r}")
+            if not 0 <= start <= end <= n: raise CodeChangeError(f"{change!r} is outside of lines 1-{n}")
+            edits.append((start, end, change.new_lines if not isinstance(change, Deletion) else []))
+        edits.sort(key=lambda edit: edit[:2])  # stable, so insertions at the same line keep their order
+
+        lines, position = [], 0
+        for start, end, new_lines in edits:
+            if start < position: raise CodeChangeError(f"Overlapping changes at line {start + 1}")
+            lines.extend(self._lines[position:start])
+            lines.extend(new_lines)
+            position = end
+        lines.extend(self._lines[position:])
+        return Content(lines, self.trailing_newline or (not self._lines and bool(lines)))
+
+    def __str__(self) -> str:
+        return "\n".join(self._lines) + ("\n" if self.trailing_newline else "")
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, str): return str(self) == other
+        return isinstance(other, Content) and str(self) == str(other)
+
+    def __repr__(self) -> str:
+        return f"Content({str(self)!r})"
+
+
+class CodeFile(BaseModel):
+    name: str
+    content: Content
+
+    class Config:
+        json_encoders = {Content: str}
+
+
+class CodeBase(BaseModel):
+    files: List[CodeFile] = []
+
+    @classmethod
+    def from_dict(cls, codebase: Dict[str, str]) -> CodeBase:
+        return cls(files=[CodeFile(name=name, content=content) for name, content in codebase.items()])
+
+    def to_dict(self) -> Dict[str, str]:
+        return {file.name: str(file.content) for file in self.files}
+
+    def get(self, name: str) -> Optional[CodeFile]:
+        return next((file for file in self.files if file.name == name), None)
+
+    def numbered(self) -> str:
+        '''Code base in the "File: ..." format, with line numbers'''
+        return "".join(f"File: {file.name}\n{file.content.numbered()}--\n" for file in self.files)
+
+    def with_change(self, change: CodeChange) -> CodeBase:
+        '''New code base with the change applied. Files which aren't changed are shared with this code base.
+        Changes to a file which doesn't exist create it.'''
+        files = {file.name: file for file in self.files}
+        for file_change in change.files:
+            file = files.get(file_change.name) or CodeFile(name=file_change.name, content="")
+            files[file_change.name] = CodeFile(name=file.name, content=file.content.with_changes(file_change.changes))
+        return CodeBase.construct(files=list(files.values()))  # construct, as validation would copy every file
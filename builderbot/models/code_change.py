@@ -0,0 +1,44 @@
+from typing import List, Union
+from pydantic import BaseModel, Extra
+
+
+class CodeChangeError(ValueError):
+    '''A change can't be applied, eg because it refers to lines which don't exist'''
+
+
+class LineChange(BaseModel):
+    class Config:
+        extra = Extra.forbid  # so that eg a Replacement is never mistaken for an Insertion
+
+
+class Insertion(LineChange):
+    '''Insert lines after line `line_number_start` (0 inserts at the top)'''
+    line_number_start: int
+    new_lines: List[str]
+
+
+class Deletion(LineChange):
+    '''Delete lines `line_number_start` to `line_number_end` (inclusive)'''
+    line_number_start: int
+    line_number_end: int
+
+
+class Replacement(LineChange):
+    '''Replace lines `line_number_start` to `line_number_end` (inclusive) with `new_lines`'''
+    line_number_start: int
+    line_number_end: int
+    new_lines: List[str]
+
+
+# most specific first, as pydantic tries the types of a Union in order
+SingleChange = Union[Replacement, Deletion, Insertion]
+
+
+class CodeFileChange(BaseModel):
+    name: str
+    changes: List[SingleChange]
+
+
+class CodeChange(BaseModel):
+    '''Changes to a code base. All line numbers refer to the code base before the change.'''
+    files: List[CodeFileChange] = []
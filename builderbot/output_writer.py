@@ -0,0 +1,105 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+# like open(), so the OS applies the umask and renamed files get the permissions open() would have given them
+FILE_MODE = 0o666
+
+
+class OutputWriter:
+    '''Writes files on a background thread, so that saving outputs never holds up the next LLM request.
+
+    Only files whose content changed since they were last written are written again. Every write goes to a temporary
+    file which is then renamed, so readers see either the old or the new file but never a half-written one.
+    Writes are collected for `flush_interval` seconds and written in one batch.'''
+
+    def __init__(self, flush_interval: float = 0.05):
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, str] = {}
+        self.digests: Dict[str, str] = {}  # digest of the latest content of each path, written or pending
+        self.directories: Set[str] = set()
+        self.errors: List[Exception] = []
+        self.writes = 0
+        self.busy = False
+        self.closed = False
+        self.waiting = 0  # threads waiting in flush()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    def write(self, path: str, content: str) -> bool:
+        '''Queue `content` to be written to `path`. Returns False if the file already has this content.'''
+        # relative paths are resolved now, the working directory may have changed by the time the file is written
+        path = os.path.abspath(path)
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        with self.condition:
+            if self.closed: raise RuntimeError("OutputWriter is closed")
+            if self.digests.get(path) == digest: return False
+            self.digests[path] = digest
+            self.pending[path] = content
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="OutputWriter", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return True
+
+    def flush(self) -> None:
+        '''Wait until all queued files are written. Raises the first error since the last flush, if any.'''
+        with self.condition:
+            self.waiting += 1
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.pending and not self.busy)
+            self.waiting -= 1
+            errors, self.errors = self.errors, []
+        if errors: raise errors[0]
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None: self.thread.join()
+        self.flush()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.closed)
+                if not self.pending: return
+                # give other files the chance to join this batch, unless someone is waiting for it
+                deadline = time.monotonic() + self.flush_interval
+                while not self.closed and not self.waiting and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                batch, self.pending = self.pending, {}
+                self.busy = True
+            for path, content in batch.items():
+                try:
+                    self.write_now(path, content)
+                except OSError as e:
+                    with self.condition:
+                        self.errors.append(e)
+                        # the file doesn't have this content, so writing it again mustn't be skipped
+                        if path not in self.pending: self.digests.pop(path, None)
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def write_now(self, path: str, content: str) -> None:
+        directory = os.path.dirname(path) or "."
+        if directory not in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self.directories.add(directory)
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{secrets.token_hex(8)}.tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, FILE_MODE)
+        except FileNotFoundError:
+            self.directories.discard(directory)  # removed since we created it
+            raise
+        try:
+            with os.fdopen(fd, "w") as file: file.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+        self.writes += 1
@@ -1,25 +1,74 @@
 import re
 from typing import List, Optional, Tuple, Dict
+from .models import CodeChange, CodeFileChange, Deletion, Insertion, Replacement, SingleChange
+from .streaming import CodeBaseStreamParser
+from .validation.format import EDIT_HEADER, CodeBaseValidator, FormatError, ProjectDescriptionValidator
+
+
+class EditFormatError(FormatError):
+    '''LLM output isn't in the edit format'''
 
 
 def str_to_project_description(text: str) -> Tuple[List[str], List[str], Optional[List[str]]]:
-    sections = re.split(r'\n\n', text)
-    requirements = re.findall(r'- (.*)', sections[0])
-    assumptions = re.findall(r'- (.*)', sections[1])
-    
-    if 'no questions' in sections[2]:
-        questions = None
-    else:
-        questions = re.findall(r'- (.*)', sections[2])
-    
-    return requirements, assumptions, questions
+    '''Requirements, assumptions and questions (None if the model has no questions). Raises FormatError.'''
+    validator = ProjectDescriptionValidator()
+    validator.validate(text)
+    return validator.items["requirements"], validator.items["assumptions"], validator.questions
 
 
 def str_to_codebase(string: str) -> Dict[str, str]:
-    files_str = string.split("--\n")
-    codebase = {}
-    for file_str in files_str:
-        if file_str:  # Skip empty strings that might result from split
-            split_file_str = file_str.split("\n", 1)
-            codebase[split_file_str[0][6:]] = split_file_str[1]
-    return codebase
+    '''Files of "File: <name>" blocks closed by "--" lines. Raises FormatError.'''
+    CodeBaseValidator().validate(string)
+    parser = CodeBaseStreamParser()
+    parser.finish(string)
+    return parser.files
+
+
+def str_to_code_change(string: str) -> CodeChange:
+    '''Parse edits like
+        File: foo.js
+        @@ insert after line 3
+        <new lines>
+        @@ replace lines 10-12
+        <new lines>
+        @@ delete lines 5-7
+        --
+    Line numbers refer to the code base before the edits.'''
+    files: List[CodeFileChange] = []
+    file: Optional[CodeFileChange] = None
+    header: Optional[re.Match] = None
+    new_lines: List[str] = []
+
+    def close_edit():
+        if header is None: return
+        kind, start = header.group(1).lower(), int(header.group(2))
+        end = int(header.group(3) or start)
+        change: SingleChange
+        if kind == "insert after": change = Insertion(line_number_start=start, new_lines=new_lines)
+        elif kind == "replace": change = Replacement(line_number_start=start, line_number_end=end, new_lines=new_lines)
+        else:
+            if any(line.strip() for line in new_lines): raise EditFormatError(f"Unexpected lines after '{header.group(0)}'")
+            change = Deletion(line_number_start=start, line_number_end=end)
+        file.changes.append(change)
+
+    for line_no, line in enumerate(string.split("\n"), 1):
+        if file is None:
+            if not line.strip(): continue
+            if not line.startswith("File: "): raise EditFormatError(f"Line {line_no}: expected 'File: <name>', got {line!r}")
+            file, header, new_lines = CodeFileChange(name=line[6:].strip(), changes=[]), None, []
+        elif line.rstrip() == "--":
+            close_edit()
+            files.append(file)
+            file = None
+        elif line.startswith("@@"):
+            close_edit()
+            header, new_lines = EDIT_HEADER.match(line), []
+            if header is None: raise EditFormatError(f"Line {line_no}: invalid edit {line!r}")
+        elif header is None:
+            raise EditFormatError(f"Line {line_no}: expected an edit ('@@ ...'), got {line!r}")
+        else:
+            new_lines.append(line)
+    if file is not None:  # tolerate a missing "--" after the last file
+        close_edit()
+        files.append(file)
+    return CodeChange(files=files)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import pickle
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from .stages import DevPhase
+
+Values = Dict[str, Any]
+
+
+@dataclass
+class PhaseNode:
+    '''One step of the build. `run` is called with the node's inputs as keyword arguments and returns its outputs.
+    `on_done` is called with the outputs, also when they come from the memo, so side effects belong there.
+    `version` is part of the memo key, so changing it (eg when the node's prompts or model change) invalidates memoized outputs.'''
+    phase: DevPhase
+    inputs: List[str]
+    outputs: List[str]
+    run: Callable[..., Awaitable[Values]]
+    on_done: Optional[Callable[[Values], None]] = None
+    name: Optional[str] = None
+    version: str = ""
+
+    def __post_init__(self):
+        if self.name is None: self.name = self.phase.name
+
+
+@dataclass
+class NodeTiming:
+    name: str
+    started_at: float
+    finished_at: float
+    cached: bool = False
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+class PhaseGraph:
+    '''Dependency graph of build phases: a node depends on the nodes producing its inputs'''
+
+    def __init__(self, nodes: Iterable[PhaseNode]):
+        self.nodes: Dict[str, PhaseNode] = {}
+        self.producers: Dict[str, str] = {}
+        for node in nodes:
+            if node.name in self.nodes: raise ValueError(f"Duplicate node: {node.name}")
+            self.nodes[node.name] = node
+            for output in node.outputs:
+                if output in self.producers:
+                    raise ValueError(f"{output} is produced by both {self.producers[output]} and {node.name}")
+                self.producers[output] = node.name
+        self.topological_order()  # raises on cycles
+
+    def dependencies(self, name: str) -> List[str]:
+        return sorted({self.producers[i] for i in self.nodes[name].inputs if i in self.producers})
+
+    def topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+        def visit(name: str) -> None:
+            if state.get(name) == "done": return
+            if state.get(name) == "visiting": raise ValueError(f"Cycle in phase graph at {name}")
+            state[name] = "visiting"
+            for dependency in self.dependencies(name): visit(dependency)
+            state[name] = "done"
+            order.append(name)
+        for name in self.nodes: visit(name)
+        return order
+
+
+class Scheduler:
+    '''Runs every node of a graph as soon as its inputs are available, so independent phases run concurrently.
+    Node outputs are memoized by the node's inputs, so re-running a graph only runs nodes whose inputs changed.'''
+
+    def __init__(self, graph: PhaseGraph, memo: Optional[Dict[str, Values]] = None):
+        self.graph = graph
+        self.memo = memo if memo is not None else {}
+        self.timings: Dict[str, NodeTiming] = {}
+
+    async def run(self, **initial: Any) -> Values:
+        values = dict(initial)
+        missing = {i for n in self.graph.nodes.values() for i in n.inputs} - set(self.graph.producers) - set(values)
+        if missing: raise ValueError(f"Missing inputs: {', '.join(sorted(missing))}")
+        self.timings = {}
+        self.start = time.monotonic()
+        pending = set(self.graph.nodes)
+        running: Dict[asyncio.Future, str] = {}
+        try:
+            while pending or running:
+                for name in sorted(pending):
+                    if all(i in values for i in self.graph.nodes[name].inputs):
+                        pending.discard(name)
+                        running[asyncio.ensure_future(self.run_node(name, values))] = name
+                if not running: raise RuntimeError(f"Phases can't run: {', '.join(sorted(pending))}")
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    values.update(future.result())
+        finally:
+            for future in running: future.cancel()
+        return values
+
+    async def run_node(self, name: str, values: Values) -> Values:
+        node = self.graph.nodes[name]
+        inputs = {i: values[i] for i in node.inputs}
+        key = memo_key(name, inputs, node.version)
+        started_at = time.monotonic()
+        cached = key is not None and key in self.memo
+        if cached:
+            outputs = self.memo[key]
+        else:
+            outputs = await node.run(**inputs)
+            missing = set(node.outputs) - set(outputs)
+            if missing: raise ValueError(f"{name} didn't produce {', '.join(sorted(missing))}")
+            if key is not None: self.memo[key] = outputs
+        outputs = {o: outputs[o] for o in node.outputs}
+        if node.on_done: node.on_done(outputs)
+        self.timings[name] = NodeTiming(name, started_at - self.start, time.monotonic() - self.start, cached)
+        return outputs
+
+    def critical_path(self) -> List[NodeTiming]:
+        '''Chain of nodes which determined the total run time: starting from the node which finished last,
+        repeatedly go to the dependency which finished last'''
+        if not self.timings: return []
+        path = [max(self.timings.values(), key=lambda t: t.finished_at)]
+        while True:
+            dependencies = [self.timings[d] for d in self.graph.dependencies(path[-1].name) if d in self.timings]
+            if not dependencies: break
+            path.append(max(dependencies, key=lambda t: t.finished_at))
+        return path[::-1]
+
+    def report(self) -> str:
+        path = self.critical_path()
+        if not path: return "Nothing ran"
+        steps = " → ".join(f"{t.name} ({'cached' if t.cached else f'{t.duration:.1f}s'})" for t in path)
+        return f"Critical path ({path[-1].finished_at:.1f}s): {steps}"
+
+
+def memo_key(name: str, inputs: Values, version: str = "") -> Optional[str]:
+    try:
+        data = pickle.dumps((version, sorted(inputs.items())))
+    except Exception:
+        return None  # unpicklable inputs aren't memoized
+    return name + ":" + hashlib.sha256(data).hexdigest()
@@ -1,8 +1,16 @@
-from typing import List
-from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain.schema import BaseMessage
+import hashlib
+import os
+import string
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, List, Optional, Tuple
 from .stages import DevPhase, InferenceStep
-from .utils import load_file
+from .utils import file_exists, file_mtime, load_file
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
 
 phase2file = {
     DevPhase.UNDERSTAND: "1_understand_requirement",
@@ -24,18 +32,142 @@ step2file = {
     InferenceStep.RESOLVE: "__resolve",
 }
 
-def prompt_file(phase: DevPhase, step: InferenceStep) -> str:
-    return phase2file[phase] + step2file[step]
-
-def load_prompt(phase: DevPhase, step: InferenceStep) -> ChatPromptTemplate:
-    path_to_system_prompt = "prompts/system.txt"
-    path_to_human_prompt = f"prompts/{prompt_file(phase, step)}.txt"
-    system_file_contents = load_file(path_to_system_prompt)
-    human_file_contents = load_file(path_to_human_prompt)
-    system_msg = SystemMessagePromptTemplate.from_template(system_file_contents)
-    human_msg = HumanMessagePromptTemplate.from_template(human_file_contents)
-    return ChatPromptTemplate.from_messages([system_msg, human_msg])
-
-def get_prompt(stage: DevPhase, step: InferenceStep, **prompt_vars) -> List[BaseMessage]:
-    prompt_template = load_prompt(stage, step)
-    return prompt_template.format_prompt(**prompt_vars).to_messages()
+# alternative prompts for a phase, eg to write a single file instead of the whole code base
+phase2variants = {
+    DevPhase.STRUCTURE_CODE: ["candidates"],
+    DevPhase.WRITE_CODE: ["file", "edits"],
+}
+
+def prompt_file(phase: DevPhase, step: InferenceStep, variant: str = "") -> str:
+    return phase2file[phase] + step2file[step] + (f"__{variant}" if variant else "")
+
+def template_paths(phase: DevPhase, step: InferenceStep, variant: str = "") -> List[str]:
+    return ["prompts/system.txt", f"prompts/{prompt_file(phase, step, variant)}.txt"]
+
+@dataclass(frozen=True)
+class Template:
+    '''A parsed template file. Templates use `str.format` syntax, like langchain's f-string templates.'''
+    path: str
+    text: str
+    variables: FrozenSet[str]
+    mtime: Optional[int]
+
+    @classmethod
+    def parse(cls, path: str, text: str, mtime: Optional[int] = None) -> "Template":
+        try:
+            variables = frozenset(name for _, name, _, _ in string.Formatter().parse(text) if name is not None)
+        except ValueError as e:
+            raise ValueError(f"Invalid prompt template {path}: {e}") from e
+        if "" in variables or any(not name.isidentifier() for name in variables):
+            raise ValueError(f"Invalid prompt template {path}: variables must be named")
+        return cls(path, text, variables, mtime)
+
+    def render(self, prompt_vars: Dict[str, Any]) -> str:
+        missing = self.variables - set(prompt_vars)
+        if missing: raise ValueError(f"Prompt template {self.path} is missing {', '.join(sorted(missing))}")
+        return self.text.format(**prompt_vars)
+
+
+class PromptRegistry:
+    '''Prompt templates, each parsed once. A template is reloaded if its file changed, which is checked at most
+    every `check_interval` seconds (never if None). Rendered prompts are memoized, so rendering the same large
+    variables (eg `code_base`) into the same template again is a dictionary lookup.
+    Templates are package files, or files below `root` if it is given.'''
+
+    def __init__(self, root: Optional[str] = None, check_interval: Optional[float] = 1.0, cache_size: int = 64):
+        self.root = root
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self.templates: Dict[str, Template] = {}
+        self.checked_at: Dict[str, float] = {}
+        self.versions: Dict[Tuple[Template, ...], str] = {}
+        self.rendered: "OrderedDict[Tuple, List[BaseMessage]]" = OrderedDict()
+        self.lock = threading.RLock()
+
+    def exists(self, path: str) -> bool:
+        if self.root is not None: return os.path.isfile(os.path.join(self.root, path))
+        return file_exists(path)
+
+    def mtime(self, path: str) -> Optional[int]:
+        if self.root is None: return file_mtime(path)
+        try:
+            return os.stat(os.path.join(self.root, path)).st_mtime_ns
+        except OSError:
+            return None
+
+    def template(self, path: str) -> Template:
+        with self.lock:
+            template = self.templates.get(path)
+            now = time.monotonic()
+            if template is not None:
+                if self.check_interval is None or now - self.checked_at[path] < self.check_interval: return template
+                self.checked_at[path] = now
+                if self.mtime(path) == template.mtime: return template
+            mtime = self.mtime(path)
+            if self.root is None:
+                text = load_file(path)
+            else:
+                with open(os.path.join(self.root, path), encoding="utf-8") as file: text = file.read()
+            self.templates[path], self.checked_at[path] = Template.parse(path, text, mtime), now
+            return self.templates[path]
+
+    def variables(self, phase: DevPhase, step: InferenceStep, variant: str = "") -> FrozenSet[str]:
+        '''Variables a prompt needs'''
+        return frozenset().union(*(self.template(path).variables for path in template_paths(phase, step, variant)))
+
+    def version(self, phase: DevPhase, step: InferenceStep, variant: str = "") -> str:
+        '''Hash of the system and human prompt templates used for (phase, step, variant)'''
+        templates = tuple(self.template(path) for path in template_paths(phase, step, variant))
+        if templates not in self.versions:
+            contents = "\0".join(template.text for template in templates)
+            self.versions[templates] = hashlib.sha256(contents.encode("utf-8")).hexdigest()[:16]
+        return self.versions[templates]
+
+    def render(self, phase: DevPhase, step: InferenceStep, variant: str = "", **prompt_vars: Any) -> List["BaseMessage"]:
+        from langchain.schema import HumanMessage, SystemMessage
+        system, human = (self.template(path) for path in template_paths(phase, step, variant))
+        used = sorted(system.variables | human.variables)
+        # variables are rendered with str(), so that's all the key needs; str hashes are cached, so this is cheap
+        key = (system, human, tuple((name, memo_value(prompt_vars.get(name))) for name in used))
+        with self.lock:
+            if key in self.rendered:
+                self.rendered.move_to_end(key)
+                return list(self.rendered[key])
+        messages = [SystemMessage(content=system.render(prompt_vars)), HumanMessage(content=human.render(prompt_vars))]
+        with self.lock:
+            self.rendered[key] = messages
+            while len(self.rendered) > self.cache_size: self.rendered.popitem(last=False)
+        return list(messages)
+
+def memo_value(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool, type(None))) else ("str", str(value))
+
+registry = PromptRegistry()
+
+def template_version(phase: DevPhase, step: InferenceStep, variant: str = "") -> str:
+    '''Hash of the system and human prompt templates used for (phase, step, variant)'''
+    return registry.version(phase, step, variant)
+
+def phase_version(phase: DevPhase) -> str:
+    '''Hash of all prompt templates of a phase, for all steps and variants'''
+    versions = [template_version(phase, step, variant)
+        for step in step2file for variant in ["", *phase2variants.get(phase, [])]
+        if registry.exists(template_paths(phase, step, variant)[1])]
+    return hashlib.sha256("\0".join(versions).encode("utf-8")).hexdigest()[:16]
+
+def template_versions() -> Dict[str, str]:
+    '''Current version of every existing prompt template, by template name'''
+    return {
+        prompt_file(phase, step, variant): template_version(phase, step, variant)
+        for phase in phase2file for step in step2file for variant in ["", *phase2variants.get(phase, [])]
+        if registry.exists(template_paths(phase, step, variant)[1])
+    }
+
+def get_prompt(stage: DevPhase, step: InferenceStep, variant: str = "", **prompt_vars) -> List["BaseMessage"]:
+    return registry.render(stage, step, variant, **prompt_vars)
+
+def get_repair_prompt(response: str, error: str) -> List["BaseMessage"]:
+    '''Messages to append to a prompt whose response was malformed, asking for a response in the right format'''
+    from langchain.schema import AIMessage, HumanMessage
+    repair = registry.template("prompts/repair_format.txt").render({"error": error})
+    return [AIMessage(content=response), HumanMessage(content=repair)]
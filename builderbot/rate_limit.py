@@ -0,0 +1,85 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APIError", "ServiceUnavailableError", "APIConnectionError", "Timeout", "TryAgain"}
+
+
+class TokenBucket:
+    '''Allows `capacity` units per minute, refilled continuously'''
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+        self.lock: Optional[asyncio.Lock] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)  # a single request larger than the bucket can never pass otherwise
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop: self.lock, self.loop = asyncio.Lock(), loop
+        async with self.lock:
+            self.refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self.refill()
+            self.level -= amount
+
+    def debit(self, amount: float) -> None:
+        '''Take units after the fact (e.g. completion tokens), possibly going into debt'''
+        self.refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    '''Request and token per minute limits of an LLM provider'''
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: int) -> None:
+        if self.requests: await self.requests.acquire(1)
+        if self.tokens: await self.tokens.acquire(tokens)
+
+    def record(self, tokens: int) -> None:
+        if self.tokens: self.tokens.debit(tokens)
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 6
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        '''Exponential backoff with full jitter, unless the provider told us how long to wait'''
+        retry_after = _retry_after(error)
+        if retry_after is not None: return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def is_retryable(error: BaseException) -> bool:
+    '''Rate limits (429), server errors (5xx) and timeouts'''
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)): return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is not None: return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERRORS
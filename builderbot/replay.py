@@ -0,0 +1,130 @@
+'''Record/replay chat model, to run builds offline: responses are served from a cassette of recorded interactions,
+with a simulated latency and token rate.
+
+    cassette = Cassette("cassettes/todo.json")
+    bot = BuilderBot(llm=ReplayLLM(cassette=cassette, fallback=ChatOpenAI(...)))  # records what's missing
+    bot.build("build a todo app")
+    cassette.save()
+
+    bot = BuilderBot(llm=ReplayLLM(cassette=Cassette("cassettes/todo.json")))  # replays, raises CassetteMiss otherwise
+'''
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain.chat_models.base import BaseChatModel, SimpleChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from .cache.keys import Prompt, canonicalize, prompt_digest
+from .tokens import CHARS_PER_TOKEN, count_tokens
+
+CASSETTE_FORMAT = 1
+
+
+class CassetteMiss(KeyError):
+    '''The cassette has no response for a prompt, and there's no fallback model to record one'''
+
+
+class Cassette:
+    '''Recorded responses by prompt, stored as a JSON file'''
+    def __init__(self, path: Optional[str] = None, model_name: str = "replay"):
+        self.path = path
+        self.model_name = model_name
+        self.interactions: Dict[str, Dict[str, Any]] = {}
+        self.changed = False
+        if path is not None and os.path.exists(path): self.load(path)
+
+    def load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as f: data = json.load(f)
+        if data.get("format") != CASSETTE_FORMAT: raise ValueError(f"{path} isn't a cassette of format {CASSETTE_FORMAT}")
+        self.model_name = data["model_name"]
+        self.interactions = data["interactions"]
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if path is None: raise ValueError("The cassette has no path")
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"format": CASSETTE_FORMAT, "model_name": self.model_name, "interactions": self.interactions}
+        with open(path, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False, indent=1)
+        self.changed = False
+
+    def get(self, prompt: Prompt) -> Optional[str]:
+        interaction = self.interactions.get(prompt_digest(prompt))
+        return None if interaction is None else interaction["response"]
+
+    def record(self, prompt: Prompt, response: str) -> None:
+        self.interactions[prompt_digest(prompt)] = {"prompt": [list(m) for m in prompt], "response": response}
+        self.changed = True
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+
+def chunks(text: str, size: int) -> Iterable[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class ReplayLLM(SimpleChatModel):
+    '''Serves responses from `cassette`. Each response takes `first_token_latency` seconds plus one second per
+    `tokens_per_second` tokens, and is streamed in chunks of `chunk_tokens` tokens. Prompts which aren't on the cassette
+    are answered by `fallback` and recorded, or raise CassetteMiss if there's no fallback.'''
+    cassette: Cassette
+    fallback: Optional[BaseChatModel] = None
+    first_token_latency: float = 0.0
+    tokens_per_second: Optional[float] = None
+    chunk_tokens: int = 16
+    model_name: str = "replay"
+    hits: int = 0
+    misses: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs):
+        if "model_name" not in kwargs and "cassette" in kwargs: kwargs["model_name"] = kwargs["cassette"].model_name
+        super().__init__(**kwargs)
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None) -> str:
+        prompt = canonicalize(messages)
+        response = self.cassette.get(prompt)
+        if response is None:
+            response = self._record(prompt, self.fallback.predict_messages(messages, stop=stop).content if self.fallback else None)
+        else:
+            self.hits += 1
+        time.sleep(self.latency(response))
+        return response
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager=None) -> ChatResult:
+        prompt = canonicalize(messages)
+        response = self.cassette.get(prompt)
+        if response is None:
+            recorded = (await self.fallback.agenerate([messages], stop=stop)).generations[0][0].text if self.fallback else None
+            response = self._record(prompt, recorded)
+        else:
+            self.hits += 1
+        await asyncio.sleep(self.first_token_latency)
+        parts = list(chunks(response, self.chunk_tokens * CHARS_PER_TOKEN)) or [""]
+        delay = (self.latency(response) - self.first_token_latency) / len(parts)
+        for i, part in enumerate(parts):
+            if i and delay: await asyncio.sleep(delay)
+            if run_manager: await run_manager.on_llm_new_token(part)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    def _record(self, prompt: Prompt, response: Optional[str]) -> str:
+        if response is None: raise CassetteMiss(f"No recorded response for prompt {prompt_digest(prompt)}")
+        self.misses += 1
+        self.cassette.record(prompt, response)
+        return response
+
+    def latency(self, response: str) -> float:
+        '''Simulated time to generate `response`, in seconds'''
+        if not self.tokens_per_second: return self.first_token_latency
+        return self.first_token_latency + count_tokens(response) / self.tokens_per_second
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
@@ -1,33 +1,173 @@
-import os
-import pandas as pd
+import copy
+import csv
 import datetime
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+BUSY_TIMEOUT = 60.0
+
+SCHEMA = [
+    # AUTOINCREMENT never hands out a run number twice, even after the latest run was deleted
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_no INTEGER PRIMARY KEY AUTOINCREMENT,
+        time TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        started_at REAL,
+        finished_at REAL,
+        pid INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS run_phases (
+        run_no INTEGER NOT NULL,
+        phase TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        finished_at REAL NOT NULL,
+        cached INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (run_no, phase)
+    )""",
+    """CREATE TABLE IF NOT EXISTS run_tokens (
+        run_no INTEGER NOT NULL,
+        phase TEXT NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (run_no, phase)
+    )""",
+]
+
+# the run of the build in the current context, for when several builds share an LLMInferer
+_active: ContextVar[Optional["RunManager"]] = ContextVar("active_run_manager", default=None)
+
 
 class RunManager():
-    file = "runs.txt"
+    '''Registry of build runs, kept in a small SQLite database.
+
+    Run numbers are allocated by inserting a row, so processes starting runs at the same time get different numbers
+    and never share `cache/run_N` and `output/run_N`. Besides the start time it keeps each run's status, phase timings
+    and token counts. Token counts are collected in memory and written by `save_stats`, so requests never wait for it.
+    Runs from a legacy `runs.txt` are imported once, so numbering continues where it stopped.'''
+    file = "runs.sqlite"
+    legacy_file = "runs.txt"
+
+    def __init__(self, filename: Optional[str] = None):
+        self.filename = filename or self.file
+        self.current_run: Optional[int] = None
+        self.lock = threading.Lock()
+        self.tokens: Dict[str, Dict[str, int]] = {}  # by phase, not saved yet
+        self.conn = sqlite3.connect(self.filename, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for statement in SCHEMA: self.conn.execute(statement)
+            self.import_legacy_runs()
 
-    def __init__(self):
-        if os.path.exists(self.file):
-            self.runs = pd.read_csv(self.file)
-        else:
-            self.runs = pd.DataFrame(columns=["run_no", "time"])
-            self.save()
+    def import_legacy_runs(self) -> None:
+        if not os.path.exists(self.legacy_file) or self.conn.execute("SELECT 1 FROM runs LIMIT 1").fetchone(): return
+        with open(self.legacy_file, newline="") as file:
+            rows = [(int(row["run_no"]), row["time"]) for row in csv.DictReader(file) if row.get("run_no")]
+        self.conn.executemany("INSERT OR IGNORE INTO runs (run_no, time, status) VALUES (?, ?, 'unknown')", rows)
 
     @property
-    def run_no(self):
-        return 0 if self.runs.empty else self.runs.run_no.max()
+    def run_no(self) -> int:
+        '''The current run, or the latest run if none was started or resumed'''
+        if self.current_run is not None: return self.current_run
+        return self.conn.execute("SELECT COALESCE(MAX(run_no), 0) FROM runs").fetchone()[0]
 
-    def start_run(self):
+    def start_run(self) -> int:
         now = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M")
-        self.runs.loc[len(self.runs)] = {"run_no": self.run_no+1, "time": now}
-        self.save()
+        with self.lock:
+            cursor = self.conn.execute("INSERT INTO runs (time, status, started_at, pid) VALUES (?, 'running', ?, ?)",
+                (now, time.time(), os.getpid()))
+            self.current_run = cursor.lastrowid
+            self.tokens = {}
+        return self.current_run
+
+    def resume_run(self, run_no: int) -> None:
+        with self.lock:
+            cursor = self.conn.execute("UPDATE runs SET status = 'running', finished_at = NULL, pid = ? WHERE run_no = ?",
+                (os.getpid(), run_no))
+            if cursor.rowcount == 0: raise ValueError(f"There is no run {run_no}")
+            self.current_run = run_no
+            self.tokens = {}
+
+    def fork(self) -> "RunManager":
+        '''Manager of another run, sharing this one's database connection'''
+        manager = copy.copy(self)
+        manager.current_run = None
+        manager.tokens = {}
+        return manager
 
-    def save(self):
-        self.runs.to_csv(self.file, index=False)
+    @contextmanager
+    def activated(self) -> Iterator["RunManager"]:
+        '''Make this the run of everything done in this context, including in tasks started from it'''
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def finish_run(self, status: str = "finished") -> None:
+        self.save_stats()
+        with self.lock:
+            self.conn.execute("UPDATE runs SET status = ?, finished_at = ? WHERE run_no = ?", (status, time.time(), self.run_no))
+
+    def record_phase(self, phase: str, started_at: float, finished_at: float, cached: bool = False) -> None:
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO run_phases VALUES (?, ?, ?, ?, ?)",
+                (self.run_no, phase, started_at, finished_at, int(cached)))
+
+    def record_tokens(self, phase: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self.lock:
+            counts = self.tokens.setdefault(phase, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            counts["requests"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["completion_tokens"] += completion_tokens
+
+    def save_stats(self) -> None:
+        with self.lock:
+            tokens, self.tokens = self.tokens, {}
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self.conn.executemany("""INSERT INTO run_tokens VALUES (:run_no, :phase, :requests, :prompt_tokens, :completion_tokens)
+                    ON CONFLICT (run_no, phase) DO UPDATE SET requests = requests + excluded.requests,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens""",
+                    [{"run_no": self.run_no, "phase": phase, **counts} for phase, counts in tokens.items()])
+
+    def run_info(self, run_no: Optional[int] = None) -> Dict:
+        '''Metadata of a run, by default the current one'''
+        run_no = self.run_no if run_no is None else run_no
+        self.conn.row_factory = sqlite3.Row
+        try:
+            run = self.conn.execute("SELECT * FROM runs WHERE run_no = ?", (run_no,)).fetchone()
+            if run is None: raise ValueError(f"There is no run {run_no}")
+            phases = self.conn.execute("SELECT * FROM run_phases WHERE run_no = ? ORDER BY started_at", (run_no,)).fetchall()
+            tokens = self.conn.execute("SELECT * FROM run_tokens WHERE run_no = ? ORDER BY phase", (run_no,)).fetchall()
+        finally:
+            self.conn.row_factory = None
+        strip = lambda row: {k: row[k] for k in row.keys() if k != "run_no"}
+        return {**dict(run), "phases": {p["phase"]: strip(p) for p in phases}, "tokens": {t["phase"]: strip(t) for t in tokens}}
+
+    def runs(self) -> List[Dict]:
+        columns = ["run_no", "time", "status"]
+        return [dict(zip(columns, row)) for row in self.conn.execute(f"SELECT {', '.join(columns)} FROM runs ORDER BY run_no")]
 
     @property
     def cache_dir(self):
         return f"cache/run_{self.run_no}/"
 
+    @property
+    def checkpoint_dir(self):
+        return f"cache/run_{self.run_no}/checkpoints/"
+
     @property
     def output_dir(self):
         return f"output/run_{self.run_no}/"
+
+def active_run_manager(default: Optional[RunManager] = None) -> Optional[RunManager]:
+    '''The run manager activated in the current context, or `default`'''
+    return _active.get() or default
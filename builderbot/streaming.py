@@ -0,0 +1,96 @@
+'''Consuming LLM responses while they are generated'''
+from typing import Callable, Dict, List, Optional
+
+
+class StreamConsumer:
+    '''Receives a response piece by piece. `reset` is called when a request is retried, so that the
+    consumer starts over; `finish` with the full response once it is complete (also for cached responses).
+    A consumer sets `error` if the response turns out to be unusable, which aborts the request.'''
+
+    def __init__(self):
+        self.reset()
+
+    def feed(self, text: str) -> None:
+        self.text += text
+        self.on_text(text)
+
+    def on_text(self, text: str) -> None:
+        pass
+
+    def reset(self) -> None:
+        self.text = ""
+        self.error: Optional[Exception] = None
+
+    def finish(self, response: str) -> None:
+        '''Feed whatever of `response` hasn't been streamed, eg because the model doesn't stream or the response was cached'''
+        if not response.startswith(self.text): self.reset()
+        if len(response) > len(self.text): self.feed(response[len(self.text):])
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+
+class Tee(StreamConsumer):
+    '''Passes a response to several consumers'''
+
+    def __init__(self, *consumers: Optional[StreamConsumer]):
+        self.consumers = [consumer for consumer in consumers if consumer is not None]
+        super().__init__()
+
+    def on_text(self, text: str) -> None:
+        for consumer in self.consumers: consumer.feed(text)
+        self.error = self.error or next((c.error for c in self.consumers if c.error is not None), None)
+
+    def reset(self) -> None:
+        super().reset()
+        for consumer in self.consumers: consumer.reset()
+
+    def close(self) -> None:
+        for consumer in self.consumers: consumer.close()
+        self.error = self.error or next((c.error for c in self.consumers if c.error is not None), None)
+
+
+class CodeBaseStreamParser(StreamConsumer):
+    '''Incremental version of `str_to_codebase`: calls `on_file(name, content)` as soon as a "File: <name>" block
+    is closed by a "--" line. Lines outside of blocks are kept in `preamble`.'''
+
+    def __init__(self, on_file: Optional[Callable[[str, str], None]] = None):
+        self.on_file = on_file
+        super().__init__()
+
+    def reset(self) -> None:
+        super().reset()
+        self.buffer = ""
+        self.name: Optional[str] = None
+        self.content = ""
+        self.files: Dict[str, str] = {}
+        self.preamble: List[str] = []
+
+    def on_text(self, text: str) -> None:
+        *lines, self.buffer = (self.buffer + text).split("\n")
+        for line in lines: self.on_line(line, "\n")
+
+    def on_line(self, line: str, end: str) -> None:
+        if self.name is None:
+            if line.startswith("File: "): self.name, self.content = line[6:].strip(), ""
+            elif line.strip(): self.preamble.append(line)
+        elif line.rstrip() == "--":  # like CodeBaseValidator
+            self.emit()
+        else:
+            self.content += line + end
+
+    def emit(self) -> None:
+        self.files[self.name] = self.content
+        if self.on_file: self.on_file(self.name, self.content)
+        self.name = None
+
+    def close(self) -> None:
+        if self.buffer: self.on_line(self.buffer, "")
+        self.buffer = ""
+        if self.name is not None: self.emit()  # the last "--" is optional
+
+    @property
+    def malformed(self) -> bool:
+        '''Whether there was text outside of file blocks, eg because the model described the code instead'''
+        return bool(self.preamble)
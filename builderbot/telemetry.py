@@ -0,0 +1,182 @@
+'''Per-call metrics of LLM requests: latency, tokens, cache hits and cost, tagged by phase, step, iteration and run'''
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from .tokens import estimate_cost
+
+# the call being made by the current task, so that the layers below can add to it
+current_call: ContextVar[Optional["CallRecord"]] = ContextVar("current_call", default=None)
+_tags: ContextVar[Dict[str, Any]] = ContextVar("telemetry_tags", default={})
+
+@contextmanager
+def tagged(**tags: Any) -> Iterator[None]:
+    '''Tag all calls made in this context, including in tasks started from it, eg with the iteration'''
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@dataclass
+class CallRecord:
+    '''One call for a response. Token counts and cost are those of the requests actually sent, so 0 for cache hits.'''
+    phase: str
+    step: str
+    variant: str = ""
+    iteration: Optional[int] = None
+    run_no: Optional[int] = None
+    model: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    wall_time: float = 0.0
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hit: bool = True
+    requests: int = 0
+    retries: int = 0
+    repairs: int = 0
+    cost: float = 0.0
+    error: Optional[str] = None
+
+    def __post_init__(self):
+        self._start = time.monotonic()
+
+    def first_token(self) -> None:
+        if self.time_to_first_token is None: self.time_to_first_token = time.monotonic() - self._start
+
+    def add_request(self, prompt_tokens: int, completion_tokens: int) -> None:
+        self.first_token()  # for models which don't stream, the first token arrives with the response
+        self.cache_hit = False
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Telemetry:
+    '''Collects a `CallRecord` for every call. Records are kept in memory for `summary`, `table` and `prometheus`,
+    and appended to the JSONL file at `path` (if set) on `flush` or once `flush_every` records are pending.
+    Records of the runs in `run_paths` are appended to the run's own file instead.'''
+
+    def __init__(self, model: Optional[str] = None, path: Optional[str] = None, flush_every: int = 100):
+        self.model = model
+        self.path = path
+        self.flush_every = flush_every
+        self.run_paths: Dict[int, str] = {}
+        self.records: List[CallRecord] = []
+        self.pending: List[CallRecord] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def call(self, phase: str, step: str, variant: str = "", run_no: Optional[int] = None) -> Iterator[CallRecord]:
+        tags = _tags.get()
+        record = CallRecord(phase, step, variant, tags.get("iteration"), run_no, self.model)
+        token = current_call.set(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_call.reset(token)
+            record.wall_time = time.monotonic() - record._start
+            record.cost = estimate_cost(self.model, record.prompt_tokens, record.completion_tokens)
+            self.record(record)
+
+    def record(self, record: CallRecord) -> None:
+        with self.lock:
+            self.records.append(record)
+            self.pending.append(record)
+            full = len(self.pending) >= self.flush_every
+        if full: self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, []
+            by_path: Dict[str, List[CallRecord]] = {}
+            for record in pending:
+                path = self.run_paths.get(record.run_no, self.path)
+                if path is not None: by_path.setdefault(path, []).append(record)
+            for path, records in by_path.items():
+                directory = os.path.dirname(path)
+                if directory: os.makedirs(directory, exist_ok=True)
+                with open(path, "a") as file:
+                    file.writelines(json.dumps(record.to_dict()) + "\n" for record in records)
+
+    def select(self, run_no: Optional[int] = None) -> List[CallRecord]:
+        with self.lock:
+            return [r for r in self.records if run_no is None or r.run_no == run_no]
+
+    def summary(self, group_by: Sequence[str] = ("phase", "step"), run_no: Optional[int] = None) -> List[Dict[str, Any]]:
+        '''Totals per group, in the order the groups first occurred'''
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        for r in self.select(run_no):
+            key = tuple(getattr(r, name) for name in group_by)
+            row = groups.setdefault(key, {**dict(zip(group_by, key)), "calls": 0, "cache_hits": 0, "requests": 0,
+                "retries": 0, "repairs": 0, "errors": 0, "wall_time": 0.0, "first_token_times": [],
+                "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            row["calls"] += 1
+            row["cache_hits"] += r.cache_hit
+            row["errors"] += r.error is not None
+            for name in ["requests", "retries", "repairs", "wall_time", "prompt_tokens", "completion_tokens", "cost"]:
+                row[name] += getattr(r, name)
+            if not r.cache_hit and r.time_to_first_token is not None: row["first_token_times"].append(r.time_to_first_token)
+        rows = list(groups.values())
+        for row in rows:
+            times = row.pop("first_token_times")
+            row["hit_rate"] = row["cache_hits"] / row["calls"]
+            row["mean_time_to_first_token"] = sum(times) / len(times) if times else None
+        return rows
+
+    def table(self, run_no: Optional[int] = None) -> str:
+        rows = self.summary(("phase", "step", "iteration"), run_no)
+        if not rows: return "No LLM calls"
+        lines = [f"{'phase':<16}{'step':<9}{'iter':>5}{'calls':>7}{'hits':>6}{'wall s':>9}{'ttft s':>8}{'prompt tok':>12}{'compl tok':>11}{'cost $':>9}"]
+        for row in rows + [self.total(rows)]:
+            ttft = row["mean_time_to_first_token"]
+            lines.append(f"{row['phase']:<16}{row['step']:<9}{row['iteration'] if row['iteration'] is not None else '':>5}"
+                f"{row['calls']:>7}{row['cache_hits']:>6}{row['wall_time']:>9.2f}{ttft if ttft is not None else float('nan'):>8.2f}"
+                f"{row['prompt_tokens']:>12}{row['completion_tokens']:>11}{row['cost']:>9.4f}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def total(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        total = {"phase": "total", "step": "", "iteration": None, "mean_time_to_first_token": None}
+        for name in ["calls", "cache_hits", "wall_time", "prompt_tokens", "completion_tokens", "cost"]:
+            total[name] = sum(row[name] for row in rows)
+        return total
+
+    def prometheus(self) -> str:
+        '''Totals per phase and step in the Prometheus text format'''
+        metrics = [
+            ("builderbot_llm_calls_total", "counter", "Calls for an LLM response", "calls"),
+            ("builderbot_llm_cache_hits_total", "counter", "Calls answered from the cache", "cache_hits"),
+            ("builderbot_llm_requests_total", "counter", "Requests sent to the LLM", "requests"),
+            ("builderbot_llm_retries_total", "counter", "Retried requests", "retries"),
+            ("builderbot_llm_errors_total", "counter", "Calls which failed", "errors"),
+            ("builderbot_llm_wall_seconds_total", "counter", "Wall time of calls", "wall_time"),
+            ("builderbot_llm_prompt_tokens_total", "counter", "Prompt tokens sent", "prompt_tokens"),
+            ("builderbot_llm_completion_tokens_total", "counter", "Completion tokens received", "completion_tokens"),
+            ("builderbot_llm_cost_dollars_total", "counter", "Estimated cost", "cost"),
+        ]
+        rows = self.summary(("phase", "step", "model"))
+        lines = []
+        for name, kind, help_text, column in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for row in rows:
+                labels = ",".join(f'{label}="{row[label] or ""}"' for label in ["phase", "step", "model"])
+                lines.append(f"{name}{{{labels}}} {row[column]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as file: file.write(self.prometheus())
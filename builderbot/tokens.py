@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Optional
+
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    '''Number of tokens of `text`. Uses tiktoken if it is installed, and a 4 characters per token estimate otherwise.'''
+    encoding = _encoding(model)
+    if encoding is None: return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+# context window sizes in tokens, by model name prefix (longest prefix wins)
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+def context_window(model: Optional[str]) -> int:
+    prefixes = [prefix for prefix in CONTEXT_WINDOWS if model and model.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(prefixes, key=len)] if prefixes else DEFAULT_CONTEXT_WINDOW
+
+# dollars per 1000 prompt and completion tokens, by model name prefix (longest prefix wins)
+PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    '''Cost of a request in dollars, or 0 for unknown models'''
+    prefixes = [prefix for prefix in PRICES if model and model.startswith(prefix)]
+    if not prefixes: return 0.0
+    prompt_price, completion_price = PRICES[max(prefixes, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
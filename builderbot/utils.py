@@ -1,7 +1,33 @@
-import pkg_resources
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from importlib import resources
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
 
 def load_file(filename: str) -> str:
     return load_binary_file(filename).decode('utf-8')
 
 def load_binary_file(filename: str) -> bytes:
-    return pkg_resources.resource_string(__name__, filename)
+    return resources.files(__package__).joinpath(filename).read_bytes()
+
+def file_exists(filename: str) -> bool:
+    return resources.files(__package__).joinpath(filename).is_file()
+
+def file_mtime(filename: str) -> Optional[int]:
+    '''Modification time of a package file in nanoseconds, or None if it isn't a file on disk (eg in a zip)'''
+    path = resources.files(__package__).joinpath(filename)
+    try:
+        return os.stat(path).st_mtime_ns if isinstance(path, os.PathLike) else None
+    except OSError:
+        return None
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    '''Run a coroutine to completion from sync code, also when called from within a running event loop (eg Jupyter)'''
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,145 @@
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Type
+
+from .syntax import FILE_TYPES_TO_IGNORE, SyntaxValidator, syntax_validator_from_file_type
+
+CodeBase = Dict[str, str]
+Result = Tuple[bool, Optional[str]]
+
+
+@dataclass
+class FileReport:
+    file_name: str
+    language: str
+    ok: bool
+    error: Optional[str] = None
+    # whether the result was taken from a previous validation instead of checking the file again
+    cached: bool = False
+
+
+@dataclass
+class ValidationReport:
+    '''Result of validating a whole code base'''
+    files: List[FileReport] = field(default_factory=list)
+    # files for which there is no validator
+    unchecked: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool: return all(report.ok for report in self.files)
+
+    @property
+    def failed(self) -> List[FileReport]: return [report for report in self.files if not report.ok]
+
+    @property
+    def checked(self) -> int: return sum(not report.cached for report in self.files)
+
+    def __str__(self) -> str:
+        summary = f"Validated {len(self.files)} files ({self.checked} checked, {len(self.files) - self.checked} unchanged)"
+        if self.ok: return summary + ": no problems found"
+        problems = "\n".join(f"- {report.file_name} ({report.language}): {report.error}" for report in self.failed)
+        return summary + f": {len(self.failed)} with problems\n" + problems
+
+
+def validator_for(file_name: str) -> Optional[Type[SyntaxValidator]]:
+    if file_name.split(".")[-1] in FILE_TYPES_TO_IGNORE: return None
+    try:
+        return syntax_validator_from_file_type(file_name)
+    except ValueError:
+        return None
+
+def digest(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def check_chunk(validator: Type[SyntaxValidator], codes: List[str]) -> List[Result]:
+    return validator.check_many(codes)
+
+def format_chunk(validator: Type[SyntaxValidator], codes: List[str]) -> List[str]:
+    return [format_code(validator, code) for code in codes]
+
+def format_code(validator: Type[SyntaxValidator], code: str) -> str:
+    try:
+        return validator.format(code)
+    except Exception:
+        return code
+
+def chunks(items: List, n: int) -> List[List]:
+    size = -(-len(items) // n)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class ValidationEngine:
+    '''Validates the syntax of generated code bases.
+
+    Results are cached by (validator, content hash), so only files which changed since the last call are checked again.
+    Files are checked in one batch per validator. Batches of slow validators and formatting are spread over a process
+    pool, which is only started once a batch is large enough to be worth it.'''
+
+    def __init__(self, max_workers: Optional[int] = None, cache_size: int = 4096, min_parallel_batch: int = 8):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.min_parallel_batch = min_parallel_batch
+        self.cache: "OrderedDict[Tuple[str, str], Result]" = OrderedDict()
+        self.pool: Optional[Executor] = None
+
+    def validate(self, code_base: CodeBase) -> ValidationReport:
+        report = ValidationReport()
+        todo: Dict[Type[SyntaxValidator], List[Tuple[str, str]]] = {}
+        cached: Dict[str, FileReport] = {}
+        for file_name, content in code_base.items():
+            validator = validator_for(file_name)
+            if validator is None:
+                report.unchecked.append(file_name)
+                continue
+            key = (validator.__name__, digest(content))
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                ok, error = self.cache[key]
+                cached[file_name] = FileReport(file_name, validator.language(), ok, error, cached=True)
+            else:
+                todo.setdefault(validator, []).append((file_name, content))
+
+        checked: Dict[str, FileReport] = {}
+        for validator, files in todo.items():
+            codes = [content for _, content in files]
+            for (file_name, content), (ok, error) in zip(files, self.run(check_chunk, validator, codes, validator.cpu_bound)):
+                self.remember((validator.__name__, digest(content)), (ok, error))
+                checked[file_name] = FileReport(file_name, validator.language(), ok, error)
+
+        report.files = [checked.get(name) or cached[name] for name in code_base if name in checked or name in cached]
+        return report
+
+    def format(self, code_base: CodeBase) -> CodeBase:
+        '''Format all files which have a validator. Files with syntax errors are left as they are.'''
+        formatted = dict(code_base)
+        by_validator: Dict[Type[SyntaxValidator], List[str]] = {}
+        for file_name in code_base:
+            validator = validator_for(file_name)
+            if validator is not None and self.cache.get((validator.__name__, digest(code_base[file_name])), (True,))[0]:
+                by_validator.setdefault(validator, []).append(file_name)
+        for validator, names in by_validator.items():
+            results = self.run(format_chunk, validator, [code_base[name] for name in names], parallel=True)
+            formatted.update(zip(names, results))
+        return formatted
+
+    def run(self, function, validator: Type[SyntaxValidator], codes: List[str], parallel: bool) -> List:
+        if not parallel or len(codes) < self.min_parallel_batch: return function(validator, codes)
+        pool = self.get_pool()
+        futures = [pool.submit(function, validator, chunk) for chunk in chunks(codes, self.max_workers or os.cpu_count() or 1)]
+        return [result for future in futures for result in future.result()]
+
+    def get_pool(self) -> Executor:
+        if self.pool is None: self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    def remember(self, key: Tuple[str, str], result: Result) -> None:
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+
+    def close(self) -> None:
+        if self.pool is not None: self.pool.shutdown()
+        self.pool = None
@@ -0,0 +1,28 @@
+from typing import Optional
+from ...stages import DevPhase
+from .base import FormatError, FormatValidator
+from .code_base import CodeBaseValidator, FileContentValidator
+from .edits import EDIT_HEADER, EditsValidator
+from .project_description import ProjectDescriptionValidator
+
+
+def format_validator(phase: DevPhase, variant: str = "") -> Optional[FormatValidator]:
+    '''Validator for the output format the prompt of (phase, variant) asks for'''
+    if phase == DevPhase.UNDERSTAND: return ProjectDescriptionValidator()
+    if phase in (DevPhase.STRUCTURE_CODE, DevPhase.STRUCTURE_TESTS): return CodeBaseValidator()
+    if phase == DevPhase.WRITE_CODE:
+        if variant == "edits": return EditsValidator()
+        if variant == "file": return FileContentValidator()
+        return CodeBaseValidator(allow_done=True)
+    return None
+
+__all__ = [
+    "format_validator",
+    "CodeBaseValidator",
+    "EDIT_HEADER",
+    "EditsValidator",
+    "FileContentValidator",
+    "FormatError",
+    "FormatValidator",
+    "ProjectDescriptionValidator",
+]
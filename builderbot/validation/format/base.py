@@ -0,0 +1,49 @@
+from typing import Optional
+from ...streaming import StreamConsumer
+
+
+class FormatError(ValueError):
+    '''LLM output doesn't follow the format asked for in the prompt'''
+
+    def __init__(self, message: str, line_no: Optional[int] = None):
+        super().__init__(f"line {line_no}: {message}" if line_no else message)
+        self.line_no = line_no
+
+
+class FormatValidator(StreamConsumer):
+    '''Checks a response line by line while it is streamed. Sets `error` as soon as the response can't be
+    valid anymore, however it continues, so that the request can be aborted early.'''
+
+    def reset(self) -> None:
+        super().reset()
+        self.buffer = ""
+        self.line_no = 0
+
+    def on_text(self, text: str) -> None:
+        *lines, self.buffer = (self.buffer + text).split("\n")
+        for line in lines: self.check_line(line)
+
+    def close(self) -> None:
+        if self.buffer: self.check_line(self.buffer)
+        self.buffer = ""
+        if self.error is None: self.check_end()
+
+    def check_line(self, line: str) -> None:
+        if self.error is not None: return
+        self.line_no += 1
+        self.on_line(line)
+
+    def fail(self, message: str, line_no: Optional[int] = None) -> None:
+        if self.error is None: self.error = FormatError(message, self.line_no if line_no is None else line_no)
+
+    def on_line(self, line: str) -> None:
+        '''Check the next complete line, and call `fail` if it's invalid'''
+
+    def check_end(self) -> None:
+        '''Check that the complete response is valid, and call `fail` if not'''
+
+    def validate(self, text: str) -> None:
+        '''Check a complete response. Raises FormatError.'''
+        self.reset()
+        self.finish(text)
+        if self.error is not None: raise self.error
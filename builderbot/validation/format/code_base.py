@@ -0,0 +1,47 @@
+from typing_extensions import override
+from .base import FormatValidator
+
+
+class CodeBaseValidator(FormatValidator):
+    '''"File: <name>" blocks, each closed by a "--" line. If `allow_done`, the response may also be just "Done".'''
+
+    def __init__(self, allow_done: bool = False):
+        self.allow_done = allow_done
+        super().__init__()
+
+    @override
+    def reset(self) -> None:
+        super().reset()
+        self.in_file = False
+        self.first_line = False
+        self.files = 0
+        self.done = False
+
+    @override
+    def on_line(self, line: str) -> None:
+        if self.done:
+            if line.strip(): self.fail(f"unexpected {line.strip()!r} after 'Done'")
+        elif self.in_file:
+            if self.first_line and line.lstrip().startswith("```"): self.fail("files must not be wrapped in ``` code fences")
+            self.first_line = False
+            if line.rstrip() == "--": self.in_file = False
+        elif line.startswith("File: "):
+            if not line[6:].strip(): return self.fail("missing file name")
+            self.in_file, self.first_line, self.files = True, True, self.files + 1
+        elif self.allow_done and line.strip() == "Done" and self.files == 0:
+            self.done = True
+        elif line.strip():
+            self.fail(f"expected 'File: <name>', got {line.strip()!r}")
+
+    @override
+    def check_end(self) -> None:
+        if not self.files and not self.done: self.fail("there are no files")
+
+
+class FileContentValidator(FormatValidator):
+    '''Content of a single file, or "Done"'''
+
+    @override
+    def on_line(self, line: str) -> None:
+        if self.line_no == 1 and line.lstrip().startswith("```"): self.fail("the file must not be wrapped in ``` code fences")
+        if self.line_no == 1 and line.startswith("File: "): self.fail("output only the file's content, without 'File: <name>'")
@@ -0,0 +1,40 @@
+import re
+from typing_extensions import override
+from .base import FormatValidator
+
+EDIT_HEADER = re.compile(r"@@ (insert after|replace|delete) lines? (\d+)(?:\s*-\s*(\d+))?\s*$", re.IGNORECASE)
+
+
+class EditsValidator(FormatValidator):
+    '''"File: <name>" blocks of "@@ <edit>" sections, each block closed by a "--" line, or just "Done"'''
+
+    @override
+    def reset(self) -> None:
+        super().reset()
+        self.in_file = False
+        self.edit = None
+        self.files = 0
+        self.done = False
+
+    @override
+    def on_line(self, line: str) -> None:
+        if self.done:
+            if line.strip(): self.fail(f"unexpected {line.strip()!r} after 'Done'")
+        elif not self.in_file:
+            if line.startswith("File: "): self.in_file, self.edit, self.files = True, None, self.files + 1
+            elif line.strip() == "Done" and self.files == 0: self.done = True
+            elif line.strip(): self.fail(f"expected 'File: <name>', got {line.strip()!r}")
+        elif line.rstrip() == "--":
+            self.in_file = False
+        elif line.startswith("@@"):
+            self.edit = EDIT_HEADER.match(line)
+            if self.edit is None: self.fail(f"invalid edit {line.strip()!r}")
+            elif self.edit.group(3) and int(self.edit.group(3)) < int(self.edit.group(2)): self.fail(f"invalid line range in {line.strip()!r}")
+        elif self.edit is None:
+            self.fail(f"expected an edit ('@@ ...'), got {line.strip()!r}")
+        elif self.edit.group(1).lower() == "delete" and line.strip():
+            self.fail(f"unexpected {line.strip()!r} after {self.edit.group(0)!r}")
+
+    @override
+    def check_end(self) -> None:
+        if not self.files and not self.done: self.fail("there are no edits")
@@ -0,0 +1,59 @@
+import re
+from typing import List, Optional
+from typing_extensions import override
+from .base import FormatValidator
+
+SECTIONS = ["requirements", "assumptions", "questions"]
+HEADER = re.compile(r"^[#*\s]*(requirements|assumptions|questions)[*\s]*:[*\s]*(.*)$", re.IGNORECASE)
+BULLET = re.compile(r"^\s*[-*] (.*)$")
+NOTHING = re.compile(r"^\s*(none|n/?a)\.?\s*$", re.IGNORECASE)  # a section without items
+
+
+class ProjectDescriptionValidator(FormatValidator):
+    '''Requirements, assumptions and questions, each a list of "- " bullets, in this order.
+    Instead of questions, the model may say that it has no questions, and an empty section may say "None" or "N/A".
+    Text after a header on the same line is allowed.'''
+
+    @override
+    def reset(self) -> None:
+        super().reset()
+        self.section: Optional[str] = None
+        self.items = {section: [] for section in SECTIONS}
+        self.no_questions = False
+
+    @override
+    def on_line(self, line: str) -> None:
+        if not line.strip(): return
+        header = HEADER.match(line)
+        if header:
+            expected = self.next_section()
+            if expected is None: return self.fail(f"unexpected {line.strip()!r} after the questions")
+            if header.group(1).lower() != expected: return self.fail(f"expected the {expected} section, got {line.strip()!r}")
+            self.section = expected
+            rest = header.group(2)
+            if BULLET.match(rest) or self.is_no_questions(rest): self.on_line(rest)
+            return
+        if self.section is None: return self.fail(f"expected 'Requirements:', got {line.strip()!r}")
+        bullet = BULLET.match(line)
+        if bullet: self.items[self.section].append(bullet.group(1).strip())
+        elif self.is_no_questions(line): self.no_questions = True
+        elif NOTHING.match(line): return
+        elif line[0].isspace() and self.items[self.section]: self.items[self.section][-1] += " " + line.strip()  # continued bullet
+        else: self.fail(f"expected '- <{self.section[:-1]}>', got {line.strip()!r}")
+
+    @override
+    def check_end(self) -> None:
+        if self.next_section() is not None: return self.fail(f"the {self.next_section()} section is missing")
+        if not self.items["requirements"]: self.fail("there are no requirements")
+
+    def is_no_questions(self, line: str) -> bool:
+        return self.section == "questions" and "no questions" in line.lower() and not self.items["questions"]
+
+    def next_section(self) -> Optional[str]:
+        if self.section is None: return SECTIONS[0]
+        i = SECTIONS.index(self.section) + 1
+        return SECTIONS[i] if i < len(SECTIONS) else None
+
+    @property
+    def questions(self) -> Optional[List[str]]:
+        return None if self.no_questions else self.items["questions"]
@@ -0,0 +1,205 @@
+'''Long-lived linter processes, so that checking JavaScript and Vue files doesn't pay Node's startup time for every file.
+
+A worker reads one JSON request per line on stdin and answers with one JSON line on stdout:
+
+    {"id": 1, "action": "lint", "files": [{"name": "a.js", "content": "..."}]}
+    {"id": 1, "results": [{"name": "a.js", "diagnostics": [{"line": 1, "column": 5, "message": "...", "severity": "error", "rule": null}]}]}
+
+For `"action": "format"` each result has a `"formatted"` field instead. A worker that can't handle a request answers
+with `{"id": 1, "error": "..."}`, and adds `"unavailable": true` if it is missing something it needs, like eslint itself.'''
+import atexit
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "linter_worker.js")
+DEFAULT_COMMAND = ["node", WORKER_SCRIPT]
+
+
+class LinterError(Exception):
+    pass
+
+class LinterUnavailable(LinterError):
+    '''The linter command couldn't be started, eg because Node isn't installed'''
+
+class LinterTimeout(LinterError):
+    pass
+
+class WorkerCrashed(LinterError):
+    pass
+
+
+@dataclass
+class Diagnostic:
+    line: int
+    column: int
+    message: str
+    severity: str = "error"
+    rule: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, diagnostic: Dict) -> "Diagnostic":
+        return cls(diagnostic.get("line") or 0, diagnostic.get("column") or 0, diagnostic["message"],
+            diagnostic.get("severity", "error"), diagnostic.get("rule"))
+
+    def __str__(self) -> str:
+        rule = f" ({self.rule})" if self.rule else ""
+        return f"Line {self.line}, column {self.column}: {self.severity}: {self.message}{rule}"
+
+
+class LinterWorker:
+    '''One linter process. It is started on the first request and restarted on the next request after it died.'''
+
+    def __init__(self, command: List[str]):
+        self.command = command
+        self.process: Optional[subprocess.Popen] = None
+        self.responses: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.last_id = 0
+        self.starts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        try:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except OSError as e:
+            raise LinterUnavailable(f"Couldn't start linter {' '.join(self.command)}: {e}") from e
+        self.starts += 1
+        # each process gets its own queue, so late output of a killed process can't be mistaken for a response
+        self.responses = queue.Queue()
+        threading.Thread(target=read_lines, args=(self.process.stdout, self.responses), daemon=True).start()
+
+    def stop(self) -> None:
+        if self.process is None: return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
+
+    def request(self, action: str, files: List[Dict], timeout: float) -> List[Dict]:
+        if not self.alive:
+            self.stop()
+            self.start()
+        self.last_id += 1
+        try:
+            self.process.stdin.write(json.dumps({"id": self.last_id, "action": action, "files": files}) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            self.stop()
+            raise WorkerCrashed(f"Linter exited before reading the request: {e}") from e
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.responses.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.stop()
+                raise LinterTimeout(f"Linter didn't answer within {timeout}s")
+            if line is None:
+                self.stop()
+                raise WorkerCrashed("Linter exited before answering")
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # stray output, eg logging
+            if not isinstance(response, dict) or response.get("id") != self.last_id: continue
+            if "error" in response:
+                raise (LinterUnavailable if response.get("unavailable") else LinterError)(response["error"])
+            return response["results"]
+
+def read_lines(stream, lines: "queue.Queue[Optional[str]]") -> None:
+    try:
+        for line in stream: lines.put(line)
+    except (OSError, ValueError):
+        pass
+    lines.put(None)
+
+
+class LinterPool:
+    '''A fixed number of linter workers, which take files in batches.
+
+    A batch is retried on a fresh worker if its worker crashed, up to `max_retries` times. A batch that takes longer
+    than `timeout` seconds fails, and its worker is restarted for the next batch.'''
+
+    def __init__(self, command: List[str] = DEFAULT_COMMAND, size: int = 2, timeout: float = 30.0, max_retries: int = 1,
+        batch_size: int = 50):
+        self.command = command
+        self.size = size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self.workers = [LinterWorker(command) for _ in range(size)]
+        self.idle: "queue.Queue[LinterWorker]" = queue.Queue()
+        for worker in self.workers: self.idle.put(worker)
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    @property
+    def starts(self) -> int:
+        '''How many worker processes have been started, including restarts'''
+        return sum(worker.starts for worker in self.workers)
+
+    def lint(self, files: Dict[str, str]) -> Dict[str, List[Diagnostic]]:
+        results = self.run("lint", files)
+        return {name: [Diagnostic.from_dict(d) for d in results[name].get("diagnostics", [])] for name in files}
+
+    def format(self, files: Dict[str, str]) -> Dict[str, str]:
+        results = self.run("format", files)
+        return {name: results[name].get("formatted", content) for name, content in files.items()}
+
+    def run(self, action: str, files: Dict[str, str]) -> Dict[str, Dict]:
+        items = [{"name": name, "content": content} for name, content in files.items()]
+        n_batches = max(min(self.size, len(items)), -(-len(items) // self.batch_size))
+        batches = [items[i::n_batches] for i in range(n_batches)]
+        futures = [self.executor.submit(self.run_batch, action, batch) for batch in batches if batch]
+        results = {}
+        for future in futures:
+            for result in future.result(): results[result["name"]] = result
+        missing = set(files) - set(results)
+        if missing: raise LinterError(f"Linter returned no result for {', '.join(sorted(missing))}")
+        return results
+
+    def run_batch(self, action: str, batch: List[Dict]) -> List[Dict]:
+        worker = self.idle.get()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return worker.request(action, batch, self.timeout)
+                except WorkerCrashed:
+                    if attempt == self.max_retries: raise
+        finally:
+            self.idle.put(worker)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        for worker in self.workers: worker.stop()
+
+
+_pool: Optional[LinterPool] = None
+
+def get_linter_pool() -> LinterPool:
+    '''The shared pool used by the JavaScript and Vue validators. It is created on first use.'''
+    global _pool
+    if _pool is None:
+        _pool = LinterPool()
+        atexit.register(_pool.close)
+    return _pool
+
+def set_linter_pool(pool: Optional[LinterPool]) -> None:
+    '''Replace the shared pool, eg to use a different linter command'''
+    global _pool
+    if _pool is not None and _pool is not pool: _pool.close()
+    _pool = pool
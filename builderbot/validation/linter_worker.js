@@ -0,0 +1,86 @@
+// Long-lived linter worker, see builderbot/validation/linter.py for the protocol.
+const readline = require("readline");
+
+function unavailable(message) {
+  return Object.assign(new Error(message), { unavailable: true });
+}
+
+let eslint = null;
+let vueParser = null;  // path of vue-eslint-parser, or an error if it isn't installed
+function getESLint() {
+  if (eslint) return eslint;
+  let ESLint;
+  try {
+    ({ ESLint } = require("eslint"));
+  } catch (e) {
+    throw unavailable(`eslint is not installed: ${e.message}`);
+  }
+  try {
+    vueParser = require.resolve("vue-eslint-parser");
+  } catch (e) {
+    vueParser = unavailable(`vue-eslint-parser is not installed: ${e.message}`);
+  }
+  eslint = new ESLint({
+    useEslintrc: false,
+    overrideConfig: {
+      parserOptions: { ecmaVersion: "latest", sourceType: "module" },
+      env: { browser: true, node: true, es2022: true },
+      overrides: typeof vueParser === "string" ? [{ files: ["*.vue"], parser: vueParser }] : [],
+    },
+  });
+  return eslint;
+}
+
+let prettier;
+function getPrettier() {
+  if (prettier === undefined) {
+    try { prettier = require("prettier"); } catch (e) { prettier = null; }
+  }
+  return prettier;
+}
+
+async function lint(file) {
+  const linter = getESLint();
+  if (file.name.endsWith(".vue") && vueParser instanceof Error) throw vueParser;
+  const [result] = await linter.lintText(file.content, { filePath: file.name });
+  return {
+    name: file.name,
+    diagnostics: result.messages.map((m) => ({
+      line: m.line || 0,
+      column: m.column || 0,
+      message: m.message,
+      severity: m.severity === 2 ? "error" : "warning",
+      rule: m.ruleId || null,
+    })),
+  };
+}
+
+async function format(file) {
+  const p = getPrettier();
+  if (!p) return { name: file.name, formatted: file.content };
+  try {
+    return { name: file.name, formatted: await p.format(file.content, { filepath: file.name }) };
+  } catch (e) {
+    return { name: file.name, formatted: file.content };
+  }
+}
+
+const actions = { lint, format };
+
+readline.createInterface({ input: process.stdin }).on("line", async (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    return;
+  }
+  let response;
+  try {
+    const action = actions[request.action];
+    if (!action) throw new Error(`Unknown action ${request.action}`);
+    response = { id: request.id, results: await Promise.all(request.files.map(action)) };
+  } catch (e) {
+    response = { id: request.id, error: String((e && e.message) || e), unavailable: Boolean(e && e.unavailable) };
+  }
+  process.stdout.write(JSON.stringify(response) + "\n");
+});
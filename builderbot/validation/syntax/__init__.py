@@ -1,15 +1,18 @@
+from typing import Type
 from .base import SyntaxValidator, FILE_TYPES_TO_IGNORE
 from .css import CSSValidator
 from .html import HTMLValidator
 from .javascript import JavascriptValidator
 from .python import PythonValidator
+from .vue import VueValidator
 
 
-def syntax_validator_from_file_type(filename: str) -> SyntaxValidator:
+def syntax_validator_from_file_type(filename: str) -> Type[SyntaxValidator]:
         if filename.endswith(".py"): return PythonValidator
         if filename.endswith(".js"): return JavascriptValidator
-        if filename.endswith(".html"): return HTMLValidator()
-        if filename.endswith(".css"): return CSSValidator()
+        if filename.endswith(".html"): return HTMLValidator
+        if filename.endswith(".css"): return CSSValidator
+        if filename.endswith(".vue"): return VueValidator
         raise ValueError(f"Couldn't figure the right SyntaxValidator for this file: {filename}")
 
 __all__ = [
@@ -20,4 +23,5 @@ __all__ = [
     "HTMLValidator",
     "JavascriptValidator",
     "PythonValidator",
+    "VueValidator",
 ]
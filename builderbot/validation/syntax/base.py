@@ -1,6 +1,6 @@
 from __future__ import annotations
 from abc import abstractmethod
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 
 FILE_TYPES_TO_IGNORE = [
     'env',
@@ -10,10 +10,18 @@ FILE_TYPES_TO_IGNORE = [
 ]
 
 class SyntaxValidator:
+    # whether checking is slow enough to be worth running in a separate process
+    cpu_bound: bool = False
+
     @classmethod
     def check_syntax(cls, code: str) -> Tuple[bool, Optional[str]]:
         pass
 
+    @classmethod
+    def check_many(cls, codes: List[str]) -> List[Tuple[bool, Optional[str]]]:
+        '''Check several files at once. Override this if batching is cheaper than checking files one by one.'''
+        return [cls.check_syntax(code) for code in codes]
+
     @classmethod
     def format(cls, code: str) -> str:
         pass
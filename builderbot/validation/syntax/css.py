@@ -0,0 +1,44 @@
+from typing import Optional, Tuple
+from typing_extensions import override
+from .base import SyntaxValidator
+
+
+class CSSValidator(SyntaxValidator):
+    '''Checks that comments and strings are closed and braces are balanced'''
+
+    cpu_bound = True  # scans the code character by character in Python
+
+    @classmethod
+    @override
+    def check_syntax(cls, code: str) -> Tuple[bool, Optional[str]]:
+        depth, line_no, i, quote = 0, 1, 0, None
+        while i < len(code):
+            char = code[i]
+            if char == "\n":
+                if quote: return False, f"Line {line_no}: unclosed string"
+                line_no += 1
+            elif quote:
+                if char == "\\": i += 1
+                elif char == quote: quote = None
+            elif code.startswith("/*", i):
+                end = code.find("*/", i + 2)
+                if end == -1: return False, f"Line {line_no}: unclosed comment"
+                line_no += code.count("\n", i, end)
+                i = end + 1
+            elif char in "'\"": quote = char
+            elif char == "{": depth += 1
+            elif char == "}":
+                if depth == 0: return False, f"Line {line_no}: unexpected '}}'"
+                depth -= 1
+            i += 1
+        if quote: return False, f"Line {line_no}: unclosed string"
+        if depth: return False, f"{depth} unclosed '{{'"
+        return True, None
+
+    @classmethod
+    def format(cls, code: str) -> str:
+        return code
+
+    @classmethod
+    @override
+    def language(cls) -> str: return "CSS"
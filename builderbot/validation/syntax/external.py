@@ -0,0 +1,43 @@
+from typing import List, Optional, Tuple
+from typing_extensions import override
+from ..linter import Diagnostic, LinterError, LinterUnavailable, get_linter_pool
+from .base import SyntaxValidator
+
+
+class ExternalLinterValidator(SyntaxValidator):
+    '''Validator which sends files in batches to the shared linter pool'''
+
+    extension: str = ""
+
+    @classmethod
+    def diagnose_many(cls, codes: List[str]) -> List[List[Diagnostic]]:
+        names = [f"file{i}.{cls.extension}" for i in range(len(codes))]
+        diagnostics = get_linter_pool().lint(dict(zip(names, codes)))
+        return [diagnostics[name] for name in names]
+
+    @classmethod
+    @override
+    def check_many(cls, codes: List[str]) -> List[Tuple[bool, Optional[str]]]:
+        if not codes: return []
+        try:
+            diagnostics = cls.diagnose_many(codes)
+        except LinterUnavailable:
+            return [(True, None)] * len(codes)  # can't check without the linter
+        except LinterError as e:
+            return [(False, f"Linting failed: {e}")] * len(codes)
+        errors = [[d for d in file_diagnostics if d.severity == "error"] for file_diagnostics in diagnostics]
+        return [(not file_errors, "\n".join(map(str, file_errors)) or None) for file_errors in errors]
+
+    @classmethod
+    @override
+    def check_syntax(cls, code: str) -> Tuple[bool, Optional[str]]:
+        return cls.check_many([code])[0]
+
+    @classmethod
+    @override
+    def format(cls, code: str) -> str:
+        name = f"file.{cls.extension}"
+        try:
+            return get_linter_pool().format({name: code})[name]
+        except LinterError:
+            return code
@@ -0,0 +1,56 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+from typing_extensions import override
+from .base import SyntaxValidator
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr", "!doctype"}
+# elements whose end tag may be omitted
+OPTIONAL_END_TAG = {"html", "head", "body", "p", "li", "dt", "dd", "option", "optgroup", "tr", "td", "th", "thead", "tbody",
+    "tfoot", "colgroup", "rp", "rt"}
+
+
+class TagBalanceParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[Tuple[str, int]] = []
+        self.errors: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS: self.stack.append((tag, self.getpos()[0]))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS: return
+        line = self.getpos()[0]
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            return self.errors.append(f"Line {line}: </{tag}> without <{tag}>")
+        while self.stack:
+            open_tag, open_line = self.stack.pop()
+            if open_tag == tag: break
+            if open_tag not in OPTIONAL_END_TAG: self.errors.append(f"Line {open_line}: <{open_tag}> is closed by </{tag}> in line {line}")
+
+    def unclosed(self) -> List[str]:
+        return [f"Line {line}: <{tag}> is never closed" for tag, line in self.stack if tag not in OPTIONAL_END_TAG]
+
+
+class HTMLValidator(SyntaxValidator):
+    '''Checks that tags are balanced'''
+
+    cpu_bound = True  # html.parser is pure Python
+
+    @classmethod
+    @override
+    def check_syntax(cls, code: str) -> Tuple[bool, Optional[str]]:
+        parser = TagBalanceParser()
+        parser.feed(code)
+        parser.close()
+        errors = parser.errors + parser.unclosed()
+        if errors: return False, "\n".join(errors)
+        return True, None
+
+    @classmethod
+    def format(cls, code: str) -> str:
+        return code
+
+    @classmethod
+    @override
+    def language(cls) -> str: return "HTML"
@@ -1,6 +1,6 @@
+import ast
 import traceback
 from typing import Optional, Tuple
-import black
 from typing_extensions import override
 
 from .base import SyntaxValidator
@@ -11,14 +11,16 @@ class PythonValidator(SyntaxValidator):
     @classmethod
     @override
     def check_syntax(cls, code: str) -> Tuple[bool, Optional[str]]:
+        # compiling to an AST is much cheaper than formatting, and finds the same syntax errors
         try:
-            black.format_str(code, mode=black.Mode())
-        except Exception as e:
-            return False, traceback.format_exc()
+            compile(code, "<file>", "exec", flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+        except (SyntaxError, ValueError):
+            return False, traceback.format_exc(limit=0)
         return True, None
         
     @classmethod
     def format(cls, code: str) -> str:
+        import black  # slow to import, and only needed for formatting
         return black.format_str(code, mode=black.Mode())
         
     @classmethod
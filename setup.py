@@ -5,6 +5,6 @@ setup(
     version="0.1",
     packages=find_packages(),
     package_data={
-        'builderbot': ['prompts/*.txt'],
+        'builderbot': ['prompts/*.txt', 'validation/linter_worker.js'],
     },
 )
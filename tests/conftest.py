@@ -0,0 +1,89 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Type, Union
+import pytest
+from langchain.chat_models.base import SimpleChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from pydantic import Field
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class FakeCalls:
+    '''Requests to a FakeChatModel and to the copies made of it, eg for sampling'''
+    def __init__(self):
+        self.prompts: List[List[BaseMessage]] = []
+        self.running = self.max_running = 0
+        self.streamed = 0  # chunks
+        self.cancelled = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.prompts)
+
+
+def last_characters(llm: "FakeChatModel", messages: List[BaseMessage]) -> str:
+    return messages[-1].content[-10:]
+
+
+class FakeChatModel(SimpleChatModel):
+    '''Chat model for tests. `respond(llm, messages)` is the response to a request, or a list of responses for a model
+    with `n` > 1. The first `failures` requests fail with a rate limit error.
+    A request takes `delay` seconds, or `delay(request_no)` seconds, counting from 1. With `chunk_size`, the (first)
+    response is streamed in chunks of that many characters instead, each after `delay` seconds.'''
+    respond: Callable[["FakeChatModel", List[BaseMessage]], Union[str, List[str]]] = last_characters
+    model_name: str = "fake"
+    n: Optional[int] = None
+    delay: Union[float, Callable[[int], float]] = 0.0
+    chunk_size: Optional[int] = None
+    failures: int = 0
+    calls: FakeCalls = Field(default_factory=FakeCalls)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _responses(self, messages: List[BaseMessage]) -> List[str]:
+        self.calls.prompts.append(messages)
+        if self.calls.count <= self.failures: raise RateLimitError("slow down")
+        responses = self.respond(self, messages)
+        return [responses] if isinstance(responses, str) else responses
+
+    def _delay(self) -> float:
+        return self.delay(self.calls.count) if callable(self.delay) else self.delay
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None) -> str:
+        response = self._responses(messages)[0]
+        time.sleep(self._delay())
+        return response
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager=None) -> ChatResult:
+        responses = self._responses(messages)
+        delay = self._delay()
+        self.calls.running += 1
+        self.calls.max_running = max(self.calls.max_running, self.calls.running)
+        try:
+            if self.chunk_size is None:
+                await asyncio.sleep(delay)
+            else:
+                for i in range(0, len(responses[0]), self.chunk_size):
+                    await asyncio.sleep(delay)
+                    self.calls.streamed += 1
+                    if run_manager: await run_manager.on_llm_new_token(responses[0][i:i + self.chunk_size])
+        except asyncio.CancelledError:
+            self.calls.cancelled += 1
+            raise
+        finally:
+            self.calls.running -= 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text)) for text in responses])
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+
+@pytest.fixture
+def fake_llm() -> Type[FakeChatModel]:
+    return FakeChatModel
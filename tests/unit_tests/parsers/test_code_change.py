@@ -1,5 +1,7 @@
+import pytest
 from builderbot.models.code_base import CodeBase, CodeFile
-from builderbot.models.code_change import CodeChange, CodeFileChange, Insertion, Deletion, Replacement
+from builderbot.models.code_change import CodeChange, CodeChangeError, CodeFileChange, Insertion, Deletion, Replacement
+from builderbot.parser import EditFormatError, str_to_code_change
 
 
 def test_insertion():
@@ -44,3 +46,38 @@ def test_insertion_deletion_and_replacement():
     assert lines[2].content == "line 2"
     assert lines[3].content == "updated line 4"
     assert lines[4].content == "line 5"
+
+def test_overlapping_changes():
+    base = CodeBase(files=[CodeFile(name="test.py", content="\n".join([f"line {i}" for i in range(1, 6)]))])
+    changes = [Deletion(line_number_start=2, line_number_end=4), Insertion(line_number_start=3, new_lines=["new"])]
+    with pytest.raises(CodeChangeError):
+        base.with_change(CodeChange(files=[CodeFileChange(name="test.py", changes=changes)]))
+    with pytest.raises(CodeChangeError):
+        base.with_change(CodeChange(files=[CodeFileChange(name="test.py", changes=[Deletion(line_number_start=5, line_number_end=6)])]))
+
+def test_round_trip_and_new_files():
+    codebase = {"a.py": "x = 1\ny = 2\n", "b.py": "print(x)"}
+    base = CodeBase.from_dict(codebase)
+    assert base.to_dict() == codebase
+    assert base.numbered() == "File: a.py\n1   x = 1\n2   y = 2\n--\nFile: b.py\n1   print(x)\n--\n"
+
+    change = CodeChange(files=[CodeFileChange(name="c.py", changes=[Insertion(line_number_start=0, new_lines=["z = 3"])])])
+    new_base = base.with_change(change)
+    assert new_base.to_dict() == {**codebase, "c.py": "z = 3\n"}
+    assert new_base.files[0] is base.files[0]  # unchanged files are shared
+
+def test_parse_edits():
+    text = "File: a.py\n@@ insert after line 0\n# header\n@@ replace line 2\ny = 3\n--\nFile: b.py\n@@ delete lines 1-1\n--\n"
+    change = str_to_code_change(text)
+    assert change == CodeChange(files=[
+        CodeFileChange(name="a.py", changes=[Insertion(line_number_start=0, new_lines=["# header"]),
+            Replacement(line_number_start=2, line_number_end=2, new_lines=["y = 3"])]),
+        CodeFileChange(name="b.py", changes=[Deletion(line_number_start=1, line_number_end=1)]),
+    ])
+    base = CodeBase.from_dict({"a.py": "x = 1\ny = 2\n", "b.py": "print(x)"})
+    assert base.with_change(change).to_dict() == {"a.py": "# header\nx = 1\ny = 3\n", "b.py": ""}
+
+def test_parse_invalid_edits():
+    for text in ["x = 1\n", "File: a.py\nx = 1\n--\n", "File: a.py\n@@ move line 1\n--\n"]:
+        with pytest.raises(EditFormatError):
+            str_to_code_change(text)
@@ -0,0 +1,58 @@
+import re
+import pytest
+from builderbot.parser import str_to_codebase, str_to_project_description
+from builderbot.validation.format import CodeBaseValidator, EditsValidator, FormatError, ProjectDescriptionValidator
+
+DESCRIPTION = "Requirements:\n- a\n- b\n  continued\n\nAssumptions:\n- c\n\nQuestions:\n- d?\n"
+
+def test_project_description():
+    assert str_to_project_description(DESCRIPTION) == (["a", "b continued"], ["c"], ["d?"])
+    assert str_to_project_description("**Requirements:**\n- a\nAssumptions:\nQuestions:\nno questions") == (["a"], [], None)
+
+def baseline_project_description(text):
+    '''The parser before format validation, which split the sections at blank lines'''
+    sections = re.split(r'\n\n', text)
+    questions = None if 'no questions' in sections[2] else re.findall(r'- (.*)', sections[2])
+    return re.findall(r'- (.*)', sections[0]), re.findall(r'- (.*)', sections[1]), questions
+
+@pytest.mark.parametrize("text", [
+    "Requirements:\n- a\n\nAssumptions:\n- c\n\nQuestions: no questions",
+    "Requirements:\n- a\n\nAssumptions:\nNone\n\nQuestions:\nN/A",
+    "Requirements: here they are\n- a\n\nAssumptions: - c\n\nQuestions:\nI have no questions.",
+])
+def test_lenient_project_description(text):
+    assert str_to_project_description(text) == baseline_project_description(text)
+
+@pytest.mark.parametrize("text", [
+    "Requirements:\n- a\n\nAssumptions:\n- c\n",  # used to raise IndexError
+    "Here are the requirements:\n- a\n",
+    "Requirements:\n- a\n\nQuestions:\n- d?\n",
+    "Requirements:\n\nAssumptions:\n\nQuestions:\nno questions",
+    "Requirements:\nSome prose\n",
+])
+def test_invalid_project_description(text):
+    with pytest.raises(FormatError):
+        str_to_project_description(text)
+
+def test_errors_are_found_early():
+    validator = ProjectDescriptionValidator()
+    validator.feed("Requirements:\n- a\n- b\n\nSure! Here's more:\n")
+    assert validator.error is not None and validator.error.line_no == 5
+    validator.feed("- lots of other text\n" * 100)
+    assert validator.error.line_no == 5
+
+def test_codebase():
+    assert str_to_codebase("File: a.py\nx = 1\n--\n\nFile: b.py\ny = 2\n--\n") == {"a.py": "x = 1\n", "b.py": "y = 2\n"}
+    for text in ["x = 1\n--\n", "Here's the code:\nFile: a.py\nx = 1\n--\n", "File: a.py\n```python\nx = 1\n```\n--\n", "Done", ""]:
+        with pytest.raises(FormatError):
+            str_to_codebase(text)
+    CodeBaseValidator(allow_done=True).validate("Done")
+    with pytest.raises(FormatError):
+        CodeBaseValidator(allow_done=True).validate("Done\nFile: a.py\n--\n")
+
+def test_edits():
+    EditsValidator().validate("File: a.py\n@@ insert after line 0\nx = 1\n@@ delete lines 3-4\n--\n")
+    EditsValidator().validate("Done\n")
+    for text in ["File: a.py\nx = 1\n--\n", "File: a.py\n@@ delete lines 4-3\n--\n", "File: a.py\n@@ delete line 3\nx\n--\n"]:
+        with pytest.raises(FormatError):
+            EditsValidator().validate(text)
@@ -0,0 +1,44 @@
+'''Stand-in for linter_worker.js which speaks the same protocol without needing Node.
+
+It reports unbalanced braces as errors and lines containing TODO as warnings. A file containing `CRASH` makes it exit,
+`CRASH_ONCE:<path>` makes it exit unless <path> exists (and creates it), and `SLEEP` makes it hang.
+With `--without-vue-parser` it answers requests for .vue files like linter_worker.js without vue-eslint-parser.'''
+import json
+import os
+import sys
+import time
+
+
+def lint(content):
+    diagnostics, depth = [], 0
+    for line_no, line in enumerate(content.splitlines(), 1):
+        if "TODO" in line: diagnostics.append({"line": line_no, "column": line.index("TODO") + 1, "message": "Unfinished code", "severity": "warning", "rule": "no-todo"})
+        for column, char in enumerate(line, 1):
+            depth += {"{": 1, "}": -1}.get(char, 0)
+            if depth < 0:
+                diagnostics.append({"line": line_no, "column": column, "message": "Unexpected token }", "severity": "error", "rule": None})
+                depth = 0
+    if depth > 0: diagnostics.append({"line": len(content.splitlines()), "column": 1, "message": "Unexpected end of input", "severity": "error", "rule": None})
+    return diagnostics
+
+def handle(file, action):
+    content = file["content"]
+    if "CRASH_ONCE:" in content:
+        marker = content.split("CRASH_ONCE:")[1].split()[0]
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            os._exit(1)
+    elif "CRASH" in content:
+        os._exit(1)
+    if "SLEEP" in content: time.sleep(60)
+    if action == "format": return {"name": file["name"], "formatted": "\n".join(line.rstrip() for line in content.splitlines()) + "\n"}
+    return {"name": file["name"], "diagnostics": lint(content)}
+
+print("stub linter ready", flush=True)  # not JSON, should be ignored
+for line in sys.stdin:
+    request = json.loads(line)
+    if "--without-vue-parser" in sys.argv and any(file["name"].endswith(".vue") for file in request["files"]):
+        response = {"id": request["id"], "error": "vue-eslint-parser is not installed", "unavailable": True}
+    else:
+        response = {"id": request["id"], "results": [handle(file, request["action"]) for file in request["files"]]}
+    print(json.dumps(response), flush=True)
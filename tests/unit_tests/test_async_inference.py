@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import pytest
+from builderbot.hedging import HedgingPolicy, LatencyHistogram
+from builderbot.inference import LLMInferer
+from builderbot.rate_limit import RetryPolicy, TokenBucket
+from builderbot.stages import DevPhase
+
+def inferer(tmp_path, llm, **kwargs) -> LLMInferer:
+    return LLMInferer(llm, None, str(tmp_path / "cache.sqlite"), **kwargs)
+
+def test_concurrency_limit(tmp_path, fake_llm):
+    llm = fake_llm(delay=0.05)
+    bot = inferer(tmp_path, llm, max_concurrency=3)
+    async def run():
+        return await asyncio.gather(*[
+            bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task=f"task {i}") for i in range(10)
+        ])
+    responses = asyncio.run(run())
+    assert len(set(responses)) == 1  # all prompts end the same way
+    assert llm.calls.count == 10
+    assert llm.calls.max_running == 3
+    # second run is served by the cache
+    asyncio.run(run())
+    assert llm.calls.count == 10
+
+def test_retries_rate_limit_errors(tmp_path, fake_llm):
+    llm = fake_llm(failures=2)
+    bot = inferer(tmp_path, llm, retry_policy=RetryPolicy(base_delay=0.01))
+    asyncio.run(bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task="task"))
+    assert bot.retries == 2
+
+def test_timeout(tmp_path, fake_llm):
+    bot = inferer(tmp_path, fake_llm(delay=1), timeout=0.05, retry_policy=RetryPolicy(max_retries=1, base_delay=0))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task="task"))
+    assert bot.retries == 1
+
+def test_token_bucket():
+    bucket = TokenBucket(per_minute=600)
+    async def run():
+        await bucket.acquire(600)
+        start = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - start
+    assert asyncio.run(run()) >= 0.4
+
+def slow_first(fake_llm):
+    '''The first request hangs, later ones are fast'''
+    return fake_llm(respond=lambda llm, messages: "done", delay=lambda request_no: 5 if request_no == 1 else 0.01)
+
+def hedged_run(bot: LLMInferer) -> float:
+    for _ in range(10): bot.latencies.setdefault(DevPhase.UNDERSTAND, LatencyHistogram()).record(0.01)
+    start = time.monotonic()
+    asyncio.run(bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task="task"))
+    return time.monotonic() - start
+
+def test_hedging_cuts_slow_requests(tmp_path, fake_llm):
+    llm = slow_first(fake_llm)
+    bot = inferer(tmp_path, llm, hedging=HedgingPolicy(percentile=0.9, min_samples=5, max_extra_fraction=1.0))
+    assert hedged_run(bot) < 1
+    assert (llm.calls.count, llm.calls.cancelled, bot.hedging.hedges) == (2, 1, 1)
+
+def test_hedging_budget(tmp_path, fake_llm):
+    llm = slow_first(fake_llm)
+    bot = inferer(tmp_path, llm, hedging=HedgingPolicy(percentile=0.9, min_samples=5, max_extra_fraction=0.5),
+                  timeout=0.2, retry_policy=RetryPolicy(max_retries=1, base_delay=0))
+    hedged_run(bot)
+    assert bot.hedging.hedges == 0
+    assert bot.retries == 1
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(window=10)
+    for latency in range(20): histogram.record(latency)
+    assert len(histogram) == 10
+    assert histogram.percentile(0.5) == 14
+    assert histogram.percentile(1.0) == 19
+
+def test_identical_requests_in_flight_are_coalesced(tmp_path, fake_llm):
+    llm = fake_llm(delay=0.05, failures=1)
+    bot = inferer(tmp_path, llm, retry_policy=RetryPolicy(max_retries=0))
+    async def run():
+        return await asyncio.gather(*[
+            bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task="same") for _ in range(5)
+        ], return_exceptions=True)
+    responses = asyncio.run(run())
+
+    # the first request fails, so one of the waiting calls sends it again and the others share its response
+    assert getattr(responses[0], "http_status", None) == 429  # rate limited
+    assert len(set(responses[1:])) == 1
+    assert llm.calls.count == 2
+    assert bot.cache.counters.coalesced == 3
+
+def test_requests_from_other_event_loops_dont_share_futures(tmp_path, fake_llm):
+    llm = fake_llm(delay=0.2)
+    bot = inferer(tmp_path, llm)
+    results, errors = [], []
+    def run():
+        try:
+            results.append(asyncio.run(bot.aget_simple_response(DevPhase.UNDERSTAND, verbose=False, save=False, task="same")))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == [] and len(results) == 2
+    assert llm.calls.count == 1  # the other loop waits for the lease instead
+    assert bot.cache.inflight == {}
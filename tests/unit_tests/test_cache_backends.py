@@ -0,0 +1,113 @@
+import pickle
+import time
+from langchain.schema import HumanMessage, SystemMessage
+from builderbot.cache import CachePolicy, MemoryBackend, SQLiteBackend, backend_from_filename, canonicalize, migrate_pickle, prompt_digest
+
+
+def entry(*messages: str):
+    prompt = canonicalize(messages)
+    return prompt_digest(prompt), prompt
+
+def test_sqlite_backend_persists(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    backend = SQLiteBackend(filename)
+    hello, world = entry("system", "hello"), entry("system", "world")
+    backend.set(*hello, "1")
+    backend.set(*world, "2")
+    backend.close()
+
+    backend = SQLiteBackend(filename)
+    assert len(backend) == 2
+    assert backend.get(hello[0]) == "1"
+    assert backend.get(entry("system", "nope")[0]) is None
+    assert backend.prompt(world[0]) == world[1]
+    assert set(backend.keys()) == {hello[0], world[0]}
+
+def test_delete_containing():
+    for backend in [MemoryBackend(), SQLiteBackend(":memory:")]:
+        backend.set(*entry("system", "write code\nfor me"), "1")
+        backend.set(*entry("system", "write tests"), "2")
+        assert backend.delete_containing("code\nfor") == 1
+        assert backend.get(entry("system", "write tests")[0]) == "2"
+        assert len(backend) == 1
+
+def test_shared_messages_are_stored_once():
+    code_base = "".join(f"File: file_{i}.py\n" + f"x_{i} = {i}\n" * 50 + "--\n" for i in range(20))
+    for backend in [MemoryBackend(), SQLiteBackend(":memory:")]:
+        for i in range(10):
+            backend.set(*entry("system prompt " * 50, f"iteration {i}\n" + code_base), str(i))
+        stats = backend.stats()
+        assert stats.entries == 10
+        assert stats.unique_messages == 11
+        assert stats.dedup_ratio > 3
+
+def test_migrate_pickle_once(tmp_path):
+    pickle_file = tmp_path / "cache.pkl"
+    legacy_prompt = [SystemMessage(content="be nice"), HumanMessage(content="it's\na test")]
+    with open(pickle_file, "wb") as f: pickle.dump({tuple(str(m) for m in legacy_prompt): "x"}, f)
+
+    backend = backend_from_filename(str(pickle_file))
+    assert backend.filename == str(tmp_path / "cache.sqlite")
+    assert backend.get(prompt_digest(canonicalize(legacy_prompt))) == "x"
+    backend.clear()
+    assert migrate_pickle(str(pickle_file), backend) == 0
+    assert len(backend) == 0
+
+def test_delete_containing_with_ngram_index():
+    backend = SQLiteBackend(":memory:", ngram_index=True)
+    backend.set(*entry("system", "def add(a, b):\n    return a + b"), "1")
+    backend.set(*entry("system", "def sub(a, b):\n    return a - b"), "2")
+    assert backend.delete_containing("Return a") == 0
+    assert backend.delete_containing("return a + b") == 1
+    assert backend.delete_containing("sub") == 1
+    assert len(backend) == 0
+    backend.set(*entry("system", "def sub(a, b):\n    return a - b"), "3")
+    assert backend.delete_containing("sub") == 1
+
+def test_connections_without_ngram_index_keep_it_up_to_date(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    indexed = SQLiteBackend(filename, ngram_index=True)
+    plain = SQLiteBackend(filename)
+    plain.set(*entry("system", "hello world"), "1")
+    plain.set(*entry("system", "hello there"), "2")
+    assert plain.delete_containing("there") == 1
+    plain.close()
+
+    assert indexed.delete_containing("there") == 0
+    assert indexed.delete_containing("world") == 1
+    assert len(indexed) == 0
+
+def test_find_by_tags():
+    for backend in [MemoryBackend(), SQLiteBackend(":memory:")]:
+        backend.set(*entry("a"), "1", {"phase": "UNDERSTAND", "template": "t1", "template_version": "v1"})
+        backend.set(*entry("b"), "2", {"phase": "WRITE_CODE", "template": "t2", "template_version": "v1"})
+        backend.set(*entry("c"), "3", {"phase": "WRITE_CODE", "template": "t2", "template_version": "v2"})
+        assert sorted(backend.find({"phase": "WRITE_CODE"})) == sorted([entry("b")[0], entry("c")[0]])
+        assert backend.find({"template": "t2"}, exclude={"template_version": "v2"}) == [entry("b")[0]]
+        assert backend.tags(entry("a")[0])["template"] == "t1"
+        assert backend.delete_tagged({"phase": "WRITE_CODE"}) == 2
+        assert list(backend.keys()) == [entry("a")[0]]
+
+def test_eviction():
+    for eviction in ["lru", "ttl"]:
+        for backend in [MemoryBackend(CachePolicy(max_entries=2, eviction=eviction)),
+                        SQLiteBackend(":memory:", policy=CachePolicy(max_entries=2, eviction=eviction))]:
+            backend.set(*entry("a"), "1")
+            backend.set(*entry("b"), "2")
+            backend.get(entry("a")[0])
+            backend.set(*entry("c"), "3")
+            survivor, evicted = ("a", "b") if eviction == "lru" else ("b", "a")
+            assert backend.get(entry(survivor)[0]) is not None
+            assert backend.get(entry(evicted)[0]) is None
+            assert backend.evicted == 1
+            assert backend.stats().unique_messages == 2
+
+def test_max_bytes_and_ttl():
+    for backend in [MemoryBackend(CachePolicy(max_bytes=100, ttl=0.05)),
+                    SQLiteBackend(":memory:", policy=CachePolicy(max_bytes=100, ttl=0.05))]:
+        backend.set(*entry("x" * 60), "1")
+        backend.set(*entry("y" * 60), "2")
+        assert len(backend) == 1
+        time.sleep(0.1)
+        assert backend.get(entry("y" * 60)[0]) is None
+        assert len(backend) == 0
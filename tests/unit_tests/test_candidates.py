@@ -0,0 +1,69 @@
+import asyncio
+from typing import List
+from langchain.schema import BaseMessage
+from builderbot.candidates import rank_candidates, score_candidate
+from builderbot.inference import LLMInferer
+from builderbot.stages import DevPhase
+
+VALID = "File: app.py\nprint('hi')\n--\nFile: notes.txt\nanything\n--\n"
+BROKEN = "File: app.py\nprint('hi'\n--\n"
+
+class Sampler:
+    '''Returns `n` samples per request, cycling through `samples`, and answers critiques and resolutions'''
+    def __init__(self):
+        self.samples = [BROKEN, VALID]
+        self.resolution = "File: app.py\nprint('resolved')\n--\n"
+        self.requests: List[int] = []  # samples per ideation request
+
+    def __call__(self, llm, messages: List[BaseMessage]) -> List[str]:
+        prompt = messages[-1].content
+        if "A reviewer critiqued them" in prompt: return [self.resolution]
+        if "candidate implementations" in prompt: return ["Candidate 1 is the best"]
+        n = llm.n or 1
+        self.requests.append(n)
+        return [self.samples[(len(self.requests) - 1 + i) % len(self.samples)] for i in range(n)]
+
+def test_candidates_are_scored_locally():
+    assert score_candidate(DevPhase.STRUCTURE_CODE, VALID).score == 2.0
+    broken = score_candidate(DevPhase.STRUCTURE_CODE, BROKEN)
+    assert broken.score == 1.0 and broken.problems[0].startswith("syntax error in app.py")
+    malformed = score_candidate(DevPhase.STRUCTURE_CODE, "Here's the code: print('hi')")
+    assert malformed.score == 0 and malformed.problems[0].startswith("malformed")
+    assert score_candidate(DevPhase.UNDERSTAND, "Requirements:\n- a\n\nAssumptions:\n- b\n\nQuestions:\nno questions").score == 1.0
+
+    ranked = rank_candidates(DevPhase.STRUCTURE_CODE, [BROKEN, VALID, BROKEN])
+    assert [c.text for c in ranked] == [VALID, BROKEN]
+
+def test_samples_are_batched_and_cached_individually(tmp_path, fake_llm):
+    sampler = Sampler()
+    llm = fake_llm(respond=sampler, n=1, delay=0.01)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"))
+    samples = lambda n: asyncio.run(inferer.aget_samples(DevPhase.STRUCTURE_CODE, n, task="t", reqs="r"))
+
+    assert samples(2) == [BROKEN, VALID]
+    assert sampler.requests == [2]  # one request with n=2
+    assert llm.n == 1  # on a copy of the model
+    assert samples(3)[:2] == [BROKEN, VALID]
+    assert sampler.requests == [2, 1]  # only the missing sample
+
+    sampler = Sampler()
+    inferer = LLMInferer(fake_llm(respond=sampler, delay=0.01), None, str(tmp_path / "other.sqlite"))
+    asyncio.run(inferer.aget_samples(DevPhase.STRUCTURE_CODE, 3, task="t", reqs="r"))
+    assert sampler.requests == [1, 1, 1]  # concurrent requests instead
+
+def test_candidates_are_critiqued_together_and_resolved_once(tmp_path, fake_llm):
+    sampler = Sampler()
+    llm = fake_llm(respond=sampler, n=1, delay=0.01)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"))
+    run = lambda: asyncio.run(inferer.aget_candidates_response(DevPhase.STRUCTURE_CODE, 3, verbose=False, save=False, task="t", reqs="r"))
+
+    assert run() == "File: app.py\nprint('resolved')\n--\n"
+    assert llm.calls.count == 3  # ideation, critique, resolution
+    critique_prompt = llm.calls.prompts[1][-1].content
+    # the best candidate comes first, duplicates are left out
+    assert critique_prompt.index("Candidate 1 (passes all local checks)") < critique_prompt.index("Candidate 2 (syntax error")
+    assert "Candidate 3" not in critique_prompt
+
+    sampler.resolution = "Sorry, I can't"
+    inferer.cache.clear()
+    assert run() == VALID  # the resolution is malformed, so the best candidate is used
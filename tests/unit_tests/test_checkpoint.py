@@ -0,0 +1,42 @@
+import asyncio
+import os
+import pickle
+from builderbot.checkpoint import CheckpointStore
+from builderbot.pipeline import PhaseGraph, PhaseNode, Scheduler
+from builderbot.stages import DevPhase
+
+
+def test_checkpoints_survive_a_new_store(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    store["a"] = {"codebase": {"app.py": "x = 1"}}
+    store["b"] = 2
+    assert CheckpointStore(str(tmp_path / "checkpoints"))["a"] == {"codebase": {"app.py": "x = 1"}}
+    assert sorted(CheckpointStore(str(tmp_path / "checkpoints"))) == ["a", "b"]
+    del store["b"]
+    assert "b" not in CheckpointStore(str(tmp_path / "checkpoints"))
+
+def test_unreadable_and_old_checkpoints_are_ignored(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    store["a"], store["b"] = 1, 2
+    with open(store.path("a"), "wb") as f: f.write(b"garbage")
+    with open(store.path("b"), "wb") as f: pickle.dump({"format": 0, "key": "b", "value": 2}, f)
+    fresh = CheckpointStore(str(tmp_path))
+    assert "a" not in fresh and "b" not in fresh and len(fresh) == 0
+
+def test_memory_layer_is_written_to_new_runs(tmp_path):
+    memory = {}
+    CheckpointStore(str(tmp_path / "run_1"), memory)["a"] = 1
+    assert CheckpointStore(str(tmp_path / "run_2"), memory)["a"] == 1
+    assert CheckpointStore(str(tmp_path / "run_2"))["a"] == 1
+
+def test_changing_the_version_invalidates_checkpoints(tmp_path):
+    calls = []
+    async def understand(task):
+        calls.append(task)
+        return {"reqs": task.upper()}
+    def graph(version):
+        return PhaseGraph([PhaseNode(DevPhase.UNDERSTAND, ["task"], ["reqs"], understand, version=version)])
+    for version in ["v1", "v1", "v2"]:
+        asyncio.run(Scheduler(graph(version), CheckpointStore(str(tmp_path))).run(task="todo"))
+    assert len(calls) == 2
+    assert len(os.listdir(tmp_path)) == 2
@@ -1,5 +1,6 @@
 from builderbot.models.code_base import CodeBase, CodeFile, CodeLine
-from builderbot.code_base_summarizer import SimpleSummarizer
+from builderbot.code_base_summarizer import BudgetSummarizer, DetailLevel, SimpleSummarizer, summarize_file
+from builderbot.tokens import count_tokens
 
 def test_simple_summarizer():
     code = CodeBase(files=[
@@ -12,3 +13,36 @@ def test_simple_summarizer():
 
     expected_summary = "file1.py:\n1   print('Hello, world!')\n\nfile2.py:\n1   def add(a, b):\n2       return a + b\n\n"
     assert summary == expected_summary
+
+def test_signatures():
+    code = CodeBase(files=[
+        CodeFile(name="shop.py", content='import os\n\nclass Cart:\n    """A cart."""\n    def add(self, item):\n        self.items.append(item)\n'),
+        CodeFile(name="app.js", content='import { ref } from "vue";\nexport function total(items) {\n  return items.length;\n}\n'),
+    ])
+    summary = "".join(summarize_file(file, DetailLevel.SIGNATURES) for file in code.files)
+    assert summary == ('File: shop.py\n1   import os\n3   class Cart:\n4       """A cart."""\n5       def add(self, item):\n--\n'
+        'File: app.js\n1   import { ref } from "vue";\n2   export function total(items) {\n--\n')
+
+def test_budget_summarizer():
+    files = [CodeFile(name=f"module_{i}.py", content="".join(f"def f{i}_{j}():\n    return {j}\n" for j in range(50)))
+        for i in range(20)]
+    files.append(CodeFile(name="checkout.py", content="def pay(cart):\n    return cart.total\n"))
+    code = CodeBase(files=files)
+    summarizer = BudgetSummarizer(budget=3000)
+
+    summary = summarizer.summarize(code, query="fix the checkout", relevant=["module_3.py"])
+
+    assert count_tokens(summary) <= 3000
+    assert summarize_file(files[3], DetailLevel.NUMBERED) in summary  # relevant file is shown in full
+    assert summarize_file(files[-1], DetailLevel.NUMBERED) in summary  # small file matching the query too
+    assert all(f"module_{i}.py" in summary for i in range(20))  # every file is at least listed
+
+    cached = len(summarizer.cache)
+    summarizer.summarize(code, query="fix the checkout", relevant=["module_3.py"])
+    assert len(summarizer.cache) == cached  # unchanged files aren't summarized again
+
+def test_budget_too_small_for_file_list():
+    code = CodeBase(files=[CodeFile(name=f"file_{i}.py", content="x = 1") for i in range(100)])
+    summary = BudgetSummarizer(budget=50).summarize(code)
+    assert count_tokens(summary) <= 50 + 10
+    assert summary.endswith("more files\n")
@@ -0,0 +1,42 @@
+from builderbot.convergence import ConvergencePolicy, ConvergenceTracker, lines_changed
+
+def test_lines_changed():
+    assert lines_changed("a\nb\nc", "a\nb\nc") == 0
+    assert lines_changed("a\nb\nc", "a\nB\nc\nd") == 2
+    assert lines_changed("", "a\nb") == 2
+
+def iterate(tracker, *codebases, errors=0):
+    return [tracker.observe(old, new, errors) for old, new in zip(codebases, codebases[1:])]
+
+def test_stops_at_a_fixpoint_and_on_whitespace_changes():
+    a = {"app.py": "x = 1\n"}
+    stats, = iterate(ConvergenceTracker(), a, dict(a))
+    assert stats.stop_reason == "the code base didn't change"
+
+    tracker = ConvergenceTracker()
+    stats, = iterate(tracker, a, {"app.py": "x  =  1\n\n"})
+    assert (stats.changed, stats.whitespace_only, stats.lines_changed) == (1, 1, 0)
+    assert stats.stop_reason == "only whitespace changed" and tracker.done
+
+def test_stops_when_oscillating():
+    a, b = {"app.py": "x = 1\n"}, {"app.py": "x = 2\n"}
+    tracker = ConvergenceTracker()
+    first, second = iterate(tracker, a, b, {"app.py": "x = 1\n"})
+    assert first.stop_reason is None
+    assert second.stop_reason == "the code base is back to an earlier state"
+    assert tracker.done
+
+def test_budget_adapts_to_changes_and_errors():
+    policy = ConvergencePolicy(max_iterations=4, max_extra_iterations=2, min_change_ratio=0.1, grace_iterations=1)
+    big = {"app.py": "".join(f"line {i}\n" for i in range(100))}
+    # an iteration with errors earns an extra iteration, up to the limit
+    tracker = ConvergenceTracker(policy)
+    codebases = [{"app.py": big["app.py"] + f"step {i}\n" * 20} for i in range(5)]
+    iterate(tracker, big, *codebases, errors=1)
+    assert tracker.budget == policy.limit == 6
+
+    # small changes without errors leave only the grace iteration
+    tracker = ConvergenceTracker(policy)
+    stats, = iterate(tracker, big, {"app.py": big["app.py"] + "one more line\n"}, errors=0)
+    assert stats.change_ratio < 0.1 and stats.budget == 1 and not tracker.done
+    assert tracker.report().startswith("Iteration 1: 1/1 files changed (0 new, 0 whitespace only), 1 lines")
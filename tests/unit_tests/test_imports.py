@@ -0,0 +1,26 @@
+import subprocess
+import sys
+import pytest
+
+HEAVY_MODULES = ["langchain", "black", "pandas", "pkg_resources"]
+
+
+def imported_heavy_modules(module: str):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return [m for m in subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip().split(",") if m]
+
+@pytest.mark.parametrize("module", ["builderbot", "builderbot.run_manager", "builderbot.validation.engine",
+    "builderbot.validation.format", "builderbot.streaming", "builderbot.utils", "builderbot.prompts"])
+def test_light_modules_do_not_import_heavy_dependencies(module):
+    assert imported_heavy_modules(module) == []
+
+def test_builderbot_is_imported_on_first_use():
+    import builderbot
+    assert builderbot.BuilderBot.__name__ == "BuilderBot"
+    with pytest.raises(AttributeError):
+        builderbot.NoSuchThing
+
+def test_package_files_are_found():
+    from builderbot.utils import file_exists, load_file
+    assert file_exists("prompts/system.txt") and not file_exists("prompts/missing.txt")
+    assert load_file("prompts/system.txt")
@@ -1,7 +1,11 @@
+import os
+import pickle
+import time
 from typing import List, Optional
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 from langchain.chat_models.base import SimpleChatModel
-from langchain.schema import BaseMessage
+from langchain.schema import BaseMessage, SystemMessage
+from builderbot.cache import CachePolicy, MemoryBackend, SQLiteBackend
 from builderbot.inference import LLMCache
 
 class FakeLLM(SimpleChatModel):
@@ -34,4 +38,109 @@ def test_cache():
     result = cache.get_llm_result(llm, prompt)
     assert result == "99"
 
-    cache = LLMCache(llm, filename="cache/cache.tst.pkl")
\ No newline at end of file
+    cache = LLMCache(llm, filename="cache/cache.tst.pkl")
+
+def test_default_cache_migrates_the_legacy_pickle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "cache").mkdir()
+    with open(tmp_path / "cache" / "cache.pkl", "wb") as f:
+        pickle.dump({tuple(str(m) for m in [SystemMessage(content="be nice")]): "x"}, f)
+
+    cache = LLMCache(FakeLLM())
+    assert cache.backend.filename == os.path.join("cache", "cache.sqlite")
+    assert len(cache.backend) == 1
+
+def test_invalidate_stale_templates():
+    llm = FakeLLM()
+    cache = LLMCache(llm, backend=MemoryBackend())
+    cache.get_llm_result(llm, ["old"], {"template": "5_write_code", "template_version": "v1"})
+    cache.get_llm_result(llm, ["new"], {"template": "5_write_code", "template_version": "v2"})
+    cache.get_llm_result(llm, ["other"], {"template": "1_understand_requirement", "template_version": "v1"})
+    assert cache.invalidate_stale_templates({"5_write_code": "v2", "1_understand_requirement": "v1"}) == 1
+    assert len(cache.backend) == 2
+
+def test_only_changed_templates_are_looked_up():
+    llm = FakeLLM()
+    cache = LLMCache(llm, backend=MemoryBackend())
+    cache.invalidate_stale_templates({"5_write_code": "v1", "1_understand_requirement": "v1"})
+    cache.get_llm_result(llm, ["old"], {"template": "5_write_code", "template_version": "v1"})
+    looked_up = []
+    find = cache.backend.find
+    cache.backend.find = lambda tags=None, exclude=None: looked_up.append(tags["template"]) or find(tags, exclude)
+    assert cache.invalidate_stale_templates({"5_write_code": "v1", "1_understand_requirement": "v1"}) == 0
+    assert looked_up == []
+    assert cache.invalidate_stale_templates({"5_write_code": "v2", "1_understand_requirement": "v1"}) == 1
+    assert looked_up == ["5_write_code"]
+
+class FakeOpenAI(FakeLLM):
+    model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0.7
+
+    def _call(self, messages, stop=None, run_manager=None) -> str:
+        return self.model_name
+
+def test_results_are_namespaced_by_model():
+    gpt3, gpt4 = FakeOpenAI(), FakeOpenAI(model_name="gpt-4")
+    cache = LLMCache(gpt3, backend=MemoryBackend())
+    assert cache.get_llm_result(gpt3, ["hi"]) == "gpt-3.5-turbo"
+    assert cache.get_llm_result(gpt4, ["hi"]) == "gpt-4"
+    assert cache.get_llm_result(FakeOpenAI(temperature=0), ["hi"]) == "gpt-3.5-turbo"
+    assert len(cache.backend) == 3
+    assert cache.invalidate(llm=gpt4) == 1
+
+def test_bounded_cache_counts_hits_misses_and_evictions():
+    llm = FakeLLM()
+    cache = LLMCache(llm, backend=MemoryBackend(CachePolicy(max_entries=2)), hot_entries=1)
+    for prompt in [["a"], ["b"], ["a"], ["c"], ["b"]]:
+        cache.get_llm_result(llm, prompt)
+    assert len(cache.backend) == 2
+    assert (cache.counters.hits, cache.counters.misses, cache.counters.evictions) == (1, 4, 2)
+
+def test_evictions_only_drop_the_evicted_hot_entries():
+    llm = FakeLLM()
+    cache = LLMCache(llm, backend=MemoryBackend(CachePolicy(max_entries=50)), hot_entries=16)
+    for i in range(46):
+        cache.update([f"old {i}"], str(i))
+    hot = [[f"hot {i}"] for i in range(4)]
+    for prompt in hot:
+        cache.get_llm_result(llm, prompt)
+    for i in range(40):
+        cache.get_llm_result(llm, hot[i % 4])
+        cache.get_llm_result(llm, [f"new {i}"])  # evicts an old entry
+    assert cache.counters.evictions == 40
+    assert cache.counters.hot_hits == 40
+
+def test_hot_hits_count_for_the_backends_lru_order():
+    llm = FakeLLM()
+    for backend in [MemoryBackend(CachePolicy(max_entries=3)), SQLiteBackend(":memory:", policy=CachePolicy(max_entries=3))]:
+        cache = LLMCache(llm, backend=backend)
+        for prompt in ["a", "b", "c"]: cache.update([prompt], prompt)
+        assert cache.get_llm_result(llm, ["a"]) == "a" and cache.counters.hot_hits == 1
+        cache.update(["d"], "d")  # evicts the least recently used entry
+        assert cache.backend.get(cache.to_hashable(["a"])) == "a"
+        assert cache.backend.get(cache.to_hashable(["b"])) is None
+
+def test_hot_entries_expire_by_creation_time(monkeypatch):
+    llm = FakeLLM()
+    backend = MemoryBackend(CachePolicy(ttl=10))
+    cache = LLMCache(llm, backend=backend)
+    cache.update(["a"], "1")
+    key = cache.to_hashable(["a"])
+    now = time.time()
+    backend.created[key] = now - 9
+    cache.hot.clear()
+    assert cache.lookup(key) == "1"  # loaded into the hot tier now, but created 9 seconds ago
+    monkeypatch.setattr(time, "time", lambda: now + 2)
+    assert cache.lookup(key) is None
+
+def test_deletions_by_another_process_drop_only_their_hot_entries(tmp_path):
+    llm = FakeLLM()
+    ours, theirs = LLMCache(llm, str(tmp_path / "cache.sqlite")), LLMCache(llm, str(tmp_path / "cache.sqlite"))
+    ours.update(["a"], "1")
+    ours.update(["b"], "2")
+    a, b = ours.to_hashable(["a"]), ours.to_hashable(["b"])
+    theirs.backend.delete([a])
+    assert ours.lookup(a) is None
+    assert ours.lookup(b) == "2" and ours.counters.hot_hits == 1
+    theirs.clear()
+    assert ours.lookup(b) is None
@@ -0,0 +1,70 @@
+import os
+import threading
+import pytest
+from builderbot.output_writer import OutputWriter
+
+
+def test_writes_only_changed_files_in_nested_directories(tmp_path):
+    writer = OutputWriter()
+    a, b = str(tmp_path / "out" / "src" / "app.py"), str(tmp_path / "out" / "README.md")
+    assert writer.write(a, "x = 1") and writer.write(b, "hi")
+    writer.flush()
+    assert open(a).read() == "x = 1" and open(b).read() == "hi"
+    assert writer.writes == 2
+
+    assert not writer.write(a, "x = 1")
+    assert writer.write(b, "hello")
+    writer.flush()
+    assert open(b).read() == "hello" and writer.writes == 3
+    assert sorted(os.listdir(tmp_path / "out")) == ["README.md", "src"]  # no temporary files left behind
+    writer.close()
+
+def test_writes_are_batched_and_keep_the_latest_content(tmp_path):
+    writer = OutputWriter(flush_interval=0.2)
+    path = str(tmp_path / "file.txt")
+    for i in range(10): writer.write(path, str(i))
+    writer.close()
+    assert open(path).read() == "9"
+    assert writer.writes == 1
+
+def test_write_does_not_wait_for_the_disk(tmp_path, monkeypatch):
+    writer = OutputWriter(flush_interval=0)
+    release = threading.Event()
+    write_now = writer.write_now
+    monkeypatch.setattr(writer, "write_now", lambda path, content: release.wait() and write_now(path, content))
+    writer.write(str(tmp_path / "slow.txt"), "x")
+    writer.write(str(tmp_path / "other.txt"), "y")  # returns although the first write is blocked
+    release.set()
+    writer.flush()
+    assert open(tmp_path / "slow.txt").read() == "x"
+
+def test_errors_are_raised_on_flush_and_the_write_is_retried(tmp_path):
+    writer = OutputWriter()
+    (tmp_path / "blocker").write_text("a file where a directory should be")
+    path = str(tmp_path / "blocker" / "file.txt")
+    writer.write(path, "x")
+    with pytest.raises(OSError):
+        writer.flush()
+    (tmp_path / "blocker").unlink()
+    assert writer.write(path, "x")
+    writer.close()
+    assert open(path).read() == "x"
+
+def test_relative_paths_are_resolved_when_queued(tmp_path, monkeypatch):
+    writer = OutputWriter(flush_interval=0.2)
+    monkeypatch.chdir(tmp_path)
+    writer.write("out/file.txt", "x")
+    monkeypatch.chdir(tmp_path.parent)
+    writer.close()
+    assert open(tmp_path / "out" / "file.txt").read() == "x"
+
+def test_files_get_the_permissions_of_the_current_umask(tmp_path):
+    writer = OutputWriter(flush_interval=0)
+    umask = os.umask(0o027)
+    try:
+        writer.write(str(tmp_path / "file.txt"), "x")
+        writer.flush()
+    finally:
+        os.umask(umask)
+    assert os.stat(tmp_path / "file.txt").st_mode & 0o777 == 0o640
+    writer.close()
@@ -0,0 +1,271 @@
+import asyncio
+import os
+from typing import List
+import pytest
+from langchain.schema import BaseMessage
+from builderbot.builderbot import BuilderBot
+from builderbot.checkpoint import CheckpointStore
+from builderbot.pipeline import PhaseGraph, PhaseNode, Scheduler
+from builderbot.replay import Cassette, ReplayLLM
+from builderbot.stages import DevPhase
+
+def sleeper(outputs, delay=0.1, calls=None):
+    async def run(**inputs):
+        if calls is not None: calls.append(inputs)
+        await asyncio.sleep(delay)
+        return outputs(**inputs)
+    return run
+
+def diamond(calls=None):
+    return PhaseGraph([
+        PhaseNode(DevPhase.UNDERSTAND, ["task"], ["reqs"], sleeper(lambda task: {"reqs": task.upper()}, 0.05, calls)),
+        PhaseNode(DevPhase.STRUCTURE_CODE, ["reqs"], ["code"], sleeper(lambda reqs: {"code": reqs + "-code"})),
+        PhaseNode(DevPhase.STRUCTURE_TESTS, ["reqs"], ["tests"], sleeper(lambda reqs: {"tests": reqs + "-tests"}, 0.2)),
+        PhaseNode(DevPhase.WRITE_CODE, ["code", "tests"], ["result"], sleeper(lambda code, tests: {"result": code + tests}, 0.05)),
+    ])
+
+def test_independent_phases_run_concurrently():
+    scheduler = Scheduler(diamond())
+    values = asyncio.run(scheduler.run(task="todo"))
+    # measured by the scheduler, so the event loop's setup and teardown don't count
+    elapsed = max(t.finished_at for t in scheduler.timings.values())
+
+    assert values["result"] == "TODO-codeTODO-tests"
+    assert elapsed < 0.4  # 0.05 + max(0.1, 0.2) + 0.05, not 0.05 + 0.1 + 0.2 + 0.05
+    timings = scheduler.timings
+    assert timings["STRUCTURE_TESTS"].started_at < timings["STRUCTURE_CODE"].finished_at
+    assert [t.name for t in scheduler.critical_path()] == ["UNDERSTAND", "STRUCTURE_TESTS", "WRITE_CODE"]
+    assert "STRUCTURE_TESTS" in scheduler.report()
+
+def test_outputs_are_memoized_by_inputs():
+    calls, memo, done = [], {}, []
+    graph = diamond(calls)
+    graph.nodes["UNDERSTAND"].on_done = done.append
+    asyncio.run(Scheduler(graph, memo).run(task="todo"))
+    scheduler = Scheduler(graph, memo)
+    assert asyncio.run(scheduler.run(task="todo"))["result"] == "TODO-codeTODO-tests"
+    assert len(calls) == 1
+    assert len(done) == 2  # side effects still happen for memoized outputs
+    assert all(t.cached for t in scheduler.timings.values())
+
+    asyncio.run(Scheduler(graph, memo).run(task="other"))
+    assert len(calls) == 2
+
+def test_invalid_graphs():
+    async def noop(**inputs): return {}
+    with pytest.raises(ValueError):
+        PhaseGraph([PhaseNode(DevPhase.UNDERSTAND, ["b"], ["a"], noop), PhaseNode(DevPhase.WRITE_CODE, ["a"], ["b"], noop)])
+    with pytest.raises(ValueError):
+        PhaseGraph([PhaseNode(DevPhase.UNDERSTAND, [], ["a"], noop), PhaseNode(DevPhase.WRITE_CODE, [], ["a"], noop)])
+    with pytest.raises(ValueError):
+        asyncio.run(Scheduler(diamond()).run())
+    with pytest.raises(ValueError):
+        asyncio.run(Scheduler(PhaseGraph([PhaseNode(DevPhase.UNDERSTAND, [], ["a"], noop)])).run())
+
+class StreamingMixin:
+    async def aget_streamed_response(self, phase, consumer=None, **kwargs):
+        response = await self.aget_simple_response(phase, **kwargs)
+        if consumer: consumer.finish(response)
+        return response
+
+class FakeInferer(StreamingMixin):
+    responses = {
+        DevPhase.UNDERSTAND: "Requirements:\n- a todo app\n\nAssumptions:\n- none\n\nQuestions:\nThere are no questions.",
+        DevPhase.STRUCTURE_CODE: "File: app.py\nprint('hi')\n--\n",
+        DevPhase.STRUCTURE_TESTS: "File: test_app.py\nassert True\n--\n",
+        DevPhase.WRITE_CODE: "Done",
+    }
+
+    def __init__(self):
+        self.running = self.max_running = 0
+
+    async def aget_simple_response(self, phase, **kwargs):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        return self.responses[phase]
+
+def fake_bot(inferer, write_mode="edits") -> BuilderBot:
+    '''A real bot whose inferer is replaced by a fake one. Its model has no recorded responses, so it can't be called.'''
+    bot = BuilderBot(llm=ReplayLLM(cassette=Cassette()), write_mode=write_mode, context_budget=2000)
+    inferer.telemetry = bot.inferer.telemetry
+    bot.inferer = inferer
+    return bot
+
+def test_build_runs_structure_phases_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(FakeInferer())
+    closed = []
+    monkeypatch.setattr(bot.validator, "close", lambda: closed.append(True))
+
+    bot.build("build a todo app")
+
+    assert closed == [True]  # the validation engine's process pool is shut down
+    assert bot.inferer.max_running == 2
+    assert bot.reqs == ["a todo app"]
+    assert bot.codebase == {"app.py": "print('hi')\n"}
+    assert bot.code_base_test == {"test_app.py": "assert True\n"}
+    assert os.path.exists("output/run_1/app.py")
+    assert os.path.exists("output/run_1/project_description.txt")
+
+class AbortingInferer(FakeInferer):
+    '''Streams the start of a malformed attempt before the code base'''
+    async def aget_streamed_response(self, phase, consumer=None, **kwargs):
+        if consumer:
+            consumer.feed("File: draft.py\nx = 1\n--\nI'm not sure about this, ")
+            consumer.reset()  # the attempt is aborted and retried
+        return await super().aget_streamed_response(phase, consumer, **kwargs)
+
+def test_files_of_aborted_attempts_are_not_saved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(AbortingInferer())
+    bot.build("build a todo app")
+    assert bot.codebase == {"app.py": "print('hi')\n"}
+    assert os.path.exists("output/run_1/app.py")
+    assert not os.path.exists("output/run_1/draft.py")
+
+class FileWriter(StreamingMixin):
+    '''Finishes each file in its own request; later files respond first'''
+    def __init__(self):
+        self.requests = []
+
+    async def aget_simple_response(self, phase, variant="", **kwargs):
+        self.requests.append((variant, kwargs.get("file_name")))
+        if "// done" in kwargs["file_content"]: return "Done"
+        await asyncio.sleep(0.1 / (len(self.requests) + 1))
+        return kwargs["file_content"] + "// done\n"
+
+def test_write_files_per_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(FileWriter(), "per_file")
+    codebase = {f"file_{i}.js": f"const x{i} = {i};\n" for i in range(5)}
+
+    result = asyncio.run(bot.write_code("task", "- reqs", codebase))["written_codebase"]
+
+    assert list(result) == list(codebase)
+    assert all(content.endswith("// done\n") for content in result.values())
+    assert len(bot.inferer.requests) == 10  # one round of edits, one round of "Done"
+    assert all(variant == "file" for variant, _ in bot.inferer.requests)
+
+def test_write_file_prompt():
+    from builderbot.prompts import get_prompt, template_versions
+    from builderbot.stages import InferenceStep
+    prompt = get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, "file", task="t", reqs="r",
+        summary="File: b.js\nfoo()\n--\n", file_name="a.js", file_content="bar()")
+    assert "File: a.js\nbar()" in prompt[-1].content
+    assert "5_write_code__file" in template_versions()
+
+class Editor(StreamingMixin):
+    def __init__(self, responses):
+        self.responses, self.prompts = responses, []
+
+    async def aget_simple_response(self, phase, variant="", **kwargs):
+        self.prompts.append((variant, kwargs["code_base"]))
+        return self.responses.pop(0)
+
+def test_write_edits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(Editor(["File: app.py\n@@ replace line 2\nprint('bye')\n--\n", "Done"]))
+    codebase = {"app.py": "import sys\nprint('hi')\n", "util.py": "x = 1\n"}
+
+    result = asyncio.run(bot.write_code("task", "- reqs", codebase))["written_codebase"]
+
+    assert result == {"app.py": "import sys\nprint('bye')\n", "util.py": "x = 1\n"}
+    assert bot.inferer.prompts[0] == ("edits", "File: app.py\n1   import sys\n2   print('hi')\n--\nFile: util.py\n1   x = 1\n--\n")
+
+def test_write_edits_falls_back_to_whole_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(Editor(["File: app.py\n@@ replace line 9\nprint('bye')\n--\n", "File: app.py\nprint('bye')\n--\n", "Done"]))
+    result = asyncio.run(bot.write_code("task", "- reqs", {"app.py": "print('hi')\n"}))["written_codebase"]
+    assert result == {"app.py": "print('bye')\n"}
+    assert [variant for variant, _ in bot.inferer.prompts] == ["edits", "", "edits"]
+
+class Repeater(StreamingMixin):
+    '''Always answers with the same file'''
+    def __init__(self):
+        self.requests = []
+
+    async def aget_simple_response(self, phase, variant="", **kwargs):
+        self.requests.append(variant)
+        return "File: app.py\nprint('bye')\n--\n"
+
+def test_write_code_stops_when_the_model_repeats_itself(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(Repeater(), write_mode="whole")
+    result = asyncio.run(bot.write_code("task", "- reqs", {"app.py": "print('hi')\n"}))["written_codebase"]
+    bot.writer.flush()
+
+    assert result == {"app.py": "print('bye')\n"}
+    assert len(bot.inferer.requests) == 2  # instead of 10
+    assert [s.stop_reason for s in bot.iteration_stats] == [None, "the code base didn't change"]
+    assert (tmp_path / bot.run_manager.cache_dir / "iterations.jsonl").read_text().count("\n") == 2
+
+class CrashingInferer(FakeInferer):
+    '''Writes one file per WRITE_CODE iteration, and crashes in iteration `crash_at`'''
+    def __init__(self, crash_at=None):
+        super().__init__()
+        self.calls = []
+        self.crash_at = crash_at
+
+    async def aget_simple_response(self, phase, **kwargs):
+        self.calls.append(phase)
+        if phase != DevPhase.WRITE_CODE: return await super().aget_simple_response(phase, **kwargs)
+        await asyncio.sleep(0.05)  # so STRUCTURE_TESTS finishes before the crash
+        iteration = len(kwargs["code_base"].split("step")) if "step" in kwargs["code_base"] else 1
+        if iteration == self.crash_at: raise RuntimeError("crash")
+        if iteration == 4: return "Done"
+        return f"File: step{iteration}.py\nx = {iteration}\n--\n"
+
+def test_resume_continues_after_the_last_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = fake_bot(CrashingInferer(crash_at=3), write_mode="whole")
+    with pytest.raises(RuntimeError):
+        bot.build("build a todo app")
+
+    resumed = fake_bot(CrashingInferer(), write_mode="whole")
+    resumed.resume(1)
+    assert resumed.inferer.calls == [DevPhase.WRITE_CODE, DevPhase.WRITE_CODE]  # iterations 3 and 4
+    assert sorted(resumed.codebase) == ["app.py", "step1.py", "step2.py", "step3.py"]
+    assert resumed.reqs == ["a todo app"]
+    assert os.path.exists("output/run_1/step3.py")
+    assert not os.path.exists("output/run_2")
+
+    with pytest.raises(ValueError):
+        resumed.resume(2)
+
+def answer_task(llm, messages: List[BaseMessage]) -> str:
+    '''Answers like FakeInferer, and fails for the task "bad"'''
+    prompt = messages[-1].content
+    if "Your task is: bad" in prompt: raise ValueError("bad task")
+    if "list of requirements" in prompt: return FakeInferer.responses[DevPhase.UNDERSTAND]
+    if "Write the test code" in prompt: return FakeInferer.responses[DevPhase.STRUCTURE_TESTS]
+    if "Write the code" in prompt: return FakeInferer.responses[DevPhase.STRUCTURE_CODE]
+    return FakeInferer.responses[DevPhase.WRITE_CODE]
+
+def test_build_many_isolates_builds_and_coalesces_prompts(tmp_path, monkeypatch, fake_llm):
+    monkeypatch.chdir(tmp_path)
+    llm = fake_llm(respond=answer_task, delay=0.05)
+    bot = BuilderBot(llm=llm)
+    closed = []
+    monkeypatch.setattr(bot.validator, "close", lambda: closed.append(True))
+
+    results = bot.build_many(["todo app", "bad", "todo app"], max_concurrency=3)
+
+    assert [r.task for r in results] == ["todo app", "bad", "todo app"]
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, ValueError)
+    assert results[0].codebase == results[2].codebase == {"app.py": "print('hi')\n"}
+    assert sorted(r.run_no for r in results) == [1, 2, 3]
+    understood = [prompt[-1].content.split("\n", 1)[0] for prompt in llm.calls.prompts if "list of requirements" in prompt[-1].content]
+    assert sorted(understood) == ["Your task is: bad", "Your task is: todo app"]  # the duplicate task's prompt was sent once
+    assert bot.inferer.cache.counters.coalesced >= 1
+    assert closed == [True]  # once all builds are done, not by each of them
+    assert "task" not in bot.phase_memo  # only phase outputs are shared between the builds
+    for result in results:
+        assert CheckpointStore(f"cache/run_{result.run_no}/checkpoints/")["task"] == result.task
+    runs = {run["run_no"]: run["status"] for run in bot.run_manager.runs()}
+    assert [runs[r.run_no] for r in results] == ["finished", "failed", "finished"]
+    for result in [results[0], results[2]]:
+        assert os.path.exists(f"output/run_{result.run_no}/app.py")
+        assert os.path.exists(f"cache/run_{result.run_no}/telemetry.jsonl")
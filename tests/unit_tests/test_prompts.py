@@ -0,0 +1,49 @@
+import os
+import pytest
+from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+from builderbot.prompts import PromptRegistry, get_prompt, get_repair_prompt, registry
+from builderbot.stages import DevPhase, InferenceStep
+from builderbot.utils import load_file
+
+
+def test_rendering_matches_langchain_templates():
+    prompt_vars = {"task": "a {todo} app", "reqs": ["a", "b"], "code_base": "File: app.py\nprint('{}')\n--\n"}
+    template = ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(load_file("prompts/system.txt")),
+        HumanMessagePromptTemplate.from_template(load_file("prompts/5_write_code.txt"))])
+    expected = template.format_prompt(**prompt_vars).to_messages()
+    assert get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, **prompt_vars) == expected
+    assert get_repair_prompt("x", "no files")[1].content.startswith("Your answer doesn't follow the format I asked for: no files")
+
+def test_rendering_is_memoized():
+    code_base = "x = 1\n" * 10_000
+    first = get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, task="t", reqs="r", code_base=code_base)
+    second = get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, task="t", reqs="r", code_base=code_base)
+    assert first == second and first[1] is second[1]
+    first.append("something")  # callers get their own list
+    assert len(get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, task="t", reqs="r", code_base=code_base)) == 2
+    assert get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, task="t", reqs="r2", code_base=code_base)[1] is not second[1]
+
+def test_missing_variables_are_reported():
+    assert registry.variables(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, "file") == {"task", "reqs", "summary", "file_name", "file_content"}
+    with pytest.raises(ValueError, match="file_content, file_name"):
+        get_prompt(DevPhase.WRITE_CODE, InferenceStep.SIMPLE, "file", task="t", reqs="r", summary="s")
+
+def test_templates_are_reloaded_when_changed(tmp_path):
+    os.makedirs(tmp_path / "prompts")
+    (tmp_path / "prompts" / "system.txt").write_text("You are Bob.")
+    human = tmp_path / "prompts" / "1_understand_requirement.txt"
+    human.write_text("Task: {task}")
+    prompts = PromptRegistry(root=str(tmp_path), check_interval=0)
+    assert prompts.render(DevPhase.UNDERSTAND, InferenceStep.SIMPLE, task="x")[1].content == "Task: x"
+    version = prompts.version(DevPhase.UNDERSTAND, InferenceStep.SIMPLE)
+
+    human.write_text("Do {task} for {user}")
+    os.utime(human, ns=(0, os.stat(human).st_mtime_ns + 1_000_000))
+    assert prompts.render(DevPhase.UNDERSTAND, InferenceStep.SIMPLE, task="x", user="me")[1].content == "Do x for me"
+    assert prompts.version(DevPhase.UNDERSTAND, InferenceStep.SIMPLE) != version
+
+    human.write_text("Broken {")
+    os.utime(human, ns=(0, os.stat(human).st_mtime_ns + 2_000_000))
+    with pytest.raises(ValueError, match="Invalid prompt template"):
+        prompts.render(DevPhase.UNDERSTAND, InferenceStep.SIMPLE, task="x")
@@ -0,0 +1,77 @@
+import asyncio
+import os
+from typing import List
+import pytest
+from langchain.schema import BaseMessage, HumanMessage
+from builderbot.builderbot import BuilderBot
+from builderbot.replay import Cassette, CassetteMiss, ReplayLLM
+from builderbot.stages import DevPhase
+from builderbot.tokens import context_window
+
+RESPONSES = {
+    DevPhase.UNDERSTAND: "Requirements:\n- a todo app\n\nAssumptions:\n- none\n\nQuestions:\nno questions",
+    DevPhase.STRUCTURE_CODE: "File: app.py\nprint('hi')\n--\n",
+    DevPhase.STRUCTURE_TESTS: "File: test_app.py\nassert True\n--\n",
+}
+
+def answer_phase(llm, messages: List[BaseMessage]) -> str:
+    prompt = messages[-1].content
+    if "list of requirements" in prompt: return RESPONSES[DevPhase.UNDERSTAND]
+    if "Write the test code" in prompt: return RESPONSES[DevPhase.STRUCTURE_TESTS]
+    if "Write the code" in prompt: return RESPONSES[DevPhase.STRUCTURE_CODE]
+    return "Done"
+
+def test_cassette_round_trip(tmp_path):
+    cassette = Cassette(str(tmp_path / "cassettes" / "todo.json"), model_name="gpt-4")
+    cassette.record((("human", "hi"),), "hello")
+    cassette.save()
+
+    loaded = Cassette(str(tmp_path / "cassettes" / "todo.json"))
+    assert loaded.model_name == "gpt-4" and len(loaded) == 1
+    assert loaded.get((("human", "hi"),)) == "hello"
+    assert loaded.get((("human", "bye"),)) is None
+
+def test_replay_streams_with_simulated_latency():
+    cassette = Cassette(model_name="gpt-4")
+    cassette.record((("human", "hi"),), "x" * 400)
+    llm = ReplayLLM(cassette=cassette, first_token_latency=0.05, tokens_per_second=1000, chunk_tokens=10)
+    assert llm.model_name == "gpt-4"
+    assert llm.latency("x" * 400) == pytest.approx(0.15)
+    tokens = []
+    class Consumer:
+        async def on_llm_new_token(self, token, **kwargs): tokens.append(token)
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await llm._agenerate([HumanMessage(content="hi")], run_manager=Consumer())
+        return result, loop.time() - start
+    result, elapsed = asyncio.run(run())
+
+    assert result.generations[0].message.content == "x" * 400
+    assert tokens == ["x" * 40] * 10
+    assert 0.14 < elapsed < 0.5
+    with pytest.raises(CassetteMiss):
+        llm([HumanMessage(content="bye")])
+
+def test_recorded_build_replays_offline(tmp_path, monkeypatch, fake_llm):
+    monkeypatch.chdir(tmp_path)
+    cassette = Cassette("todo.json")
+    fallback = fake_llm(respond=answer_phase)
+    BuilderBot(llm=ReplayLLM(cassette=cassette, fallback=fallback)).build("build a todo app")
+    cassette.save()
+    assert fallback.calls.count == len(cassette) == 4
+
+    monkeypatch.chdir(tmp_path / "cache")  # a new LLM cache and output directory
+    llm = ReplayLLM(cassette=Cassette(str(tmp_path / "todo.json")))
+    bot = BuilderBot(llm=llm)
+    bot.build("build a todo app")
+
+    assert (llm.hits, llm.misses) == (4, 0)
+    assert bot.codebase == {"app.py": "print('hi')\n"}
+    assert os.path.exists("output/run_1/app.py")
+
+def test_context_budget_follows_the_injected_model(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bot = BuilderBot(llm=ReplayLLM(cassette=Cassette(model_name="gpt-4-32k")))
+    assert bot.summarizer.model == "gpt-4-32k"
+    assert bot.summarizer.budget == context_window("gpt-4-32k") // 2 != context_window("gpt-3.5-turbo") // 2
@@ -0,0 +1,65 @@
+import threading
+import pytest
+from builderbot.run_manager import RunManager
+
+
+def test_concurrent_managers_get_different_runs(tmp_path, monkeypatch):
+    # every manager has its own connection, like separate processes
+    monkeypatch.chdir(tmp_path)
+    managers = [RunManager() for _ in range(8)]
+    barrier, runs = threading.Barrier(len(managers)), []
+    def start(manager):
+        barrier.wait()
+        runs.append(manager.start_run())
+    threads = [threading.Thread(target=start, args=(manager,)) for manager in managers]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sorted(runs) == list(range(1, 9))
+    assert len({manager.output_dir for manager in managers}) == 8
+
+def test_forked_managers_share_the_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = RunManager()
+    manager.start_run()
+    manager.record_tokens("UNDERSTAND", 10, 5)
+    fork = manager.fork()
+    assert fork.conn is manager.conn
+    assert fork.start_run() == 2 and manager.run_no == 1
+    fork.record_tokens("UNDERSTAND", 1, 1)
+    fork.finish_run()
+    manager.finish_run()
+    assert manager.run_info(1)["tokens"]["UNDERSTAND"]["prompt_tokens"] == 10
+    assert manager.run_info(2)["tokens"]["UNDERSTAND"]["prompt_tokens"] == 1
+
+def test_runs_continue_numbering_of_legacy_runs_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "runs.txt").write_text("run_no,time\n1,2023-06-01T10-00\n2,2023-06-02T10-00\n")
+    manager = RunManager()
+    assert manager.run_no == 2
+    assert manager.start_run() == 3
+    assert manager.output_dir == "output/run_3/"
+    assert [run["run_no"] for run in RunManager().runs()] == [1, 2, 3]
+
+def test_run_metadata(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = RunManager()
+    manager.start_run()
+    manager.record_phase("UNDERSTAND", 0.0, 1.5)
+    manager.record_phase("WRITE_CODE", 1.5, 4.0, cached=True)
+    manager.record_tokens("UNDERSTAND", 100, 20)
+    manager.record_tokens("UNDERSTAND", 50, 10)
+    manager.finish_run()
+
+    info = RunManager().run_info(1)
+    assert info["status"] == "finished"
+    assert info["phases"]["WRITE_CODE"] == {"phase": "WRITE_CODE", "started_at": 1.5, "finished_at": 4.0, "cached": 1}
+    assert info["tokens"]["UNDERSTAND"] == {"phase": "UNDERSTAND", "requests": 2, "prompt_tokens": 150, "completion_tokens": 30}
+
+    manager.resume_run(1)
+    assert manager.run_info()["status"] == "running"
+    manager.record_tokens("UNDERSTAND", 10, 1)
+    manager.finish_run("failed")
+    info = manager.run_info()
+    assert info["status"] == "failed" and info["tokens"]["UNDERSTAND"]["requests"] == 3
+    with pytest.raises(ValueError):
+        manager.resume_run(7)
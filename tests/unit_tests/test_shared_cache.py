@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import threading
+import time
+from typing import List, Optional
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models.base import SimpleChatModel
+from langchain.schema import BaseMessage
+from builderbot.cache import CacheServer, MemoryBackend, RemoteBackend
+from builderbot.inference import LLMCache
+
+class SlowLLM(SimpleChatModel):
+    '''Counts its calls by appending to a file'''
+    calls_file: str
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+    ) -> str:
+        with open(self.calls_file, "a") as f: f.write("call\n")
+        time.sleep(0.5)
+        return "answer"
+
+    @property
+    def _llm_type(self) -> str:
+        return "SlowLLM"
+
+def build(cache_file: str, calls_file: str, worker: int, results):
+    llm = SlowLLM(calls_file=calls_file)
+    cache = LLMCache(llm, filename=cache_file)
+    for i in range(20):
+        cache.update([f"worker {worker} prompt {i}"], str(i))
+    results.put(cache.get_llm_result(llm, ["shared prompt"]))
+
+def count_calls(calls_file: str) -> int:
+    if not os.path.exists(calls_file): return 0
+    with open(calls_file) as f: return len(f.readlines())
+
+def test_processes_share_cache_and_send_one_request(tmp_path):
+    cache_file, calls_file = str(tmp_path / "cache.sqlite"), str(tmp_path / "calls.txt")
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=build, args=(cache_file, calls_file, w, results)) for w in range(4)]
+    for w in workers: w.start()
+    for w in workers: w.join(timeout=30)
+    assert [results.get() for _ in workers] == ["answer"] * 4
+    assert count_calls(calls_file) == 1
+    assert len(LLMCache(SlowLLM(calls_file=calls_file), filename=cache_file).backend) == 4 * 20 + 1
+
+def test_cache_server(tmp_path):
+    socket_path, calls_file = str(tmp_path / "cache.sock"), str(tmp_path / "calls.txt")
+    server = CacheServer(socket_path, MemoryBackend())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        llm = SlowLLM(calls_file=calls_file)
+        caches = [LLMCache(llm, backend=RemoteBackend(socket_path)) for _ in range(3)]
+        results = []
+        threads = [threading.Thread(target=lambda c: results.append(c.get_llm_result(llm, ["hi"])), args=(c,)) for c in caches]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert results == ["answer"] * 3
+        assert count_calls(calls_file) == 1
+        assert caches[0].backend.prompt(caches[0].to_hashable(["hi"])) == (("text", "hi"),)
+        caches[1].clear()
+        assert len(caches[0].backend) == 0
+        assert caches[0].lookup(caches[0].to_hashable(["hi"])) is None
+    finally:
+        server.shutdown()
+        server.server_close()
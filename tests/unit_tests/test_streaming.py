@@ -0,0 +1,86 @@
+import asyncio
+import time
+import pytest
+from builderbot.inference import LLMInferer
+from builderbot.parser import str_to_codebase
+from builderbot.stages import DevPhase
+from builderbot.streaming import CodeBaseStreamParser
+from builderbot.validation.format import FormatError
+
+CODE = "File: index.html\n<html>\n</html>\n--\nFile: app.js\nconst a = '--';\n--\n\nFile: style.css\nbody {}\n"
+
+def scripted(*responses: str):
+    '''Answers the i-th request with the i-th response'''
+    return lambda llm, messages: responses[llm.calls.count - 1]
+
+def parse(text: str, chunk_size: int) -> CodeBaseStreamParser:
+    parser = CodeBaseStreamParser()
+    for i in range(0, len(text), chunk_size): parser.feed(text[i:i + chunk_size])
+    parser.close()
+    return parser
+
+def test_parser_matches_str_to_codebase():
+    for text in ["File: a.py\nprint(1)\n--\nFile: b.py\n\nx = 1\n--\n", "File: a.py\nprint(1)"]:
+        for chunk_size in [1, 3, 1000]:
+            assert parse(text, chunk_size).files == str_to_codebase(text)
+    for chunk_size in [1, 3, 1000]:
+        parser = parse(CODE, chunk_size)  # blank lines between files confuse str_to_codebase
+        assert parser.files == {"index.html": "<html>\n</html>\n", "app.js": "const a = '--';\n", "style.css": "body {}\n"}
+        assert not parser.malformed
+    text = "File: a.py\nx = 1\n-- \nFile: b.py\ny = 2\n--\t\n"  # trailing whitespace after separators
+    assert parse(text, 4).files == str_to_codebase(text) == {"a.py": "x = 1\n", "b.py": "y = 2\n"}
+    parser = parse("Here's the code:\nFile: a.py\nx = 1\n--\n", 5)
+    assert parser.malformed and parser.files == {"a.py": "x = 1\n"}
+
+def test_files_are_emitted_while_streaming(tmp_path, fake_llm):
+    llm = fake_llm(respond=lambda llm, messages: CODE, chunk_size=7, delay=0.01)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"))
+    emitted = []
+    parser = CodeBaseStreamParser(on_file=lambda name, content: emitted.append((name, time.monotonic())))
+
+    start = time.monotonic()
+    response = asyncio.run(inferer.aget_streamed_response(DevPhase.WRITE_CODE, parser, verbose=False, save=False,
+        task="t", reqs="r", code_base="c"))
+    end = time.monotonic()
+
+    assert response == CODE
+    assert [name for name, _ in emitted] == ["index.html", "app.js", "style.css"]
+    assert emitted[0][1] - start < (end - start) / 2  # the first file arrives long before the last token
+    assert parser.files["app.js"] == "const a = '--';\n"
+
+    # a cached response is replayed in full
+    parser = CodeBaseStreamParser()
+    asyncio.run(inferer.aget_streamed_response(DevPhase.WRITE_CODE, parser, verbose=False, save=False,
+        task="t", reqs="r", code_base="c"))
+    assert llm.calls.count == 1
+    assert list(parser.files) == ["index.html", "app.js", "style.css"]
+
+def test_finish_after_partial_stream():
+    parser = CodeBaseStreamParser()
+    parser.feed("File: a.py\nprint(")  # eg a failed attempt
+    parser.finish("File: b.py\nx = 1\n--\n")
+    assert parser.files == {"b.py": "x = 1\n"}
+
+def test_malformed_response_is_aborted_and_repaired(tmp_path, fake_llm):
+    rambling = "Sure! Here's the code for your app.\n" + "It's going to be great.\n" * 50
+    llm = fake_llm(respond=scripted(rambling, CODE), chunk_size=10, delay=0.001)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"))
+    parser = CodeBaseStreamParser()
+
+    response = asyncio.run(inferer.aget_streamed_response(DevPhase.STRUCTURE_CODE, parser, verbose=False, save=False,
+        task="t", reqs="r"))
+
+    assert response == CODE
+    assert list(parser.files) == ["index.html", "app.js", "style.css"]
+    assert (inferer.aborts, inferer.repairs) == (1, 1)
+    assert llm.calls.streamed < len(rambling) / 10 / 2 + len(CODE) / 10 + 2  # the first response was cut short
+    repair_prompt = llm.calls.prompts[1]
+    assert repair_prompt[-2].content.startswith("Sure! Here's the code")
+    assert "expected 'File: <name>'" in repair_prompt[-1].content
+
+def test_gives_up_after_max_repairs(tmp_path, fake_llm):
+    llm = fake_llm(respond=scripted(*["Nope\n"] * 3), chunk_size=7, delay=0.01)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"))
+    with pytest.raises(FormatError):
+        asyncio.run(inferer.aget_streamed_response(DevPhase.UNDERSTAND, verbose=False, save=False, max_repairs=2, task="t"))
+    assert llm.calls.count == 3
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import pytest
+from builderbot.inference import LLMInferer
+from builderbot.rate_limit import RetryPolicy
+from builderbot.stages import DevPhase
+from builderbot.telemetry import Telemetry, tagged
+from builderbot.tokens import estimate_cost
+
+RESPONSE = "File: app.py\nprint('hi')\n--\n"
+
+def test_calls_are_recorded_with_tags(tmp_path, fake_llm):
+    llm = fake_llm(respond=lambda llm, messages: RESPONSE, model_name="gpt-4", failures=1, chunk_size=8, delay=0.01)
+    inferer = LLMInferer(llm, None, str(tmp_path / "cache.sqlite"), retry_policy=RetryPolicy(base_delay=0.01))
+    inferer.telemetry.path = str(tmp_path / "telemetry.jsonl")
+    async def run():
+        with tagged(iteration=2):
+            for _ in range(2):
+                await inferer.aget_streamed_response(DevPhase.STRUCTURE_CODE, verbose=False, save=False, task="t", reqs="r")
+        await inferer.aget_simple_response(DevPhase.STRUCTURE_CODE, verbose=False, save=False, task="t", reqs="r")
+    asyncio.run(run())
+
+    miss, hit, untagged = inferer.telemetry.records
+    assert (miss.phase, miss.step, miss.iteration, miss.model) == ("STRUCTURE_CODE", "SIMPLE", 2, "gpt-4")
+    assert not miss.cache_hit and miss.requests == 1 and miss.retries == 1
+    assert miss.prompt_tokens > 0 and miss.completion_tokens > 0
+    assert 0 < miss.time_to_first_token < miss.wall_time
+    assert miss.cost == pytest.approx(estimate_cost("gpt-4", miss.prompt_tokens, miss.completion_tokens))
+    assert hit.cache_hit and hit.iteration == 2 and hit.prompt_tokens == 0 and hit.cost == 0
+    assert untagged.cache_hit and untagged.iteration is None
+
+    inferer.telemetry.flush()
+    lines = [json.loads(line) for line in open(tmp_path / "telemetry.jsonl")]
+    assert [line["cache_hit"] for line in lines] == [False, True, True]
+
+def test_summary_table_and_prometheus():
+    telemetry = Telemetry(model="gpt-3.5-turbo")
+    for iteration, requests in [(1, 1), (1, 0), (2, 1)]:
+        with tagged(iteration=iteration), telemetry.call("WRITE_CODE", "SIMPLE", run_no=3) as call:
+            if requests: call.add_request(1000, 500)
+    with pytest.raises(ValueError):
+        with telemetry.call("UNDERSTAND", "SIMPLE", run_no=4):
+            raise ValueError("boom")
+
+    by_phase = telemetry.summary(("phase",), run_no=3)
+    assert by_phase == [pytest.approx({"phase": "WRITE_CODE", "calls": 3, "cache_hits": 1, "requests": 2, "retries": 0,
+        "repairs": 0, "errors": 0, "wall_time": by_phase[0]["wall_time"], "prompt_tokens": 2000, "completion_tokens": 1000,
+        "cost": 0.005, "hit_rate": 1 / 3, "mean_time_to_first_token": by_phase[0]["mean_time_to_first_token"]})]
+    assert telemetry.summary(("phase",), run_no=4)[0]["errors"] == 1
+
+    table = telemetry.table(run_no=3)
+    assert len(table.splitlines()) == 4 and "total" in table
+    metrics = telemetry.prometheus()
+    assert 'builderbot_llm_calls_total{phase="WRITE_CODE",step="SIMPLE",model="gpt-3.5-turbo"} 3' in metrics
+    assert "# TYPE builderbot_llm_cost_dollars_total counter" in metrics
+
+def test_estimate_cost():
+    assert estimate_cost("gpt-4-0613", 1000, 1000) == pytest.approx(0.09)
+    assert estimate_cost("gpt-3.5-turbo-16k", 1000, 0) == pytest.approx(0.003)
+    assert estimate_cost("unknown", 1000, 1000) == 0
@@ -0,0 +1,115 @@
+import os
+import sys
+import pytest
+from builderbot.validation.engine import ValidationEngine
+from builderbot.validation.linter import LinterPool, LinterTimeout, WorkerCrashed, set_linter_pool
+from builderbot.validation.syntax import (CSSValidator, HTMLValidator, JavascriptValidator, PythonValidator, VueValidator,
+    syntax_validator_from_file_type)
+
+STUB_WORKER = os.path.join(os.path.dirname(__file__), "stub_linter_worker.py")
+
+
+def test_python_fast_path_finds_syntax_errors():
+    assert PythonValidator.check_syntax("def f(x):\n    return x\n") == (True, None)
+    ok, error = PythonValidator.check_syntax("def f(x:\n    return x\n")
+    assert not ok and "SyntaxError" in error
+
+def test_html_and_css_validators():
+    assert HTMLValidator.check_syntax("<!DOCTYPE html><html><body><p>hi<br><ul><li>a<li>b</ul></body></html>")[0]
+    assert not HTMLValidator.check_syntax("<div><span>hi</div>")[0]
+    assert CSSValidator.check_syntax("/* { */ a { content: '}'; }\n")[0]
+    assert not CSSValidator.check_syntax("a { color: red;\n")[0]
+    assert syntax_validator_from_file_type("index.html") is HTMLValidator
+
+def test_engine_only_checks_changed_files(monkeypatch):
+    checked = []
+    original = PythonValidator.check_many.__func__
+    monkeypatch.setattr(PythonValidator, "check_many", classmethod(lambda cls, codes: checked.extend(codes) or original(cls, codes)))
+    engine = ValidationEngine()
+    code_base = {"a.py": "x = 1\n", "b.py": "def f(:\n", "README.md": "hi"}
+
+    report = engine.validate(code_base)
+    assert checked == ["x = 1\n", "def f(:\n"]
+    assert [f.file_name for f in report.failed] == ["b.py"] and report.unchecked == ["README.md"]
+
+    checked.clear()
+    report = engine.validate({**code_base, "b.py": "def f():\n    pass\n"})
+    assert checked == ["def f():\n    pass\n"]
+    assert report.ok and report.checked == 1
+    assert "2 files (1 checked, 1 unchanged)" in str(report)
+
+def test_engine_formats_in_process_pool():
+    engine = ValidationEngine(max_workers=2, min_parallel_batch=2)
+    code_base = {f"m{i}.py": f"x  =  {i}\n" for i in range(4)}
+    code_base["broken.py"] = "def f(:\n"
+    try:
+        engine.validate(code_base)
+        formatted = engine.format(code_base)
+    finally:
+        engine.close()
+    assert formatted["m3.py"] == "x = 3\n"
+    assert formatted["broken.py"] == "def f(:\n"
+
+def test_engine_checks_cpu_bound_validators_in_process_pool():
+    assert CSSValidator.cpu_bound and not PythonValidator.cpu_bound
+    engine = ValidationEngine(max_workers=2, min_parallel_batch=2)
+    code_base = {f"s{i}.css": f"a {{ z-index: {i}; }}\n" for i in range(3)}
+    code_base["broken.css"] = "a { color: red;\n"
+    try:
+        report = engine.validate(code_base)
+        assert engine.pool is not None
+    finally:
+        engine.close()
+    assert [f.file_name for f in report.failed] == ["broken.css"] and report.checked == 4
+
+@pytest.fixture
+def stub_pool():
+    pool = LinterPool([sys.executable, STUB_WORKER], size=2, timeout=5)
+    set_linter_pool(pool)
+    yield pool
+    set_linter_pool(None)
+
+def test_linter_pool_reuses_workers_for_batches(stub_pool):
+    files = {f"f{i}.js": "function f() {\n  return 1;\n}\n" for i in range(5)}
+    files["broken.js"] = "function f() {\n  // TODO\n"
+    diagnostics = stub_pool.lint(files)
+    assert diagnostics["f0.js"] == []
+    assert [(d.line, d.severity, d.rule) for d in diagnostics["broken.js"]] == [(2, "warning", "no-todo"), (2, "error", None)]
+    stub_pool.lint(files)
+    assert stub_pool.starts == 2
+    assert stub_pool.format({"a.js": "x;   \n"}) == {"a.js": "x;\n"}
+
+def test_linter_pool_restarts_crashed_workers(stub_pool, tmp_path):
+    assert stub_pool.lint({"a.js": f"CRASH_ONCE:{tmp_path / 'crashed'}\n"}) == {"a.js": []}
+    with pytest.raises(WorkerCrashed):
+        stub_pool.lint({"a.js": "CRASH"})
+    assert stub_pool.lint({"a.js": "}"})["a.js"][0].message == "Unexpected token }"
+
+def test_linter_pool_times_out_batches(stub_pool):
+    stub_pool.timeout = 0.5
+    with pytest.raises(LinterTimeout):
+        stub_pool.lint({"a.js": "SLEEP"})
+    assert stub_pool.lint({"a.js": "x"}) == {"a.js": []}
+
+def test_js_and_vue_validators_use_linter_pool(stub_pool):
+    assert syntax_validator_from_file_type("App.vue") is VueValidator
+    results = JavascriptValidator.check_many(["let x = {};", "let x = {;"])
+    assert results[0] == (True, None)
+    assert not results[1][0] and "Unexpected end of input" in results[1][1]
+    assert VueValidator.check_syntax("<template><div></div></template>\n") == (True, None)
+    assert not JavascriptValidator.check_syntax("CRASH")[0]
+
+def test_validators_pass_files_when_linter_is_missing():
+    set_linter_pool(LinterPool(["a-linter-which-does-not-exist"]))
+    try:
+        assert JavascriptValidator.check_syntax("let = ;") == (True, None)
+    finally:
+        set_linter_pool(None)
+
+def test_validators_pass_files_whose_parser_is_missing():
+    set_linter_pool(LinterPool([sys.executable, STUB_WORKER, "--without-vue-parser"], timeout=5))
+    try:
+        assert VueValidator.check_syntax("<template><div>{</div></template>\n") == (True, None)
+        assert not JavascriptValidator.check_syntax("let x = {;")[0]
+    finally:
+        set_linter_pool(None)